@@ -0,0 +1,74 @@
+"""
+Caches locais ao processo para dados pequenos e raramente alterados (regras
+fiscais, tabelas de referência), com invalidação entre workers.
+
+Cada cache tem um arquivo de sinal em CACHE_SIGNAL_DIR. Invalidar atualiza o
+mtime do arquivo; cada leitura compara esse mtime (um os.stat, sem acesso ao
+banco) com o registrado na última carga e recarrega se ele mudou. Todos os
+workers de um mesmo host enxergam o mesmo arquivo. Em implantações com
+vários hosts o diretório deve ser compartilhado, ou CACHE_MAX_AGE_SECONDS
+limita por quanto tempo um valor pode ficar desatualizado.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+CACHE_SIGNAL_DIR = os.getenv("CACHE_SIGNAL_DIR", os.path.join(tempfile.gettempdir(), "adastra-cache"))
+CACHE_MAX_AGE_SECONDS = float(os.getenv("CACHE_MAX_AGE_SECONDS", "300"))
+
+class SinalInvalidacao:
+    """Arquivo cujo mtime funciona como número de versão compartilhado entre processos"""
+    def __init__(self, nome, diretorio=CACHE_SIGNAL_DIR):
+        self.caminho = os.path.join(diretorio, f"{nome}.signal")
+
+    def versao(self):
+        try:
+            return os.stat(self.caminho).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def disparar(self):
+        os.makedirs(os.path.dirname(self.caminho), exist_ok=True)
+        with open(self.caminho, "a"):
+            pass
+        os.utime(self.caminho, None)
+
+class CacheLocal:
+    """
+    Valor carregado do banco sob demanda por `carregar(db)` e mantido em
+    memória até o sinal de invalidação mudar ou CACHE_MAX_AGE_SECONDS passar
+    """
+    def __init__(self, nome, carregar, max_idade=CACHE_MAX_AGE_SECONDS):
+        self.sinal = SinalInvalidacao(nome)
+        self._carregar = carregar
+        self._max_idade = max_idade
+        self._valor = None
+        self._versao = None
+        self._carregado_em = 0.0
+        self._lock = asyncio.Lock()
+
+    def _valido(self, versao):
+        return (
+            self._versao == versao
+            and time.monotonic() - self._carregado_em < self._max_idade
+        )
+
+    async def obter(self, db):
+        versao = self.sinal.versao()
+        if self._valido(versao):
+            return self._valor
+        # Uma única carga por vez; requisições simultâneas aproveitam o resultado
+        async with self._lock:
+            if not self._valido(versao):
+                # A versão é lida antes da consulta: uma invalidação concorrente
+                # força nova carga na próxima leitura
+                self._valor = await self._carregar(db)
+                self._versao = versao
+                self._carregado_em = time.monotonic()
+        return self._valor
+
+    def invalidar(self):
+        """Descarta o valor neste processo e sinaliza os demais (chamar após o commit)"""
+        self._versao = None
+        self.sinal.disparar()
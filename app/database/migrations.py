@@ -0,0 +1,226 @@
+"""
+Migrações versionadas do esquema do banco de dados.
+
+Cada migração recebe uma conexão dentro de uma transação e é registrada na
+tabela schema_migrations ao ser aplicada. As migrações são idempotentes em
+relação aos modelos: num banco novo a migração inicial já cria as tabelas com
+as colunas e índices atuais, e as migrações seguintes apenas completam o que
+estiver faltando em bancos criados por versões anteriores.
+
+Colunas e índices acrescentados a tabelas existentes são sempre nomeados
+explicitamente na migração da versão em que surgiram (os índices com as suas
+colunas): uma migração antiga nunca lê o estado atual do modelo para uma
+tabela que já existe, senão tentaria indexar colunas que só aparecem em
+migrações posteriores. No SQLite cada migração roda numa transação explícita
+(o driver faria o DDL em autocommit), então uma migração que falha não deixa
+o esquema pela metade.
+
+Uso:
+    python -m app.database.migrations
+"""
+import uuid
+from datetime import datetime
+from contextlib import contextmanager
+from sqlalchemy import Column, Index, Integer, MetaData, String, Table, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.sqlite import DATETIME as TIMESTAMP
+from app.database.database import Base, engine
+
+# Tabela de controle mantida fora de Base.metadata (não faz parte do modelo)
+controle_metadata = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    controle_metadata,
+    Column("versao", Integer, primary_key=True),
+    Column("descricao", String(255), nullable=False),
+    Column("aplicada_em", TIMESTAMP, default=datetime.utcnow),
+)
+
+MIGRACOES = []
+
+def migracao(versao, descricao):
+    """Registra uma função como a migração de número `versao`"""
+    def registrar(funcao):
+        MIGRACOES.append((versao, descricao, funcao))
+        MIGRACOES.sort(key=lambda m: m[0])
+        return funcao
+    return registrar
+
+# Funções auxiliares para migrações idempotentes
+def criar_indice(conn, tabela, nome, *colunas, unico=False):
+    """Cria o índice `nome` sobre as colunas informadas, caso ainda não exista"""
+    if nome in {indice["name"] for indice in inspect(conn).get_indexes(tabela)}:
+        return False
+    # Tabela avulsa, fora de Base.metadata: o índice não entra no modelo
+    table = Table(tabela, MetaData(), *(Column(coluna) for coluna in colunas))
+    Index(nome, *(table.c[coluna] for coluna in colunas), unique=unico).create(conn)
+    return True
+
+def adicionar_coluna(conn, tabela, coluna):
+    """Adiciona ao banco uma coluna declarada no modelo, caso ainda não exista"""
+    if coluna in {c["name"] for c in inspect(conn).get_columns(tabela)}:
+        return False
+    column = Base.metadata.tables[tabela].c[coluna]
+    tipo = column.type.compile(dialect=conn.dialect)
+    ddl = f"ALTER TABLE {tabela} ADD COLUMN {coluna} {tipo}"
+    if column.server_default is not None:
+        padrao = column.server_default.arg
+        ddl += f" DEFAULT {getattr(padrao, 'text', padrao)}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.exec_driver_sql(ddl)
+    return True
+
+def remover_indice(conn, tabela, nome):
+    """Remove um índice que deixou de ser declarado no modelo, caso exista"""
+    if nome in {indice["name"] for indice in inspect(conn).get_indexes(tabela)}:
+        conn.exec_driver_sql(f"DROP INDEX {nome}")
+
+def criar_tabelas(conn, *tabelas):
+    """Cria as tabelas do modelo (e seus índices) que ainda não existem"""
+    Base.metadata.create_all(conn, tables=[Base.metadata.tables[t] for t in tabelas])
+
+@migracao(1, "Esquema inicial")
+def _esquema_inicial(conn):
+    criar_tabelas(
+        conn,
+        "clientes", "packages", "bookings", "medical_clearance", "certifications",
+        "currencies", "payments", "taxes", "trips", "trip_bookings"
+    )
+
+@migracao(2, "Índices de chaves estrangeiras, regras fiscais e viagens por status")
+def _indices_iniciais(conn):
+    criar_indice(conn, "bookings", "ix_bookings_cliente_id", "cliente_id")
+    criar_indice(conn, "bookings", "ix_bookings_package_id", "package_id")
+    criar_indice(conn, "payments", "ix_payments_booking_id", "booking_id")
+    criar_indice(conn, "payments", "ix_payments_moeda_id", "moeda_id")
+    criar_indice(conn, "medical_clearance", "ix_medical_clearance_cliente_id", "cliente_id")
+    criar_indice(conn, "certifications", "ix_certifications_cliente_id", "cliente_id")
+    criar_indice(conn, "trips", "ix_trips_pacote_id", "pacote_id")
+    criar_indice(conn, "trips", "ix_trips_status_data_partida", "status", "data_partida")
+    criar_indice(conn, "trip_bookings", "ix_trip_bookings_reserva_id", "reserva_id")
+    criar_indice(conn, "taxes", "ix_taxes_pais_origem_pais_destino", "pais_origem", "pais_destino")
+
+@migracao(3, "Contador de assentos ocupados nas viagens")
+def _assentos_ocupados(conn):
+    from app.services.seats import stmt_recontar_assentos
+
+    adicionar_coluna(conn, "trips", "assentos_ocupados")
+    conn.execute(stmt_recontar_assentos())
+
+@migracao(4, "Índices de busca de viagens por partida (paginação por cursor)")
+def _indices_busca_viagens(conn):
+    criar_indice(conn, "trips", "ix_trips_data_partida_id", "data_partida", "id")
+    criar_indice(conn, "trips", "ix_trips_status_data_partida_id", "status", "data_partida", "id")
+    # Substituído por ix_trips_status_data_partida_id
+    remover_indice(conn, "trips", "ix_trips_status_data_partida")
+
+@migracao(5, "Retenções de assento com expiração (checkout)")
+def _retencoes_assento(conn):
+    criar_tabelas(conn, "seat_holds")
+    adicionar_coluna(conn, "trips", "assentos_retidos")
+
+@migracao(6, "Respostas registradas por Idempotency-Key")
+def _chaves_idempotencia(conn):
+    criar_tabelas(conn, "idempotency_keys")
+
+@migracao(7, "Índices de listagem de reservas e pagamentos (paginação por cursor)")
+def _indices_listagem_reservas_pagamentos(conn):
+    criar_indice(conn, "bookings", "ix_bookings_data_reserva_id", "data_reserva", "id")
+    criar_indice(conn, "bookings", "ix_bookings_cliente_id_data_reserva_id", "cliente_id", "data_reserva", "id")
+    criar_indice(conn, "bookings", "ix_bookings_package_id_data_reserva_id", "package_id", "data_reserva", "id")
+    criar_indice(conn, "bookings", "ix_bookings_status_data_reserva_id", "status", "data_reserva", "id")
+    criar_indice(conn, "payments", "ix_payments_data_pagamento_id", "data_pagamento", "id")
+    criar_indice(conn, "payments", "ix_payments_booking_id_data_pagamento_id", "booking_id", "data_pagamento", "id")
+    criar_indice(conn, "payments", "ix_payments_status_data_pagamento_id", "status", "data_pagamento", "id")
+    # Substituídos pelos índices compostos que começam pela mesma coluna
+    remover_indice(conn, "bookings", "ix_bookings_cliente_id")
+    remover_indice(conn, "bookings", "ix_bookings_package_id")
+    remover_indice(conn, "payments", "ix_payments_booking_id")
+
+@migracao(8, "Caixa de entrada das notificações do MercadoPago e referência externa dos pagamentos")
+def _notificacoes_pagamento(conn):
+    criar_tabelas(conn, "payment_notifications")
+    adicionar_coluna(conn, "payments", "metodo")
+    adicionar_coluna(conn, "payments", "referencia_externa")
+    criar_indice(conn, "payments", "ix_payments_referencia_externa", "referencia_externa", unico=True)
+
+@migracao(9, "Histórico das taxas de câmbio")
+def _historico_cambio(conn):
+    criar_tabelas(conn, "currency_rate_history")
+    # As taxas atuais abrem a linha do tempo de cada moeda
+    currencies = Base.metadata.tables["currencies"]
+    historico = Base.metadata.tables["currency_rate_history"]
+    moedas = conn.execute(select(currencies.c.id, currencies.c.taxa_cambio)).all()
+    if moedas:
+        agora = datetime.utcnow()
+        conn.execute(historico.insert(), [
+            {"id": str(uuid.uuid4()), "moeda_id": moeda_id, "taxa_cambio": taxa, "vigente_desde": agora}
+            for moeda_id, taxa in moedas
+        ])
+
+@migracao(10, "Rollups de receita por pacote e de pagamentos por moeda")
+def _rollups(conn):
+    from app.services.rollups import reconstruir
+
+    criar_tabelas(conn, "package_daily_rollup", "currency_daily_rollup")
+    reconstruir(conn)
+
+@migracao(11, "Preferências do MercadoPago por reserva")
+def _preferencias_pagamento(conn):
+    criar_tabelas(conn, "payment_preferences")
+
+@contextmanager
+def _transacao(db_engine):
+    """
+    Transação de uma migração. O pysqlite só abre transação antes de DML e
+    executa o DDL em autocommit; por isso, no SQLite, a transação é aberta
+    explicitamente (BEGIN IMMEDIATE, que também serializa os workers)
+    """
+    with db_engine.connect() as conn:
+        if conn.dialect.driver != "pysqlite":
+            with conn.begin():
+                yield conn
+            return
+        driver = conn.connection.driver_connection
+        nivel = driver.isolation_level
+        driver.isolation_level = None
+        try:
+            with conn.begin():
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            driver.isolation_level = nivel
+
+def versoes_aplicadas(conn):
+    return set(conn.execute(select(schema_migrations.c.versao)).scalars())
+
+def aplicar_migracoes(db_engine=engine):
+    """Aplica, em ordem, as migrações ainda não registradas no banco"""
+    # Importa os modelos para registrar todas as tabelas em Base.metadata
+    from app.models import models  # noqa: F401
+
+    controle_metadata.create_all(db_engine)
+    aplicadas = []
+    for versao, descricao, funcao in MIGRACOES:
+        try:
+            with _transacao(db_engine) as conn:
+                # Verificado dentro da transação: outro processo pode ter aplicado antes
+                if versao in versoes_aplicadas(conn):
+                    continue
+                funcao(conn)
+                conn.execute(schema_migrations.insert().values(
+                    versao=versao, descricao=descricao, aplicada_em=datetime.utcnow()
+                ))
+        except IntegrityError:
+            # Outro worker registrou a mesma versão em paralelo (transação desfeita)
+            continue
+        aplicadas.append(versao)
+    return aplicadas
+
+if __name__ == "__main__":
+    aplicadas = aplicar_migracoes()
+    if aplicadas:
+        print(f"Migrações aplicadas: {', '.join(map(str, aplicadas))}")
+    else:
+        print("Banco de dados já está atualizado")
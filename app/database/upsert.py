@@ -0,0 +1,31 @@
+"""
+INSERT ... ON CONFLICT DO UPDATE para o banco configurado.
+
+Cada banco tem a sua sintaxe (e o seu construtor no SQLAlchemy): SQLite e
+PostgreSQL usam ON CONFLICT (chaves) DO UPDATE com a pseudo-tabela excluded,
+MySQL usa ON DUPLICATE KEY UPDATE com os valores inseridos. O statement é
+escolhido pelo dialeto da conexão em uso, e não fixado na importação, para
+que o DATABASE_URL continue valendo para todo o código.
+"""
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+def dialeto(conn):
+    """Nome do dialeto de uma conexão ou sessão (síncrona ou assíncrona)"""
+    if hasattr(conn, "dialect"):
+        return conn.dialect.name
+    return conn.get_bind().dialect.name
+
+def stmt_upsert(nome_dialeto, tabela, chaves, atualizar):
+    """
+    INSERT em `tabela` que, se já houver linha com as mesmas `chaves`,
+    atualiza as colunas de atualizar(novos), onde `novos` dá acesso aos
+    valores que seriam inseridos (novos["coluna"])
+    """
+    if nome_dialeto in ("sqlite", "postgresql"):
+        modulo = sqlite if nome_dialeto == "sqlite" else postgresql
+        stmt = modulo.insert(tabela)
+        return stmt.on_conflict_do_update(index_elements=chaves, set_=atualizar(stmt.excluded))
+    if nome_dialeto in ("mysql", "mariadb"):
+        stmt = mysql.insert(tabela)
+        return stmt.on_duplicate_key_update(atualizar(stmt.inserted))
+    raise NotImplementedError(f"INSERT ... ON CONFLICT não suportado para o banco {nome_dialeto}")
@@ -0,0 +1,343 @@
+"""
+Suporte ao cabeçalho Idempotency-Key nos POSTs que criam reservas e
+pagamentos.
+
+O cliente envia uma chave única por operação e a repete nas novas tentativas.
+A primeira requisição com a chave registra em idempotency_keys a chave e o
+fingerprint da requisição (método, rota, query string e corpo), executa a rota
+e grava a resposta serializada. Repetições dentro de IDEMPOTENCY_TTL_SECONDS
+recebem a resposta gravada, com o cabeçalho Idempotent-Replayed, sem executar
+a rota de novo. A mesma chave com outra requisição é recusada (422).
+
+Repetições que chegam enquanto a original ainda executa aguardam o seu fim em
+vez de executar em paralelo: o registro da chave é um INSERT na chave
+primária, então só uma requisição, em qualquer worker, fica com ela. Enquanto
+a original executa, o prazo da chave é renovado a cada fração de
+PRAZO_RESERVA; a chave só fica livre de novo se o worker parar de renovar
+(interrompido no meio), nunca por a rota demorar. Quem espera mais que
+ESPERA_MAXIMA recebe 409 e não executa a rota.
+
+Respostas 5xx e exceções não são gravadas (a chave é liberada para nova
+tentativa), nem conflitos transitórios como 409 "sem vagas" (STATUS_TRANSITORIOS):
+a repetição executa de novo e pode ter outro resultado. Chaves vencidas são
+removidas em lote pelo ExpiradorChaves.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.responses import JSONResponse, Response
+
+from app.database.database import AsyncSessionLocal
+from app.models import models
+
+logger = logging.getLogger(__name__)
+
+# Rotas em que o cabeçalho é aceito
+ROTAS = {
+    ("POST", "/bookings/"),
+    ("POST", "/bookings/batch"),
+    ("POST", "/payments/"),
+}
+CABECALHO = b"idempotency-key"
+TAMANHO_MAXIMO_CHAVE = 255
+# Por quanto tempo uma resposta gravada é devolvida nas repetições
+TTL = timedelta(seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")))
+# Tempo máximo de espera de uma repetição pela requisição original em andamento
+ESPERA_MAXIMA = timedelta(seconds=30)
+# Prazo da chave de uma requisição em andamento, renovado enquanto ela executa;
+# vencido, a chave é considerada abandonada (worker interrompido)
+PRAZO_RESERVA = timedelta(seconds=30)
+# Respostas 4xx que dependem do momento (conflito de vagas, limite de taxa) e
+# por isso não são devolvidas às repetições
+STATUS_TRANSITORIOS = {408, 409, 423, 425, 429}
+# Intervalo entre consultas à chave quando a original executa em outro worker
+INTERVALO_CONSULTA = 0.05
+# Chaves removidas por transação e intervalo entre as limpezas
+TAMANHO_LOTE = 1000
+INTERVALO_LIMPEZA = 300
+
+def fingerprint(metodo, rota, query_string, corpo):
+    """SHA-256 dos dados que identificam a requisição"""
+    digest = hashlib.sha256()
+    for parte in (metodo.encode(), rota.encode(), query_string, corpo):
+        digest.update(len(parte).to_bytes(8, "big"))
+        digest.update(parte)
+    return digest.hexdigest()
+
+async def expirar_chaves(db, agora=None):
+    """Remove até TAMANHO_LOTE chaves vencidas; retorna quantas removeu"""
+    vencidas = (
+        select(models.ChaveIdempotencia.chave)
+        .where(models.ChaveIdempotencia.expira_em <= (agora or datetime.utcnow()))
+        .order_by(models.ChaveIdempotencia.expira_em)
+        .limit(TAMANHO_LOTE)
+    )
+    resultado = await db.execute(
+        delete(models.ChaveIdempotencia)
+        .where(models.ChaveIdempotencia.chave.in_(vencidas))
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount
+
+def _resposta_gravada(registro):
+    headers = [(nome.encode("latin-1"), valor.encode("latin-1")) for nome, valor in json.loads(registro.headers)]
+    headers.append((b"idempotent-replayed", b"true"))
+    resposta = Response(content=registro.corpo, status_code=registro.status_code)
+    # Os cabeçalhos gravados (inclusive content-length) substituem os padrões
+    resposta.raw_headers = headers
+    return resposta
+
+class IdempotenciaMiddleware:
+    """Middleware ASGI que aplica o Idempotency-Key nas ROTAS"""
+    def __init__(self, app, session_factory=AsyncSessionLocal, rotas=ROTAS):
+        self.app = app
+        self._session_factory = session_factory
+        self._rotas = rotas
+        # Chaves cuja requisição original executa neste processo
+        self._em_andamento = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or (scope["method"], scope["path"]) not in self._rotas:
+            await self.app(scope, receive, send)
+            return
+        chave = dict(scope["headers"]).get(CABECALHO)
+        if chave is None:
+            await self.app(scope, receive, send)
+            return
+
+        chave = chave.decode("latin-1").strip()
+        if not chave or len(chave) > TAMANHO_MAXIMO_CHAVE:
+            resposta = JSONResponse(
+                {"detail": f"Idempotency-Key deve ter entre 1 e {TAMANHO_MAXIMO_CHAVE} caracteres"},
+                status_code=400
+            )
+            await resposta(scope, receive, send)
+            return
+
+        corpo = await self._ler_corpo(receive)
+        impressao = fingerprint(scope["method"], scope["path"], scope["query_string"], corpo)
+
+        resposta = await self._reservar(chave, impressao)
+        if resposta is not None:
+            await resposta(scope, receive, send)
+            return
+
+        evento = self._em_andamento[chave] = asyncio.Event()
+        try:
+            await self._executar(scope, self._repetir_corpo(corpo, receive), send, chave)
+        finally:
+            del self._em_andamento[chave]
+            evento.set()
+
+    @staticmethod
+    async def _ler_corpo(receive):
+        partes = []
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] != "http.request":
+                break
+            partes.append(mensagem.get("body", b""))
+            if not mensagem.get("more_body", False):
+                break
+        return b"".join(partes)
+
+    @staticmethod
+    def _repetir_corpo(corpo, receive):
+        """`receive` que entrega o corpo já lido à rota e depois repassa as demais mensagens"""
+        entregue = False
+
+        async def receber():
+            nonlocal entregue
+            if not entregue:
+                entregue = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            return await receive()
+        return receber
+
+    async def _reservar(self, chave, impressao):
+        """
+        Registra a chave para esta requisição e retorna None, ou retorna a
+        resposta a enviar (gravada, conflito ou fingerprint diferente)
+        """
+        limite = datetime.utcnow() + ESPERA_MAXIMA
+        while True:
+            agora = datetime.utcnow()
+            async with self._session_factory() as db:
+                try:
+                    await db.execute(insert(models.ChaveIdempotencia).values(
+                        chave=chave,
+                        fingerprint=impressao,
+                        expira_em=agora + PRAZO_RESERVA,
+                        data_criacao=agora
+                    ))
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+
+                registro = await db.scalar(
+                    select(models.ChaveIdempotencia).filter(models.ChaveIdempotencia.chave == chave)
+                )
+                if registro is not None and registro.expira_em <= agora:
+                    # Resposta vencida ou requisição original abandonada: a chave fica livre
+                    await db.execute(
+                        delete(models.ChaveIdempotencia)
+                        .where(
+                            models.ChaveIdempotencia.chave == chave,
+                            models.ChaveIdempotencia.expira_em <= agora
+                        )
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+                    continue
+
+            if registro is None:
+                # A original falhou e liberou a chave: tentar registrá-la de novo
+                continue
+            if registro.fingerprint != impressao:
+                return JSONResponse(
+                    {"detail": "Idempotency-Key já utilizada com outra requisição"},
+                    status_code=422
+                )
+            if registro.status_code is not None:
+                return _resposta_gravada(registro)
+
+            # Requisição original em andamento: aguardar
+            restante = (limite - datetime.utcnow()).total_seconds()
+            if restante <= 0:
+                return JSONResponse(
+                    {"detail": "Requisição com esta Idempotency-Key ainda em processamento"},
+                    status_code=409
+                )
+            evento = self._em_andamento.get(chave)
+            if evento is not None:
+                try:
+                    await asyncio.wait_for(evento.wait(), timeout=restante)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await asyncio.sleep(min(INTERVALO_CONSULTA, restante))
+
+    async def _executar(self, scope, receive, send, chave):
+        inicio = {}
+        partes = []
+
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                inicio.update(mensagem)
+            elif mensagem["type"] == "http.response.body":
+                partes.append(mensagem.get("body", b""))
+            await send(mensagem)
+
+        renovacao = asyncio.create_task(self._renovar(chave))
+        try:
+            await self.app(scope, receive, enviar)
+        except BaseException:
+            await self._liberar(chave)
+            raise
+        finally:
+            renovacao.cancel()
+            try:
+                await renovacao
+            except asyncio.CancelledError:
+                pass
+
+        status_code = inicio.get("status", 500)
+        if status_code >= 500 or status_code in STATUS_TRANSITORIOS:
+            await self._liberar(chave)
+            return
+        headers = [
+            (nome.decode("latin-1"), valor.decode("latin-1"))
+            for nome, valor in inicio.get("headers", [])
+        ]
+        async with self._session_factory() as db:
+            await db.execute(
+                update(models.ChaveIdempotencia)
+                .where(models.ChaveIdempotencia.chave == chave)
+                .values(
+                    status_code=status_code,
+                    headers=json.dumps(headers),
+                    corpo=b"".join(partes),
+                    expira_em=datetime.utcnow() + TTL
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+
+    async def _renovar(self, chave):
+        """Estende o prazo da chave enquanto a requisição original executa"""
+        intervalo = PRAZO_RESERVA.total_seconds() / 3
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                async with self._session_factory() as db:
+                    await db.execute(
+                        update(models.ChaveIdempotencia)
+                        .where(
+                            models.ChaveIdempotencia.chave == chave,
+                            models.ChaveIdempotencia.status_code.is_(None)
+                        )
+                        .values(expira_em=datetime.utcnow() + PRAZO_RESERVA)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Nova tentativa no próximo intervalo, ainda dentro do prazo
+                logger.exception("Falha ao renovar a Idempotency-Key %s", chave)
+
+    async def _liberar(self, chave):
+        try:
+            async with self._session_factory() as db:
+                await db.execute(
+                    delete(models.ChaveIdempotencia)
+                    .where(models.ChaveIdempotencia.chave == chave)
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+        except Exception:
+            # A chave volta a ficar livre depois de PRAZO_RESERVA
+            logger.exception("Falha ao liberar a Idempotency-Key %s", chave)
+
+class ExpiradorChaves:
+    """Tarefa que remove periodicamente as chaves de idempotência vencidas"""
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._tarefa = None
+
+    def iniciar(self):
+        if self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._executar())
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    async def _executar(self):
+        while True:
+            try:
+                async with self._session_factory() as db:
+                    while True:
+                        removidas = await expirar_chaves(db)
+                        await db.commit()
+                        if removidas < TAMANHO_LOTE:
+                            break
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha ao remover as Idempotency-Keys vencidas")
+            await asyncio.sleep(INTERVALO_LIMPEZA)
+
+expirador_chaves = ExpiradorChaves()
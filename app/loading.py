@@ -0,0 +1,48 @@
+"""
+Carregamento antecipado dos relacionamentos exibidos pelos schemas de resposta.
+
+Cada schema que serializa relacionamentos declara em `relacionamentos` o nome
+de cada um e a estratégia de carga: JOINED (mesma consulta, para
+relacionamentos N:1) ou SELECTIN (uma consulta IN por relacionamento, para
+coleções). `opcoes_carregamento` converte essa declaração em opções do
+SQLAlchemy, descendo nos schemas aninhados que também declaram
+relacionamentos. Assim a rota executa um número fixo de consultas e nada é
+carregado sob demanda durante a serialização (o que, com AsyncSession, nem é
+possível).
+"""
+import typing
+from functools import lru_cache
+
+from sqlalchemy.orm import joinedload, selectinload
+
+JOINED = "joined"
+SELECTIN = "selectin"
+
+_ESTRATEGIAS = {JOINED: joinedload, SELECTIN: selectinload}
+
+def _schema_aninhado(anotacao):
+    """Schema dos itens de um campo (List[X], Optional[X] ou X)"""
+    argumentos = [a for a in typing.get_args(anotacao) if a is not type(None)]
+    while argumentos:
+        anotacao = argumentos[-1]
+        argumentos = [a for a in typing.get_args(anotacao) if a is not type(None)]
+    return anotacao
+
+@lru_cache(maxsize=None)
+def opcoes_carregamento(schema, modelo):
+    """Opções de carga (para `.options(...)`) dos relacionamentos declarados pelo schema"""
+    declarados = getattr(schema, "relacionamentos", {})
+    if not declarados:
+        return ()
+    anotacoes = typing.get_type_hints(schema)
+    opcoes = []
+    for nome, estrategia in declarados.items():
+        atributo = getattr(modelo, nome)
+        opcao = _ESTRATEGIAS[estrategia](atributo)
+        aninhadas = opcoes_carregamento(
+            _schema_aninhado(anotacoes[nome]), atributo.property.mapper.class_
+        )
+        if aninhadas:
+            opcao = opcao.options(*aninhadas)
+        opcoes.append(opcao)
+    return tuple(opcoes)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Float, Boolean, Date, DateTime, Enum, Text, ForeignKey, DECIMAL, Table
+from sqlalchemy import Column, String, Integer, Float, Boolean, Date, DateTime, Enum, Text, ForeignKey, DECIMAL, Table, Index, LargeBinary
 from sqlalchemy.dialects.sqlite import DATETIME as TIMESTAMP
 from sqlalchemy.orm import relationship
 import uuid
@@ -34,6 +34,11 @@ class StatusPagamento(str, enum.Enum):
     CONFIRMADO = "Confirmado"
     FALHOU = "Falhou"
 
+class StatusNotificacao(str, enum.Enum):
+    PENDENTE = "Pendente"
+    PROCESSADA = "Processada"
+    FALHOU = "Falhou"
+
 class StatusViagem(str, enum.Enum):
     AGENDADA = "Agendada"
     EM_ANDAMENTO = "Em Andamento"
@@ -47,7 +52,10 @@ viagem_reserva = Table(
     Column('viagem_id', String, ForeignKey('trips.id'), primary_key=True),
     Column('reserva_id', String, ForeignKey('bookings.id'), primary_key=True),
     Column('assento', String(20), nullable=True),
-    Column('data_associacao', TIMESTAMP, default=datetime.utcnow)
+    Column('data_associacao', TIMESTAMP, default=datetime.utcnow),
+    # A chave primária (viagem_id, reserva_id) já atende buscas por viagem;
+    # este índice atende o caminho inverso (viagens de uma reserva)
+    Index('ix_trip_bookings_reserva_id', 'reserva_id')
 )
 
 class Cliente(Base):
@@ -88,6 +96,14 @@ class Pacote(Base):
 
 class Reserva(Base):
     __tablename__ = "bookings"
+    __table_args__ = (
+        # Listagem paginada por cursor em ordem (data_reserva, id), com ou sem
+        # filtro; os índices por cliente e pacote também servem às chaves estrangeiras
+        Index("ix_bookings_data_reserva_id", "data_reserva", "id"),
+        Index("ix_bookings_cliente_id_data_reserva_id", "cliente_id", "data_reserva", "id"),
+        Index("ix_bookings_package_id_data_reserva_id", "package_id", "data_reserva", "id"),
+        Index("ix_bookings_status_data_reserva_id", "status", "data_reserva", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     cliente_id = Column(String, ForeignKey("clientes.id"), nullable=False)
@@ -109,7 +125,7 @@ class AprovacaoMedica(Base):
     __tablename__ = "medical_clearance"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    cliente_id = Column(String, ForeignKey("clientes.id"), nullable=False)
+    cliente_id = Column(String, ForeignKey("clientes.id"), nullable=False, index=True)
     aprovado = Column(Boolean, default=False)
     detalhes = Column(Text, nullable=True)
     data_verificacao = Column(TIMESTAMP, default=datetime.utcnow)
@@ -121,7 +137,7 @@ class Certificacao(Base):
     __tablename__ = "certifications"
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    cliente_id = Column(String, ForeignKey("clientes.id"), nullable=False)
+    cliente_id = Column(String, ForeignKey("clientes.id"), nullable=False, index=True)
     descricao = Column(Text, nullable=False)
     concluida = Column(Boolean, default=False)
     data_certificacao = Column(TIMESTAMP, default=datetime.utcnow)
@@ -140,15 +156,38 @@ class Moeda(Base):
     # Relacionamentos
     pagamentos = relationship("Pagamento", back_populates="moeda")
 
+class HistoricoCambio(Base):
+    """Taxa de câmbio de uma moeda a partir de um instante (somente inserções)"""
+    __tablename__ = "currency_rate_history"
+    __table_args__ = (
+        # Linha do tempo de cada moeda em ordem de vigência
+        Index("ix_currency_rate_history_moeda_id_vigente_desde", "moeda_id", "vigente_desde"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    moeda_id = Column(String, ForeignKey("currencies.id"), nullable=False)
+    taxa_cambio = Column(DECIMAL(10, 6), nullable=False)
+    vigente_desde = Column(DateTime, nullable=False, default=datetime.utcnow)
+
 class Pagamento(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        # Listagem paginada por cursor em ordem (data_pagamento, id), com ou sem filtro
+        Index("ix_payments_data_pagamento_id", "data_pagamento", "id"),
+        Index("ix_payments_booking_id_data_pagamento_id", "booking_id", "data_pagamento", "id"),
+        Index("ix_payments_status_data_pagamento_id", "status", "data_pagamento", "id"),
+        # Um pagamento por id do gateway: reprocessar a mesma notificação não duplica
+        Index("ix_payments_referencia_externa", "referencia_externa", unique=True),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     booking_id = Column(String, ForeignKey("bookings.id"), nullable=False)
     valor = Column(DECIMAL(10, 2), nullable=False)
-    moeda_id = Column(String, ForeignKey("currencies.id"), nullable=False)
+    moeda_id = Column(String, ForeignKey("currencies.id"), nullable=False, index=True)
     status = Column(Enum(StatusPagamento), default=StatusPagamento.PENDENTE)
     data_pagamento = Column(TIMESTAMP, default=datetime.utcnow)
+    metodo = Column(String(100), nullable=True)  # Ex.: "MercadoPago - pix"
+    referencia_externa = Column(String(100), nullable=True)  # Id do pagamento no gateway
 
     # Relacionamentos
     reserva = relationship("Reserva", back_populates="pagamentos")
@@ -156,6 +195,10 @@ class Pagamento(Base):
 
 class Imposto(Base):
     __tablename__ = "taxes"
+    __table_args__ = (
+        # Busca da regra fiscal em create_booking e calcular_imposto
+        Index("ix_taxes_pais_origem_pais_destino", "pais_origem", "pais_destino"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     pais_origem = Column(String(100), nullable=False)
@@ -165,14 +208,25 @@ class Imposto(Base):
 
 class Viagem(Base):
     __tablename__ = "trips"
+    __table_args__ = (
+        # Viagens em ordem de partida; o id desempata a ordem e completa a
+        # chave do cursor em /trips/search, que percorre o índice sem ordenar
+        Index("ix_trips_data_partida_id", "data_partida", "id"),
+        # O mesmo, filtrando por status (listagens e agendamentos)
+        Index("ix_trips_status_data_partida_id", "status", "data_partida", "id"),
+    )
 
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    pacote_id = Column(String, ForeignKey("packages.id"), nullable=False)  # Adicionando referência ao pacote
+    pacote_id = Column(String, ForeignKey("packages.id"), nullable=False, index=True)  # Adicionando referência ao pacote
     data_partida = Column(DateTime, nullable=False)
     duracao_horas = Column(Integer, nullable=False)
     descricao = Column(Text, nullable=True)
     status = Column(Enum(StatusViagem), default=StatusViagem.AGENDADA)
     capacidade = Column(Integer, default=1)  # Número máximo de passageiros
+    # Contador desnormalizado de reservas associadas (ver app/services/seats.py)
+    assentos_ocupados = Column(Integer, nullable=False, default=0, server_default="0")
+    # Contador de retenções de assento ativas (ver app/services/seat_holds.py)
+    assentos_retidos = Column(Integer, nullable=False, default=0, server_default="0")
     data_criacao = Column(TIMESTAMP, default=datetime.utcnow)
     data_atualizacao = Column(TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -188,9 +242,107 @@ class Viagem(Base):
     @property
     def numero_passageiros(self):
         """Retorna o número atual de passageiros (reservas)"""
-        return len(self.reservas)
+        return self.assentos_ocupados or 0
     
     @property
     def vagas_disponiveis(self):
-        """Retorna o número de vagas disponíveis"""
-        return max(0, self.capacidade - self.numero_passageiros)
\ No newline at end of file
+        """Retorna o número de vagas disponíveis (descontando as retidas em checkout)"""
+        return max(0, self.capacidade - self.numero_passageiros - (self.assentos_retidos or 0))
+
+class RetencaoAssento(Base):
+    """Vaga de uma viagem retida para uma reserva até o pagamento ou a expiração"""
+    __tablename__ = "seat_holds"
+    __table_args__ = (
+        # Expiração em ordem de prazo, sem varrer a tabela
+        Index("ix_seat_holds_expira_em", "expira_em"),
+        Index("ix_seat_holds_viagem_id_expira_em", "viagem_id", "expira_em"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    viagem_id = Column(String, ForeignKey("trips.id"), nullable=False)
+    # Uma retenção por reserva
+    reserva_id = Column(String, ForeignKey("bookings.id"), nullable=False, unique=True)
+    expira_em = Column(DateTime, nullable=False)
+    data_criacao = Column(TIMESTAMP, default=datetime.utcnow)
+
+class ChaveIdempotencia(Base):
+    """Resposta registrada para uma Idempotency-Key (ver app/idempotency.py)"""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        # Remoção das chaves vencidas em lote, sem varrer a tabela
+        Index("ix_idempotency_keys_expira_em", "expira_em"),
+    )
+
+    chave = Column(String(255), primary_key=True)
+    # SHA-256 do método, rota, query string e corpo da requisição original
+    fingerprint = Column(String(64), nullable=False)
+    # Nulos enquanto a requisição original está em andamento
+    status_code = Column(Integer)
+    headers = Column(Text)
+    corpo = Column(LargeBinary)
+    expira_em = Column(DateTime, nullable=False)
+    data_criacao = Column(TIMESTAMP, default=datetime.utcnow)
+
+class RollupPacoteDia(Base):
+    """Reservas e receita confirmada de um pacote num dia (ver app/services/rollups.py)"""
+    __tablename__ = "package_daily_rollup"
+    __table_args__ = (
+        # Relatórios por período, de todos os pacotes, já na ordem da resposta
+        Index("ix_package_daily_rollup_dia_package_id", "dia", "package_id"),
+    )
+
+    package_id = Column(String, ForeignKey("packages.id"), primary_key=True)
+    dia = Column(Date, primary_key=True)
+    # Reservas criadas no dia (data_reserva) e a soma de valor_total (USD)
+    reservas = Column(Integer, nullable=False, default=0)
+    valor_reservado = Column(DECIMAL(16, 2), nullable=False, default=0)
+    # Pagamentos confirmados no dia (data_pagamento), convertidos para USD
+    pagamentos_confirmados = Column(Integer, nullable=False, default=0)
+    receita_usd = Column(DECIMAL(18, 6), nullable=False, default=0)
+
+class RollupMoedaDia(Base):
+    """Pagamentos de um dia por moeda e status (ver app/services/rollups.py)"""
+    __tablename__ = "currency_daily_rollup"
+
+    dia = Column(Date, primary_key=True)
+    moeda_id = Column(String, ForeignKey("currencies.id"), primary_key=True)
+    status = Column(Enum(StatusPagamento), primary_key=True)
+    pagamentos = Column(Integer, nullable=False, default=0)
+    valor = Column(DECIMAL(16, 2), nullable=False, default=0)
+    valor_usd = Column(DECIMAL(18, 6), nullable=False, default=0)
+
+class NotificacaoPagamento(Base):
+    """Notificação do gateway de pagamento recebida pelo webhook, a processar"""
+    __tablename__ = "payment_notifications"
+    __table_args__ = (
+        # Notificações vencidas em ordem de prazo, sem varrer a tabela
+        Index("ix_payment_notifications_status_proxima_tentativa", "status", "proxima_tentativa"),
+    )
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    # Uma linha por pagamento do gateway: notificações repetidas são agrupadas
+    payment_id = Column(String(100), nullable=False, unique=True)
+    tipo = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    status = Column(Enum(StatusNotificacao), nullable=False, default=StatusNotificacao.PENDENTE)
+    # Incrementada a cada notificação recebida para o mesmo pagamento
+    versao = Column(Integer, nullable=False, default=1)
+    tentativas = Column(Integer, nullable=False, default=0)
+    proxima_tentativa = Column(DateTime, nullable=False)
+    ultimo_erro = Column(Text, nullable=True)
+    data_recebimento = Column(TIMESTAMP, default=datetime.utcnow)
+    data_processamento = Column(DateTime, nullable=True)
+
+class PreferenciaPagamento(Base):
+    """Última preferência do MercadoPago criada para uma reserva (checkout)"""
+    __tablename__ = "payment_preferences"
+
+    booking_id = Column(String, ForeignKey("bookings.id"), primary_key=True)
+    preference_id = Column(String(100), nullable=False)
+    init_point = Column(Text, nullable=False)
+    sandbox_init_point = Column(Text, nullable=False)
+    # Dados com que a preferência foi criada: mudou algum, cria-se outra
+    valor_total = Column(DECIMAL(10, 2), nullable=False)
+    pacote_nome = Column(String(255), nullable=False)
+    expira_em = Column(DateTime, nullable=False)
+    data_criacao = Column(TIMESTAMP, default=datetime.utcnow)
@@ -0,0 +1,42 @@
+"""
+Paginação por cursor (keyset).
+
+O cursor é opaco para o cliente: codifica os valores da chave de ordenação do
+último item da página (ex.: data de partida e id). A página seguinte filtra
+por "chave > cursor" e usa o mesmo índice da ordenação, então o custo não
+cresce com a posição da página, ao contrário de OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+
+class CursorInvalido(ValueError):
+    pass
+
+def codificar_cursor(*valores) -> str:
+    dados = json.dumps(
+        [v.isoformat() if isinstance(v, datetime) else v for v in valores],
+        separators=(",", ":")
+    )
+    return base64.urlsafe_b64encode(dados.encode()).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str, quantidade: int) -> list:
+    """Decodifica um cursor com `quantidade` valores (datas vêm em ISO 8601)"""
+    try:
+        dados = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        valores = json.loads(dados)
+    except ValueError as e:
+        raise CursorInvalido("Cursor inválido") from e
+    if not isinstance(valores, list) or len(valores) != quantidade:
+        raise CursorInvalido("Cursor inválido")
+    return valores
+
+def montar_pagina(linhas, limit, chave):
+    """
+    Recebe até limit + 1 linhas (a linha extra indica que há próxima página) e
+    devolve os itens da página e o cursor da próxima, ou None na última
+    """
+    itens = linhas[:limit]
+    if len(linhas) <= limit:
+        return itens, None
+    return itens, codificar_cursor(*chave(itens[-1]))
@@ -1,19 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.database.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database.database import get_async_db
+from app.loading import opcoes_carregamento
 from app.models import models
+from app.pagination import CursorInvalido, decodificar_cursor, montar_pagina
 from app.schemas import schemas
+from app.services import rollups, seat_holds, tax_rules
+from datetime import datetime
 
 router = APIRouter(
     prefix="/bookings",
     tags=["bookings"]
 )
 
+# Máximo de reservas por requisição em POST /bookings/batch
+MAX_ITENS_LOTE = 500
+
+def _motivo_cliente_inelegivel(cliente):
+    """Motivo pelo qual o cliente não pode reservar, ou None"""
+    # 1. Verificar se o cliente tem aprovação médica
+    if cliente.status_medico != models.StatusMedico.APROVADO:
+        return "Cliente não possui aprovação médica para realizar viagens espaciais"
+    # 2. Verificar se o cliente completou as certificações necessárias
+    if cliente.certificacao_status != models.CertificacaoStatus.CONCLUIDA:
+        return "Cliente não completou todas as certificações necessárias"
+    return None
+
 @router.post("/", response_model=schemas.ReservaResponse, status_code=status.HTTP_201_CREATED)
-def create_booking(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)):
+async def create_booking(reserva: schemas.ReservaCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == reserva.cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == reserva.cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -21,7 +39,7 @@ def create_booking(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)
         )
     
     # Verificar se o pacote existe
-    pacote = db.query(models.Pacote).filter(models.Pacote.id == reserva.package_id).first()
+    pacote = await db.scalar(select(models.Pacote).filter(models.Pacote.id == reserva.package_id))
     if not pacote:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -35,38 +53,43 @@ def create_booking(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)
             detail="Pacote não está disponível"
         )
     
-    # 1. Verificar se o cliente tem aprovação médica
-    if cliente.status_medico != models.StatusMedico.APROVADO:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cliente não possui aprovação médica para realizar viagens espaciais"
-        )
+    # Verificar a viagem em que a vaga será retida, se informada
+    if reserva.viagem_id:
+        viagem = await db.scalar(select(models.Viagem).filter(models.Viagem.id == reserva.viagem_id))
+        if not viagem:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Viagem não encontrada"
+            )
+        motivo = seat_holds.motivo_viagem_sem_retencao(viagem)
+        if motivo:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=motivo
+            )
+        if viagem.pacote_id != reserva.package_id:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="O pacote da reserva deve ser o mesmo da viagem"
+            )
     
-    # 2. Verificar se o cliente completou as certificações necessárias
-    if cliente.certificacao_status != models.CertificacaoStatus.CONCLUIDA:
+    # Verificar aprovação médica e certificações do cliente
+    motivo = _motivo_cliente_inelegivel(cliente)
+    if motivo:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Cliente não completou todas as certificações necessárias"
+            detail=motivo
         )
     
     # 3. Calcular o valor da reserva considerando o imposto do país do cliente
     valor_original = float(pacote.preco)
     
-    # Buscar regra fiscal para o país do cliente
-    regra_fiscal = db.query(models.Imposto).filter(
-        models.Imposto.pais_origem == cliente.pais,
-        models.Imposto.pais_destino == "Espaço"
-    ).first()
-    
-    # Se não existir regra específica, aplicar taxa padrão de 5%
-    if not regra_fiscal:
-        percentual_imposto = 5.0
-    else:
-        percentual_imposto = float(regra_fiscal.percentual)
+    # Buscar regra fiscal para o país do cliente (em memória, ver app/services/tax_rules.py).
+    # Se não existir regra específica, aplica a taxa padrão de 5%
+    percentual_imposto = await tax_rules.percentual_imposto(db, cliente.pais)
     
     # Calcular valor do imposto e valor total
-    valor_imposto = valor_original * (percentual_imposto / 100)
-    valor_total = valor_original + valor_imposto
+    (valor_imposto,), (valor_total,) = tax_rules.calcular_valores([valor_original], [percentual_imposto])
     
     # Criar a reserva com os valores calculados
     db_reserva = models.Reserva(
@@ -78,18 +101,169 @@ def create_booking(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)
     )
     
     db.add(db_reserva)
-    db.commit()
-    db.refresh(db_reserva)
+    await db.flush()
+    
+    # Reter uma vaga na viagem até o pagamento (mesma transação da reserva)
+    if reserva.viagem_id:
+        if await seat_holds.reter_assento(db, reserva.viagem_id, db_reserva.id) is None:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Não há vagas disponíveis nesta viagem"
+            )
+    
+    await rollups.registrar_reservas(db, [db_reserva])
+    await db.commit()
+    await db.refresh(db_reserva)
     return db_reserva
 
+@router.post("/batch", response_model=List[schemas.ReservaResponse], status_code=status.HTTP_201_CREATED)
+async def create_bookings_batch(reservas: List[schemas.ReservaLoteItem], db: AsyncSession = Depends(get_async_db)):
+    """
+    Cria as reservas de um grupo numa única transação: ou todas são criadas,
+    ou nenhuma. Se algum item for recusado, a resposta (400) lista cada item
+    recusado com seu índice no corpo e o motivo
+    """
+    if len(reservas) > MAX_ITENS_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote deve ter no máximo {MAX_ITENS_LOTE} itens"
+        )
+    
+    # Uma query para os clientes e outra para os pacotes; regras fiscais em memória
+    cliente_ids = {reserva.cliente_id for reserva in reservas}
+    package_ids = {reserva.package_id for reserva in reservas}
+    clientes = {
+        cliente.id: cliente
+        for cliente in (await db.scalars(select(models.Cliente).filter(models.Cliente.id.in_(cliente_ids)))).all()
+    }
+    pacotes = {
+        pacote.id: pacote
+        for pacote in (await db.scalars(select(models.Pacote).filter(models.Pacote.id.in_(package_ids)))).all()
+    }
+    
+    erros = []
+    for indice, reserva in enumerate(reservas):
+        cliente = clientes.get(reserva.cliente_id)
+        pacote = pacotes.get(reserva.package_id)
+        if not cliente:
+            motivo = "Cliente não encontrado"
+        elif not pacote:
+            motivo = "Pacote não encontrado"
+        elif not pacote.disponibilidade:
+            motivo = "Pacote não está disponível"
+        else:
+            motivo = _motivo_cliente_inelegivel(cliente)
+        if motivo:
+            erros.append({
+                "indice": indice,
+                "cliente_id": reserva.cliente_id,
+                "package_id": reserva.package_id,
+                "detail": motivo
+            })
+    
+    if erros:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=erros
+        )
+    
+    # Valores de todas as reservas numa passada, com a mesma aritmética de create_booking
+    valores_originais = [float(pacotes[reserva.package_id].preco) for reserva in reservas]
+    percentuais = await tax_rules.percentuais_imposto(
+        db, [(clientes[reserva.cliente_id].pais, tax_rules.DESTINO_ESPACO) for reserva in reservas]
+    )
+    valores_imposto, valores_totais = tax_rules.calcular_valores(valores_originais, percentuais)
+    
+    db_reservas = [
+        models.Reserva(
+            cliente_id=reserva.cliente_id,
+            package_id=reserva.package_id,
+            assento=reserva.assento,
+            valor_original=valor_original,
+            valor_imposto=valor_imposto,
+            valor_total=valor_total
+        )
+        for reserva, valor_original, valor_imposto, valor_total
+        in zip(reservas, valores_originais, valores_imposto, valores_totais)
+    ]
+    
+    # Um INSERT de várias linhas, um comando para os rollups, um commit
+    db.add_all(db_reservas)
+    await db.flush()
+    await rollups.registrar_reservas(db, db_reservas)
+    await db.commit()
+    
+    # Relê as reservas criadas numa única consulta (valores como gravados no banco)
+    ids = [reserva.id for reserva in db_reservas]
+    criadas = {
+        reserva.id: reserva
+        for reserva in (await db.scalars(
+            select(models.Reserva)
+            .filter(models.Reserva.id.in_(ids))
+            .execution_options(populate_existing=True)
+        )).all()
+    }
+    return [criadas[reserva_id] for reserva_id in ids]
+
 @router.get("/", response_model=List[schemas.ReservaResponse])
-def read_bookings(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    reservas = db.query(models.Reserva).offset(skip).limit(limit).all()
+async def read_bookings(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    reservas = (await db.scalars(select(models.Reserva).offset(skip).limit(limit))).all()
     return reservas
 
+# Declarada antes de /{booking_id} para que "search" não seja lido como id
+@router.get("/search", response_model=schemas.ReservaPage)
+async def search_bookings(
+    cliente_id: Optional[str] = None,
+    package_id: Optional[str] = None,
+    status_reserva: Optional[schemas.StatusReservaEnum] = Query(None, alias="status"),
+    reserva_de: Optional[datetime] = None,
+    reserva_ate: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Ordem (data_reserva, id) servida por ix_bookings_data_reserva_id ou pelo
+    # índice composto do filtro (cliente, pacote ou status): a página é lida
+    # direto do índice, sem ordenar o resultado nem pular linhas com OFFSET
+    query = select(models.Reserva).order_by(models.Reserva.data_reserva, models.Reserva.id)
+
+    if cliente_id is not None:
+        query = query.filter(models.Reserva.cliente_id == cliente_id)
+    if package_id is not None:
+        query = query.filter(models.Reserva.package_id == package_id)
+    if status_reserva is not None:
+        query = query.filter(models.Reserva.status == models.StatusReserva(status_reserva.value))
+    if reserva_de is not None:
+        query = query.filter(models.Reserva.data_reserva >= reserva_de)
+    if reserva_ate is not None:
+        query = query.filter(models.Reserva.data_reserva <= reserva_ate)
+    if cursor is not None:
+        try:
+            data_reserva, reserva_id = decodificar_cursor(cursor, 2)
+            data_reserva = datetime.fromisoformat(data_reserva)
+        except (CursorInvalido, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor inválido"
+            )
+        query = query.filter(
+            tuple_(models.Reserva.data_reserva, models.Reserva.id) > (data_reserva, reserva_id)
+        )
+
+    # Uma linha a mais indica se existe próxima página
+    reservas = (await db.scalars(query.limit(limit + 1))).all()
+    items, next_cursor = montar_pagina(reservas, limit, lambda r: (r.data_reserva, r.id))
+    return {"items": items, "next_cursor": next_cursor}
+
 @router.get("/{booking_id}", response_model=schemas.ReservaDetailResponse)
-def read_booking(booking_id: str, db: Session = Depends(get_db)):
-    db_reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
+async def read_booking(booking_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Relacionamentos exibidos em ReservaDetailResponse, como declarados no schema
+    db_reserva = await db.scalar(
+        select(models.Reserva)
+        .options(*opcoes_carregamento(schemas.ReservaDetailResponse, models.Reserva))
+        .filter(models.Reserva.id == booking_id)
+    )
     if db_reserva is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -98,8 +272,8 @@ def read_booking(booking_id: str, db: Session = Depends(get_db)):
     return db_reserva
 
 @router.put("/{booking_id}", response_model=schemas.ReservaResponse)
-def update_booking(booking_id: str, reserva: schemas.ReservaUpdate, db: Session = Depends(get_db)):
-    db_reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
+async def update_booking(booking_id: str, reserva: schemas.ReservaUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == booking_id))
     if db_reserva is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -111,20 +285,28 @@ def update_booking(booking_id: str, reserva: schemas.ReservaUpdate, db: Session
     for key, value in reserva_data.items():
         setattr(db_reserva, key, value)
     
-    db.commit()
-    db.refresh(db_reserva)
+    # Vaga retida no checkout: vira associação à viagem no pagamento e é
+    # devolvida no cancelamento
+    if reserva_data.get("status") == schemas.StatusReservaEnum.PAGO:
+        await seat_holds.converter_retencao(db, booking_id)
+    elif reserva_data.get("status") == schemas.StatusReservaEnum.CANCELADO:
+        await seat_holds.liberar_retencao(db, booking_id)
+    
+    await db.commit()
+    await db.refresh(db_reserva)
     return db_reserva
 
 @router.delete("/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_booking(booking_id: str, db: Session = Depends(get_db)):
-    db_reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
+async def delete_booking(booking_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == booking_id))
     if db_reserva is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Reserva não encontrada"
         )
     
-    # Cancelar a reserva em vez de excluí-la
+    # Cancelar a reserva em vez de excluí-la, devolvendo a vaga retida (se houver)
     db_reserva.status = models.StatusReserva.CANCELADO
-    db.commit()
+    await seat_holds.liberar_retencao(db, booking_id)
+    await db.commit()
     return None
\ No newline at end of file
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
 
@@ -11,24 +12,24 @@ router = APIRouter(
 )
 
 @router.get("/{cliente_id}", response_model=List[schemas.CertificacaoResponse])
-def get_certifications(cliente_id: str, db: Session = Depends(get_db)):
+async def get_certifications(cliente_id: str, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cliente não encontrado"
         )
     
-    certificacoes = db.query(models.Certificacao).filter(
+    certificacoes = (await db.scalars(select(models.Certificacao).filter(
         models.Certificacao.cliente_id == cliente_id
-    ).all()
+    ))).all()
     return certificacoes
 
 @router.post("/", response_model=schemas.CertificacaoResponse, status_code=status.HTTP_201_CREATED)
-def create_certification(certificacao: schemas.CertificacaoCreate, db: Session = Depends(get_db)):
+async def create_certification(certificacao: schemas.CertificacaoCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == certificacao.cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == certificacao.cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -41,9 +42,9 @@ def create_certification(certificacao: schemas.CertificacaoCreate, db: Session =
     
     # Verificar se todas as certificações estão concluídas
     if certificacao.concluida:
-        todas_certificacoes = db.query(models.Certificacao).filter(
+        todas_certificacoes = (await db.scalars(select(models.Certificacao).filter(
             models.Certificacao.cliente_id == certificacao.cliente_id
-        ).all()
+        ))).all()
         
         todas_concluidas = all(cert.concluida for cert in todas_certificacoes)
         
@@ -51,13 +52,13 @@ def create_certification(certificacao: schemas.CertificacaoCreate, db: Session =
         if todas_concluidas:
             cliente.certificacao_status = models.CertificacaoStatus.CONCLUIDA
     
-    db.commit()
-    db.refresh(db_certificacao)
+    await db.commit()
+    await db.refresh(db_certificacao)
     return db_certificacao
 
 @router.put("/{certification_id}", response_model=schemas.CertificacaoResponse)
-def update_certification(certification_id: str, certificacao: schemas.CertificacaoUpdate, db: Session = Depends(get_db)):
-    db_certificacao = db.query(models.Certificacao).filter(models.Certificacao.id == certification_id).first()
+async def update_certification(certification_id: str, certificacao: schemas.CertificacaoUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_certificacao = await db.scalar(select(models.Certificacao).filter(models.Certificacao.id == certification_id))
     if db_certificacao is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -71,10 +72,10 @@ def update_certification(certification_id: str, certificacao: schemas.Certificac
     
     # Verificar se todas as certificações estão concluídas
     if db_certificacao.concluida:
-        cliente = db.query(models.Cliente).filter(models.Cliente.id == db_certificacao.cliente_id).first()
-        todas_certificacoes = db.query(models.Certificacao).filter(
+        cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == db_certificacao.cliente_id))
+        todas_certificacoes = (await db.scalars(select(models.Certificacao).filter(
             models.Certificacao.cliente_id == db_certificacao.cliente_id
-        ).all()
+        ))).all()
         
         todas_concluidas = all(cert.concluida for cert in todas_certificacoes)
         
@@ -82,15 +83,15 @@ def update_certification(certification_id: str, certificacao: schemas.Certificac
         if todas_concluidas:
             cliente.certificacao_status = models.CertificacaoStatus.CONCLUIDA
     
-    db.commit()
-    db.refresh(db_certificacao)
+    await db.commit()
+    await db.refresh(db_certificacao)
     return db_certificacao
 
 # Rota para simular integração com serviço externo de verificação de certificado
 @router.post("/api/verifica-certificado", status_code=status.HTTP_200_OK)
-def verifica_certificado(cliente_id: str, descricao: str, db: Session = Depends(get_db)):
+async def verifica_certificado(cliente_id: str, descricao: str, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -1,34 +1,36 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
-from passlib.context import CryptContext
+from app.services import password_hashing
 
 router = APIRouter(
     prefix="/clientes",
     tags=["clientes"]
 )
 
-# Configuração para hash de senha
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 @router.post("/", response_model=schemas.ClienteResponse, status_code=status.HTTP_201_CREATED)
-def create_cliente(cliente: schemas.ClienteCreate, db: Session = Depends(get_db)):
+async def create_cliente(cliente: schemas.ClienteCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se e-mail já existe
-    db_cliente = db.query(models.Cliente).filter(models.Cliente.email == cliente.email).first()
+    db_cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.email == cliente.email))
     if db_cliente:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Email já cadastrado"
         )
     
-    # Criar cliente com senha hash
-    senha_hash = get_password_hash(cliente.senha)
+    # Criar cliente com senha hash (bcrypt roda no pool de processos, com fila limitada)
+    try:
+        senha_hash = await password_hashing.hasher.gerar_hash(cliente.senha)
+    except password_hashing.HashSaturado:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Muitos cadastros simultâneos, tente novamente em instantes",
+            headers={"Retry-After": "1"}
+        )
     db_cliente = models.Cliente(
         nome=cliente.nome,
         email=cliente.email,
@@ -41,18 +43,18 @@ def create_cliente(cliente: schemas.ClienteCreate, db: Session = Depends(get_db)
     )
     
     db.add(db_cliente)
-    db.commit()
-    db.refresh(db_cliente)
+    await db.commit()
+    await db.refresh(db_cliente)
     return db_cliente
 
 @router.get("/", response_model=List[schemas.ClienteResponse])
-def read_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    clientes = db.query(models.Cliente).offset(skip).limit(limit).all()
+async def read_clientes(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    clientes = (await db.scalars(select(models.Cliente).offset(skip).limit(limit))).all()
     return clientes
 
 @router.get("/{cliente_id}", response_model=schemas.ClienteResponse)
-def read_cliente(cliente_id: str, db: Session = Depends(get_db)):
-    db_cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+async def read_cliente(cliente_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if db_cliente is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -61,8 +63,8 @@ def read_cliente(cliente_id: str, db: Session = Depends(get_db)):
     return db_cliente
 
 @router.put("/{cliente_id}", response_model=schemas.ClienteResponse)
-def update_cliente(cliente_id: str, cliente: schemas.ClienteUpdate, db: Session = Depends(get_db)):
-    db_cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+async def update_cliente(cliente_id: str, cliente: schemas.ClienteUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if db_cliente is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -74,19 +76,19 @@ def update_cliente(cliente_id: str, cliente: schemas.ClienteUpdate, db: Session
     for key, value in cliente_data.items():
         setattr(db_cliente, key, value)
     
-    db.commit()
-    db.refresh(db_cliente)
+    await db.commit()
+    await db.refresh(db_cliente)
     return db_cliente
 
 @router.delete("/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_cliente(cliente_id: str, db: Session = Depends(get_db)):
-    db_cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+async def delete_cliente(cliente_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if db_cliente is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cliente não encontrado"
         )
     
-    db.delete(db_cliente)
-    db.commit()
+    await db.delete(db_cliente)
+    await db.commit()
     return None
\ No newline at end of file
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
+from app.services import currency_rates
 
 router = APIRouter(
     prefix="/currencies",
@@ -11,14 +13,14 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[schemas.MoedaResponse])
-def read_currencies(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    moedas = db.query(models.Moeda).offset(skip).limit(limit).all()
+async def read_currencies(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    moedas = (await db.scalars(select(models.Moeda).offset(skip).limit(limit))).all()
     return moedas
 
 @router.post("/", response_model=schemas.MoedaResponse, status_code=status.HTTP_201_CREATED)
-def create_currency(moeda: schemas.MoedaCreate, db: Session = Depends(get_db)):
+async def create_currency(moeda: schemas.MoedaCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o código da moeda já existe
-    db_moeda = db.query(models.Moeda).filter(models.Moeda.codigo == moeda.codigo).first()
+    db_moeda = await db.scalar(select(models.Moeda).filter(models.Moeda.codigo == moeda.codigo))
     if db_moeda:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -27,13 +29,17 @@ def create_currency(moeda: schemas.MoedaCreate, db: Session = Depends(get_db)):
     
     db_moeda = models.Moeda(**moeda.dict())
     db.add(db_moeda)
-    db.commit()
-    db.refresh(db_moeda)
+    await db.flush()
+    # A taxa inicial abre a linha do tempo da moeda
+    db.add(models.HistoricoCambio(moeda_id=db_moeda.id, taxa_cambio=db_moeda.taxa_cambio))
+    await db.commit()
+    currency_rates.moedas.invalidar()
+    await db.refresh(db_moeda)
     return db_moeda
 
 @router.put("/{currency_id}", response_model=schemas.MoedaResponse)
-def update_currency(currency_id: str, moeda: schemas.MoedaUpdate, db: Session = Depends(get_db)):
-    db_moeda = db.query(models.Moeda).filter(models.Moeda.id == currency_id).first()
+async def update_currency(currency_id: str, moeda: schemas.MoedaUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_moeda = await db.scalar(select(models.Moeda).filter(models.Moeda.id == currency_id))
     if db_moeda is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -45,16 +51,21 @@ def update_currency(currency_id: str, moeda: schemas.MoedaUpdate, db: Session =
     
     # Verificar se o código já existe, caso esteja sendo atualizado
     if "codigo" in moeda_data and moeda_data["codigo"] != db_moeda.codigo:
-        codigo_existente = db.query(models.Moeda).filter(models.Moeda.codigo == moeda_data["codigo"]).first()
+        codigo_existente = await db.scalar(select(models.Moeda).filter(models.Moeda.codigo == moeda_data["codigo"]))
         if codigo_existente:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Código da moeda já existe"
             )
     
+    # Nova taxa: registrada no histórico na mesma transação (a anterior é preservada)
+    if "taxa_cambio" in moeda_data and moeda_data["taxa_cambio"] != db_moeda.taxa_cambio:
+        db.add(models.HistoricoCambio(moeda_id=db_moeda.id, taxa_cambio=moeda_data["taxa_cambio"]))
+    
     for key, value in moeda_data.items():
         setattr(db_moeda, key, value)
     
-    db.commit()
-    db.refresh(db_moeda)
+    await db.commit()
+    currency_rates.moedas.invalidar()
+    await db.refresh(db_moeda)
     return db_moeda
\ No newline at end of file
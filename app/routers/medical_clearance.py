@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
 from sqlalchemy import desc
@@ -12,24 +13,24 @@ router = APIRouter(
 )
 
 @router.get("/{cliente_id}", response_model=List[schemas.AprovacaoMedicaResponse])
-def get_medical_clearance(cliente_id: str, db: Session = Depends(get_db)):
+async def get_medical_clearance(cliente_id: str, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Cliente não encontrado"
         )
     
-    aprovacoes = db.query(models.AprovacaoMedica).filter(
+    aprovacoes = (await db.scalars(select(models.AprovacaoMedica).filter(
         models.AprovacaoMedica.cliente_id == cliente_id
-    ).order_by(desc(models.AprovacaoMedica.data_verificacao)).all()
+    ).order_by(desc(models.AprovacaoMedica.data_verificacao)))).all()
     return aprovacoes
 
 @router.post("/", response_model=schemas.AprovacaoMedicaResponse, status_code=status.HTTP_201_CREATED)
-def create_medical_clearance(aprovacao: schemas.AprovacaoMedicaCreate, db: Session = Depends(get_db)):
+async def create_medical_clearance(aprovacao: schemas.AprovacaoMedicaCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == aprovacao.cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == aprovacao.cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -43,20 +44,20 @@ def create_medical_clearance(aprovacao: schemas.AprovacaoMedicaCreate, db: Sessi
     # Atualizar status médico do cliente com base na aprovação mais recente
     atualizar_status_medico(cliente, aprovacao.aprovado, db)
     
-    db.commit()
-    db.refresh(db_aprovacao)
+    await db.commit()
+    await db.refresh(db_aprovacao)
     return db_aprovacao
 
 @router.put("/{medical_clearance_id}", response_model=schemas.AprovacaoMedicaResponse)
-def update_medical_clearance(
+async def update_medical_clearance(
     medical_clearance_id: str, 
     aprovacao: schemas.AprovacaoMedicaUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     # Verificar se a aprovação médica existe
-    db_aprovacao = db.query(models.AprovacaoMedica).filter(
+    db_aprovacao = await db.scalar(select(models.AprovacaoMedica).filter(
         models.AprovacaoMedica.id == medical_clearance_id
-    ).first()
+    ))
     
     if not db_aprovacao:
         raise HTTPException(
@@ -71,14 +72,14 @@ def update_medical_clearance(
     
     # Se o status de aprovação foi alterado, atualizar o status médico do cliente
     if "aprovado" in aprovacao_data:
-        cliente = db.query(models.Cliente).filter(
+        cliente = await db.scalar(select(models.Cliente).filter(
             models.Cliente.id == db_aprovacao.cliente_id
-        ).first()
+        ))
         
         atualizar_status_medico(cliente, db_aprovacao.aprovado, db)
     
-    db.commit()
-    db.refresh(db_aprovacao)
+    await db.commit()
+    await db.refresh(db_aprovacao)
     return db_aprovacao
 
 # Função auxiliar para atualizar o status médico do cliente
@@ -91,19 +92,19 @@ def atualizar_status_medico(cliente, aprovado, db):
 
 # Nova rota para atualizar apenas o status de aprovação médica
 @router.patch("/{medical_clearance_id}/status", response_model=schemas.AprovacaoMedicaResponse)
-def update_medical_clearance_status(
+async def update_medical_clearance_status(
     medical_clearance_id: str, 
     status: schemas.AprovacaoMedicaUpdate, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Atualiza apenas o status de aprovação médica.
     Esta rota é mais específica que a rota PUT e permite atualizar apenas o status.
     """
     # Verificar se a aprovação médica existe
-    db_aprovacao = db.query(models.AprovacaoMedica).filter(
+    db_aprovacao = await db.scalar(select(models.AprovacaoMedica).filter(
         models.AprovacaoMedica.id == medical_clearance_id
-    ).first()
+    ))
     
     if not db_aprovacao:
         raise HTTPException(
@@ -126,21 +127,21 @@ def update_medical_clearance_status(
         db_aprovacao.detalhes = status.detalhes
     
     # Atualizar status médico do cliente
-    cliente = db.query(models.Cliente).filter(
+    cliente = await db.scalar(select(models.Cliente).filter(
         models.Cliente.id == db_aprovacao.cliente_id
-    ).first()
+    ))
     
     atualizar_status_medico(cliente, db_aprovacao.aprovado, db)
     
-    db.commit()
-    db.refresh(db_aprovacao)
+    await db.commit()
+    await db.refresh(db_aprovacao)
     return db_aprovacao
 
 # Rota para simular integração com serviço externo de verificação médica
 @router.post("/api/verifica-medico", status_code=status.HTTP_200_OK)
-def verifica_medico(cliente_id: str, db: Session = Depends(get_db)):
+async def verifica_medico(cliente_id: str, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o cliente existe
-    cliente = db.query(models.Cliente).filter(models.Cliente.id == cliente_id).first()
+    cliente = await db.scalar(select(models.Cliente).filter(models.Cliente.id == cliente_id))
     if not cliente:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
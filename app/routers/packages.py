@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
+from app.services import price_list
 
 router = APIRouter(
     prefix="/packages",
@@ -11,21 +13,41 @@ router = APIRouter(
 )
 
 @router.post("/", response_model=schemas.PacoteResponse, status_code=status.HTTP_201_CREATED)
-def create_package(pacote: schemas.PacoteCreate, db: Session = Depends(get_db)):
+async def create_package(pacote: schemas.PacoteCreate, db: AsyncSession = Depends(get_async_db)):
     db_pacote = models.Pacote(**pacote.dict())
     db.add(db_pacote)
-    db.commit()
-    db.refresh(db_pacote)
+    await db.commit()
+    price_list.pacotes_catalogo.invalidar()
+    await db.refresh(db_pacote)
     return db_pacote
 
 @router.get("/", response_model=List[schemas.PacoteResponse])
-def read_packages(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    pacotes = db.query(models.Pacote).offset(skip).limit(limit).all()
+async def read_packages(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    pacotes = (await db.scalars(select(models.Pacote).offset(skip).limit(limit))).all()
     return pacotes
 
+# Declarada antes de /{package_id} para que "prices" não seja lido como id
+@router.get("/prices", response_model=schemas.TabelaPrecosResponse)
+async def read_package_prices(pais: str, moeda: str, db: AsyncSession = Depends(get_async_db)):
+    """Preços de todos os pacotes com o imposto do país, convertidos para a moeda"""
+    tabela = await price_list.tabela_precos(db, pais, moeda)
+    if tabela is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Moeda não encontrada ou sem taxa de câmbio válida"
+        )
+    percentual, taxa, itens = tabela
+    return {
+        "pais": pais,
+        "moeda": moeda,
+        "percentual_imposto": percentual,
+        "taxa_cambio": taxa,
+        "itens": itens
+    }
+
 @router.get("/{package_id}", response_model=schemas.PacoteResponse)
-def read_package(package_id: str, db: Session = Depends(get_db)):
-    db_pacote = db.query(models.Pacote).filter(models.Pacote.id == package_id).first()
+async def read_package(package_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_pacote = await db.scalar(select(models.Pacote).filter(models.Pacote.id == package_id))
     if db_pacote is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -34,8 +56,8 @@ def read_package(package_id: str, db: Session = Depends(get_db)):
     return db_pacote
 
 @router.put("/{package_id}", response_model=schemas.PacoteResponse)
-def update_package(package_id: str, pacote: schemas.PacoteUpdate, db: Session = Depends(get_db)):
-    db_pacote = db.query(models.Pacote).filter(models.Pacote.id == package_id).first()
+async def update_package(package_id: str, pacote: schemas.PacoteUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_pacote = await db.scalar(select(models.Pacote).filter(models.Pacote.id == package_id))
     if db_pacote is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -47,19 +69,21 @@ def update_package(package_id: str, pacote: schemas.PacoteUpdate, db: Session =
     for key, value in pacote_data.items():
         setattr(db_pacote, key, value)
     
-    db.commit()
-    db.refresh(db_pacote)
+    await db.commit()
+    price_list.pacotes_catalogo.invalidar()
+    await db.refresh(db_pacote)
     return db_pacote
 
 @router.delete("/{package_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_package(package_id: str, db: Session = Depends(get_db)):
-    db_pacote = db.query(models.Pacote).filter(models.Pacote.id == package_id).first()
+async def delete_package(package_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_pacote = await db.scalar(select(models.Pacote).filter(models.Pacote.id == package_id))
     if db_pacote is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pacote não encontrado"
         )
     
-    db.delete(db_pacote)
-    db.commit()
-    return None
\ No newline at end of file
+    await db.delete(db_pacote)
+    await db.commit()
+    price_list.pacotes_catalogo.invalidar()
+    return None
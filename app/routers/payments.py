@@ -1,16 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List, Dict, Any
-import mercadopago
-import os
-from app.database.database import get_db
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Dict, Any, Optional
+from datetime import datetime, timedelta
+from app.database.database import get_async_db
 from app.models import models
+from app.pagination import CursorInvalido, decodificar_cursor, montar_pagina
 from app.schemas import schemas
+from app.services import currency_rates, payment_inbox, payment_preferences, payment_reports, reconciliation, rollups, seat_holds
+from app.services.payment_gateway import GatewayIndisponivel, gateway, id_pagamento_valido
 
-# Configuração do MercadoPago
-# Em produção, estas chaves devem ser armazenadas em variáveis de ambiente
-MERCADO_PAGO_ACCESS_TOKEN = os.getenv("MERCADO_PAGO_ACCESS_TOKEN", "TEST-2915071579656535-051412-4a9844add009320a3f088ee8af1a03bc-574627484")
-mp = mercadopago.SDK(MERCADO_PAGO_ACCESS_TOKEN)
+logger = logging.getLogger(__name__)
 
 router = APIRouter(
     prefix="/payments",
@@ -18,13 +20,64 @@ router = APIRouter(
 )
 
 @router.get("/", response_model=List[schemas.PagamentoResponse])
-def read_payments(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    pagamentos = db.query(models.Pagamento).offset(skip).limit(limit).all()
+async def read_payments(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    pagamentos = (await db.scalars(select(models.Pagamento).offset(skip).limit(limit))).all()
     return pagamentos
 
+# Declarada antes de /{payment_id} para que "search" não seja lido como id
+@router.get("/search", response_model=schemas.PagamentoPage)
+async def search_payments(
+    booking_id: Optional[str] = None,
+    status_pagamento: Optional[schemas.StatusPagamentoEnum] = Query(None, alias="status"),
+    pagamento_de: Optional[datetime] = None,
+    pagamento_ate: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Ordem (data_pagamento, id) servida por ix_payments_data_pagamento_id ou
+    # pelo índice composto do filtro (reserva ou status), sem OFFSET
+    query = select(models.Pagamento).order_by(models.Pagamento.data_pagamento, models.Pagamento.id)
+
+    if booking_id is not None:
+        query = query.filter(models.Pagamento.booking_id == booking_id)
+    if status_pagamento is not None:
+        query = query.filter(models.Pagamento.status == models.StatusPagamento(status_pagamento.value))
+    if pagamento_de is not None:
+        query = query.filter(models.Pagamento.data_pagamento >= pagamento_de)
+    if pagamento_ate is not None:
+        query = query.filter(models.Pagamento.data_pagamento <= pagamento_ate)
+    if cursor is not None:
+        try:
+            data_pagamento, pagamento_id = decodificar_cursor(cursor, 2)
+            data_pagamento = datetime.fromisoformat(data_pagamento)
+        except (CursorInvalido, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor inválido"
+            )
+        query = query.filter(
+            tuple_(models.Pagamento.data_pagamento, models.Pagamento.id) > (data_pagamento, pagamento_id)
+        )
+
+    # Uma linha a mais indica se existe próxima página
+    pagamentos = (await db.scalars(query.limit(limit + 1))).all()
+    items, next_cursor = montar_pagina(pagamentos, limit, lambda p: (p.data_pagamento, p.id))
+    return {"items": items, "next_cursor": next_cursor}
+
+# Declarada antes de /{payment_id} para que "totals" não seja lido como id
+@router.get("/totals", response_model=schemas.TotaisPagamentosResponse)
+async def read_payment_totals(
+    pagamento_de: Optional[datetime] = None,
+    pagamento_ate: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Totais dos pagamentos em USD, cada um convertido pela taxa vigente na data do pagamento"""
+    return await payment_reports.totais_em_usd(db, pagamento_de, pagamento_ate)
+
 @router.get("/{payment_id}", response_model=schemas.PagamentoResponse)
-def read_payment(payment_id: str, db: Session = Depends(get_db)):
-    db_pagamento = db.query(models.Pagamento).filter(models.Pagamento.id == payment_id).first()
+async def read_payment(payment_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_pagamento = await db.scalar(select(models.Pagamento).filter(models.Pagamento.id == payment_id))
     if db_pagamento is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -33,18 +86,18 @@ def read_payment(payment_id: str, db: Session = Depends(get_db)):
     return db_pagamento
 
 @router.post("/", response_model=schemas.PagamentoResponse, status_code=status.HTTP_201_CREATED)
-def create_payment(pagamento: schemas.PagamentoCreate, db: Session = Depends(get_db)):
+async def create_payment(pagamento: schemas.PagamentoCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se a reserva existe
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == pagamento.booking_id).first()
+    reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == pagamento.booking_id))
     if not reserva:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Reserva não encontrada"
         )
     
-    # Verificar se a moeda existe
-    moeda = db.query(models.Moeda).filter(models.Moeda.id == pagamento.moeda_id).first()
-    if not moeda:
+    # Verificar se a moeda existe (snapshot em memória, sem consulta ao banco)
+    moedas = await currency_rates.moedas.obter(db)
+    if pagamento.moeda_id not in moedas.por_id:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Moeda não encontrada"
@@ -52,24 +105,30 @@ def create_payment(pagamento: schemas.PagamentoCreate, db: Session = Depends(get
     
     db_pagamento = models.Pagamento(**pagamento.dict())
     db.add(db_pagamento)
+    await db.flush()
     
     # Atualizar status da reserva para "Pago" quando um pagamento for confirmado
     if db_pagamento.status == models.StatusPagamento.CONFIRMADO:
         reserva.status = models.StatusReserva.PAGO
+        await seat_holds.converter_retencao(db, reserva.id)
     
-    db.commit()
-    db.refresh(db_pagamento)
+    await rollups.registrar_pagamentos(db, [(None, rollups.estado_pagamento(db_pagamento, reserva.package_id))])
+    await db.commit()
+    await db.refresh(db_pagamento)
     return db_pagamento
 
 @router.put("/{payment_id}", response_model=schemas.PagamentoResponse)
-def update_payment(payment_id: str, pagamento: schemas.PagamentoUpdate, db: Session = Depends(get_db)):
-    db_pagamento = db.query(models.Pagamento).filter(models.Pagamento.id == payment_id).first()
+async def update_payment(payment_id: str, pagamento: schemas.PagamentoUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_pagamento = await db.scalar(select(models.Pagamento).filter(models.Pagamento.id == payment_id))
     if db_pagamento is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pagamento não encontrado"
         )
     
+    reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == db_pagamento.booking_id))
+    antes = rollups.estado_pagamento(db_pagamento, reserva.package_id)
+    
     # Atualizar status do pagamento
     pagamento_data = pagamento.dict(exclude_unset=True)
     for key, value in pagamento_data.items():
@@ -77,27 +136,41 @@ def update_payment(payment_id: str, pagamento: schemas.PagamentoUpdate, db: Sess
     
     # Se pagamento for confirmado, atualizar status da reserva
     if pagamento.status == models.StatusPagamento.CONFIRMADO:
-        reserva = db.query(models.Reserva).filter(models.Reserva.id == db_pagamento.booking_id).first()
         reserva.status = models.StatusReserva.PAGO
+        await seat_holds.converter_retencao(db, reserva.id)
     
-    db.commit()
-    db.refresh(db_pagamento)
+    await rollups.registrar_pagamentos(db, [(antes, rollups.estado_pagamento(db_pagamento, reserva.package_id))])
+    await db.commit()
+    await db.refresh(db_pagamento)
     return db_pagamento
 
+@router.post("/reconcile", response_model=schemas.ReconciliacaoResponse)
+async def reconcile_payments(
+    dry_run: bool = False,
+    limite: int = Query(1000, ge=1, le=100000),
+):
+    """
+    Consulta no MercadoPago os pagamentos pendentes (com id do gateway) e
+    aplica as mudanças de status em pagamentos e reservas. Com dry_run=true
+    apenas relata o que mudaria. Para volumes maiores use
+    `python -m app.services.reconciliation`
+    """
+    return await reconciliation.reconciliar(aplicar=not dry_run, limite=limite)
+
 # Rota para simular integração com serviço externo de pagamento
 @router.post("/api/pagamento", status_code=status.HTTP_200_OK)
-def processar_pagamento(booking_id: str, valor: float, moeda_codigo: str, db: Session = Depends(get_db)):
+async def processar_pagamento(booking_id: str, valor: float, moeda_codigo: str, db: AsyncSession = Depends(get_async_db)):
     # Verificar se a reserva existe
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
+    reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == booking_id))
     if not reserva:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Reserva não encontrada"
         )
     
-    # Verificar se a moeda existe
-    moeda = db.query(models.Moeda).filter(models.Moeda.codigo == moeda_codigo).first()
-    if not moeda:
+    # Verificar se a moeda existe (snapshot em memória, sem consulta ao banco)
+    moedas = await currency_rates.moedas.obter(db)
+    if moeda_codigo not in moedas.por_codigo:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Moeda não encontrada"
@@ -114,49 +187,50 @@ def processar_pagamento(booking_id: str, valor: float, moeda_codigo: str, db: Se
 
 # Rota para criar preferência de pagamento no MercadoPago
 @router.post("/mercadopago/create_preference", status_code=status.HTTP_200_OK)
-def criar_preferencia_mercadopago(
+async def criar_preferencia_mercadopago(
     booking_id: str, 
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    # Verificar se a reserva existe
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
-    if not reserva:
+    # Reserva, nome do pacote e preferência já criada numa única consulta
+    linha = (await db.execute(
+        select(models.Reserva.valor_total, models.Pacote.nome, models.PreferenciaPagamento)
+        .outerjoin(models.Pacote, models.Pacote.id == models.Reserva.package_id)
+        .outerjoin(models.PreferenciaPagamento, models.PreferenciaPagamento.booking_id == models.Reserva.id)
+        .filter(models.Reserva.id == booking_id)
+    )).first()
+    if not linha:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Reserva não encontrada"
         )
-    
-    # Obter informações do pacote associado à reserva
-    pacote = db.query(models.Pacote).filter(models.Pacote.id == reserva.package_id).first()
-    if not pacote:
+    valor_total, pacote_nome, preferencia = linha
+    if pacote_nome is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Pacote não encontrado"
         )
     
-    # Criando a preferência de pagamento no MercadoPago
-    preference_data = {
-        "items": [
-            {
-                "title": f"Pacote Espacial: {pacote.nome}",
-                "quantity": 1,
-                "currency_id": "BRL",  # Pode ser alterado para outras moedas suportadas
-                "unit_price": float(reserva.valor_total)
-            }
-        ],
-        "back_urls": {
-            "success": "http://localhost:8000/payments/success",
-            "failure": "http://localhost:8000/payments/failure",
-            "pending": "http://localhost:8000/payments/pending"
-        },
-        "external_reference": booking_id,
-        "notification_url": "http://localhost:8000/webhook/mercadopago"
-    }
+    # Mesmo valor, mesmo pacote e ainda válida: devolve o link guardado sem chamar o gateway
+    if payment_preferences.reaproveitavel(preferencia, valor_total, pacote_nome):
+        return {
+            "success": True,
+            "preference_id": preferencia.preference_id,
+            "init_point": preferencia.init_point,
+            "sandbox_init_point": preferencia.sandbox_init_point,
+            "cached": True
+        }
+    
+    # Criando a preferência de pagamento no MercadoPago, com validade
+    expira_em = datetime.utcnow() + timedelta(seconds=payment_preferences.TTL)
+    preference_data = payment_preferences.dados_preferencia(booking_id, pacote_nome, valor_total, expira_em)
     
-    # Removido auto_return que causava erro
+    # Encerra a transação de leitura: a conexão volta ao pool em vez de ficar
+    # presa enquanto a chamada ao gateway aguarda
+    await db.commit()
     
     try:
-        preference_response = mp.preference().create(preference_data)
+        # Cliente assíncrono com prazo, limite de concorrência e disjuntor
+        preference_response = await gateway.criar_preferencia(preference_data)
         
         # Verificar se a resposta da API foi bem-sucedida
         if "response" not in preference_response:
@@ -176,15 +250,28 @@ def criar_preferencia_mercadopago(
                 detail=f"Resposta incompleta do MercadoPago: campos ausentes: {', '.join(missing_keys)}"
             )
         
+        # Guarda a preferência para as próximas chamadas da mesma reserva
+        await payment_preferences.guardar(db, booking_id, preference, valor_total, pacote_nome, expira_em)
+        await db.commit()
+        
         # Retorna os links de pagamento e o ID da preferência
         return {
             "success": True,
             "preference_id": preference["id"],
             "init_point": preference["init_point"],
-            "sandbox_init_point": preference["sandbox_init_point"]
+            "sandbox_init_point": preference["sandbox_init_point"],
+            "cached": False
         }
+    except HTTPException:
+        # Resposta inválida ou incompleta: mantém o detalhe de cada caso
+        raise
+    except GatewayIndisponivel as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"MercadoPago indisponível, tente novamente em instantes: {str(e)}"
+        )
     except Exception as e:
-        print(f"DEBUG - Erro ao criar preferência: {str(e)}")
+        logger.exception("Erro ao criar preferência de pagamento da reserva %s", booking_id)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro ao processar pagamento com MercadoPago: {str(e)}"
@@ -192,71 +279,25 @@ def criar_preferencia_mercadopago(
 
 # Webhook para receber notificações do MercadoPago
 @router.post("/webhook/mercadopago", status_code=status.HTTP_200_OK)
-async def mercadopago_webhook(data: Dict[str, Any], db: Session = Depends(get_db)):
-    try:
-        if data["type"] == "payment":
-            payment_id = data["data"]["id"]
-            
-            # Consultar informações do pagamento no MercadoPago
-            payment_info = mp.payment().get(payment_id)
-            
-            # Verificar se a resposta tem o formato esperado
-            if not isinstance(payment_info, dict):
-                return {"status": "error", "message": "Resposta inválida do MercadoPago"}
-            
-            if "status" not in payment_info or payment_info["status"] != 200:
-                return {"status": "error", "message": "Status da resposta do MercadoPago inválido"}
-            
-            if "response" not in payment_info:
-                return {"status": "error", "message": "Resposta do MercadoPago não contém o campo 'response'"}
-                
-            payment_data = payment_info["response"]
-            
-            # Verificar campos obrigatórios no payment_data
-            required_fields = ["external_reference", "status", "transaction_amount", "payment_method_id", "currency_id"]
-            for field in required_fields:
-                if field not in payment_data:
-                    return {"status": "error", "message": f"Campo '{field}' ausente na resposta do MercadoPago"}
-            
-            external_reference = payment_data["external_reference"]  # booking_id
-            payment_status = payment_data["status"]
-                
-            # Obter a reserva pelo external_reference
-            reserva = db.query(models.Reserva).filter(models.Reserva.id == external_reference).first()
-            if reserva:
-                # Mapear status do MercadoPago para o status interno
-                status_map = {
-                    "approved": models.StatusPagamento.CONFIRMADO,
-                    "pending": models.StatusPagamento.PENDENTE,
-                    "rejected": models.StatusPagamento.RECUSADO
-                }
-                
-                # Criar o registro de pagamento no banco de dados
-                moeda = db.query(models.Moeda).filter(models.Moeda.codigo == payment_data["currency_id"]).first()
-                if not moeda:
-                    # Se a moeda não existir, use uma moeda padrão ou crie-a
-                    moeda = db.query(models.Moeda).filter(models.Moeda.codigo == "BRL").first()
-                
-                pagamento = models.Pagamento(
-                    booking_id=external_reference,
-                    moeda_id=moeda.id,
-                    valor=payment_data["transaction_amount"],
-                    metodo=f"MercadoPago - {payment_data['payment_method_id']}",
-                    status=status_map.get(payment_status, models.StatusPagamento.PENDENTE),
-                    referencia_externa=str(payment_id)
-                )
-                
-                db.add(pagamento)
-                
-                # Atualizar status da reserva se o pagamento for confirmado
-                if payment_status == "approved":
-                    reserva.status = models.StatusReserva.PAGO
-                
-                db.commit()
-                
-        return {"status": "success"}
-    except Exception as e:
-        return {
-            "status": "error",
-            "message": str(e)
-        }
\ No newline at end of file
+async def mercadopago_webhook(data: Dict[str, Any], db: AsyncSession = Depends(get_async_db)):
+    # Notificações de outros tipos (merchant_order, etc.) não são usadas
+    if data.get("type") != "payment":
+        return {"status": "ignored"}
+    
+    payment_id = (data.get("data") or {}).get("id")
+    if payment_id in (None, ""):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Notificação sem o campo data.id"
+        )
+    if not id_pagamento_valido(payment_id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Campo data.id inválido"
+        )
+    
+    # Apenas grava na caixa de entrada: a consulta ao MercadoPago e a gravação
+    # do pagamento ficam com o processador em segundo plano
+    await payment_inbox.registrar_notificacao(db, data["type"], str(payment_id), data)
+    payment_inbox.processador_notificacoes.notificar()
+    return {"status": "success"}
@@ -0,0 +1,113 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from datetime import date, datetime, timedelta
+from app.database.database import get_async_db
+from app.models import models
+from app.schemas import schemas
+from app.services import currency_rates
+
+# Relatórios lidos dos rollups (app/services/rollups.py) e dos contadores de
+# ocupação das viagens: o custo depende do período pedido, não do histórico
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"]
+)
+
+# Período padrão dos relatórios diários
+DIAS_PADRAO = 30
+
+def _periodo(de, ate):
+    ate = ate or datetime.utcnow().date()
+    de = de or ate - timedelta(days=DIAS_PADRAO)
+    if de > ate:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="A data inicial deve ser anterior à data final"
+        )
+    return de, ate
+
+@router.get("/revenue", response_model=List[schemas.ReceitaPacoteDiaResponse])
+async def read_revenue(
+    de: Optional[date] = None,
+    ate: Optional[date] = None,
+    package_id: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Reservas e receita confirmada (USD) por pacote e por dia; padrão: últimos 30 dias"""
+    de, ate = _periodo(de, ate)
+    query = (
+        select(models.RollupPacoteDia)
+        .filter(models.RollupPacoteDia.dia >= de, models.RollupPacoteDia.dia <= ate)
+        .order_by(models.RollupPacoteDia.dia, models.RollupPacoteDia.package_id)
+    )
+    if package_id is not None:
+        query = query.filter(models.RollupPacoteDia.package_id == package_id)
+    return (await db.scalars(query)).all()
+
+@router.get("/payments-by-currency", response_model=List[schemas.PagamentosMoedaResponse])
+async def read_payments_by_currency(
+    de: Optional[date] = None,
+    ate: Optional[date] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Pagamentos do período por moeda e status, no valor original e em USD; padrão: últimos 30 dias"""
+    de, ate = _periodo(de, ate)
+    rollup = models.RollupMoedaDia
+    linhas = (await db.execute(
+        select(
+            rollup.moeda_id, rollup.status,
+            func.sum(rollup.pagamentos), func.sum(rollup.valor), func.sum(rollup.valor_usd)
+        )
+        .filter(rollup.dia >= de, rollup.dia <= ate)
+        .group_by(rollup.moeda_id, rollup.status)
+    )).all()
+    # Código da moeda pelo snapshot em memória, sem JOIN com currencies
+    moedas = await currency_rates.moedas.obter(db)
+    return sorted(
+        (
+            {
+                "moeda": moedas.por_id[moeda_id].codigo if moeda_id in moedas.por_id else moeda_id,
+                "status": status_pagamento.value,
+                "pagamentos": pagamentos,
+                "valor": valor,
+                "valor_usd": valor_usd
+            }
+            for moeda_id, status_pagamento, pagamentos, valor, valor_usd in linhas
+            # Pagamentos que só mudaram de status deixam linhas zeradas
+            if pagamentos
+        ),
+        key=lambda linha: (linha["moeda"], linha["status"])
+    )
+
+@router.get("/trips/load-factor", response_model=List[schemas.OcupacaoViagemResponse])
+async def read_trips_load_factor(
+    status_viagem: Optional[schemas.StatusViagemEnum] = Query(None, alias="status"),
+    partida_de: Optional[datetime] = None,
+    partida_ate: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=500),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Ocupação das viagens em ordem de partida, a partir dos contadores de assentos"""
+    query = select(models.Viagem).order_by(models.Viagem.data_partida, models.Viagem.id).limit(limit)
+    if status_viagem is not None:
+        query = query.filter(models.Viagem.status == models.StatusViagem(status_viagem.value))
+    if partida_de is not None:
+        query = query.filter(models.Viagem.data_partida >= partida_de)
+    if partida_ate is not None:
+        query = query.filter(models.Viagem.data_partida <= partida_ate)
+    return [
+        {
+            "id": viagem.id,
+            "pacote_id": viagem.pacote_id,
+            "data_partida": viagem.data_partida,
+            "status": viagem.status.value,
+            "capacidade": viagem.capacidade,
+            "assentos_ocupados": viagem.assentos_ocupados,
+            "assentos_retidos": viagem.assentos_retidos,
+            "load_factor": viagem.assentos_ocupados / viagem.capacidade if viagem.capacidade else 0.0
+        }
+        for viagem in (await db.scalars(query)).all()
+    ]
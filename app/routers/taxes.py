@@ -1,27 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
-from app.database.database import get_db
+from app.database.database import get_async_db
 from app.models import models
 from app.schemas import schemas
+from app.services import tax_rules
 
 router = APIRouter(
     prefix="/taxes",
     tags=["taxes"]
 )
 
+# Máximo de itens por requisição em POST /taxes/api/imposto/lote
+MAX_ITENS_LOTE = 10000
+
 @router.get("/", response_model=List[schemas.ImpostoResponse])
-def read_taxes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    impostos = db.query(models.Imposto).offset(skip).limit(limit).all()
+async def read_taxes(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    impostos = (await db.scalars(select(models.Imposto).offset(skip).limit(limit))).all()
     return impostos
 
 @router.post("/", response_model=schemas.ImpostoResponse, status_code=status.HTTP_201_CREATED)
-def create_tax(imposto: schemas.ImpostoCreate, db: Session = Depends(get_db)):
+async def create_tax(imposto: schemas.ImpostoCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se já existe regra fiscal para esta combinação de países
-    db_imposto = db.query(models.Imposto).filter(
+    db_imposto = await db.scalar(select(models.Imposto).filter(
         models.Imposto.pais_origem == imposto.pais_origem,
         models.Imposto.pais_destino == imposto.pais_destino
-    ).first()
+    ))
     
     if db_imposto:
         raise HTTPException(
@@ -31,27 +36,20 @@ def create_tax(imposto: schemas.ImpostoCreate, db: Session = Depends(get_db)):
     
     db_imposto = models.Imposto(**imposto.dict())
     db.add(db_imposto)
-    db.commit()
-    db.refresh(db_imposto)
+    await db.commit()
+    # Nova regra: descartar as regras em memória de todos os workers
+    tax_rules.regras_fiscais.invalidar()
+    await db.refresh(db_imposto)
     return db_imposto
 
 # Rota para simular integração com serviço externo de impostos
 @router.post("/api/imposto", status_code=status.HTTP_200_OK)
-def calcular_imposto(pais_origem: str, pais_destino: str, valor: float, db: Session = Depends(get_db)):
-    # Buscar regra fiscal
-    regra_fiscal = db.query(models.Imposto).filter(
-        models.Imposto.pais_origem == pais_origem,
-        models.Imposto.pais_destino == pais_destino
-    ).first()
-    
-    if not regra_fiscal:
-        # Usar regra padrão se não existir específica
-        percentual = 5.0  # 5% padrão
-    else:
-        percentual = float(regra_fiscal.percentual)
+async def calcular_imposto(pais_origem: str, pais_destino: str, valor: float, db: AsyncSession = Depends(get_async_db)):
+    # Buscar regra fiscal (em memória; sem regra específica aplica o padrão de 5%)
+    percentual = await tax_rules.percentual_imposto(db, pais_origem, pais_destino)
     
     # Calcular imposto
-    valor_imposto = valor * (percentual / 100)
+    (valor_imposto,), (valor_total,) = tax_rules.calcular_valores([valor], [percentual])
     
     # Simulação de cálculo com serviço externo TaxJar/AvaTax
     # Em uma aplicação real, isso seria uma chamada para uma API externa
@@ -63,5 +61,38 @@ def calcular_imposto(pais_origem: str, pais_destino: str, valor: float, db: Sess
         "percentual": percentual,
         "valor_base": valor,
         "valor_imposto": valor_imposto,
-        "valor_total": valor + valor_imposto
+        "valor_total": valor_total
+    }
+
+@router.post("/api/imposto/lote", response_model=schemas.ImpostoCalculoLoteResponse)
+async def calcular_impostos_lote(lote: schemas.ImpostoCalculoLote, db: AsyncSession = Depends(get_async_db)):
+    """
+    Calcula o imposto de vários (pais_origem, pais_destino, valor) numa única
+    chamada, com os mesmos resultados de /api/imposto para cada item
+    """
+    if len(lote.itens) > MAX_ITENS_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote deve ter no máximo {MAX_ITENS_LOTE} itens"
+        )
+    
+    pares = [(item.pais_origem, item.pais_destino) for item in lote.itens]
+    valores = [item.valor for item in lote.itens]
+    percentuais = await tax_rules.percentuais_imposto(db, pares)
+    impostos, totais = tax_rules.calcular_valores(valores, percentuais)
+    
+    return {
+        "success": True,
+        "resultados": [
+            {
+                "origem": origem,
+                "destino": destino,
+                "percentual": percentual,
+                "valor_base": valor,
+                "valor_imposto": imposto,
+                "valor_total": total
+            }
+            for (origem, destino), valor, percentual, imposto, total
+            in zip(pares, valores, percentuais, impostos, totais)
+        ]
     }
\ No newline at end of file
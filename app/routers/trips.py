@@ -1,9 +1,16 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
-from app.database.database import get_db
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import exists, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from typing import List, Optional
+from app.database.database import get_async_db
+from app.loading import opcoes_carregamento
 from app.models import models
+from app.pagination import CursorInvalido, decodificar_cursor, montar_pagina
 from app.schemas import schemas
+from app.services import seat_holds, seats, trip_status
+from app.services.scheduler import agendador
 from datetime import datetime
 
 router = APIRouter(
@@ -11,10 +18,55 @@ router = APIRouter(
     tags=["trips"]
 )
 
+# Máximo de reservas por requisição em POST /trips/{trip_id}/bookings:bulk
+MAX_ITENS_LOTE = 500
+
+# ViagemResponse só usa colunas da própria viagem (a ocupação vem do contador
+# assentos_ocupados), então buscar a viagem custa um único SELECT
+async def _buscar_viagem(db: AsyncSession, trip_id: str):
+    return await db.scalar(
+        select(models.Viagem)
+        .filter(models.Viagem.id == trip_id)
+        .execution_options(populate_existing=True)
+    )
+
+async def _status_alterado(db: AsyncSession):
+    # O UPDATE condicional não encontrou a viagem no status verificado acima:
+    # outra requisição alterou a viagem no intervalo
+    await db.rollback()
+    raise HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="O status da viagem foi alterado por outra operação; tente novamente"
+    )
+
+async def _reserva_associada(db: AsyncSession, trip_id: str, reserva_id: str):
+    return await db.scalar(
+        select(models.viagem_reserva.c.reserva_id).filter(
+            models.viagem_reserva.c.viagem_id == trip_id,
+            models.viagem_reserva.c.reserva_id == reserva_id
+        )
+    ) is not None
+
+# Regras de associação de uma reserva a uma viagem, compartilhadas pela rota
+# individual e pela importação em lote. Retornam o motivo da recusa, ou None
+def _motivo_reserva_invalida(viagem, reserva):
+    if reserva.status != models.StatusReserva.PAGO:
+        return "Só é possível adicionar reservas com status PAGO à viagem"
+    if reserva.package_id != viagem.pacote_id:
+        return "O pacote da reserva deve ser o mesmo da viagem"
+    return None
+
+def _motivo_cliente_inapto(status_medico, certificacao_status):
+    if status_medico != models.StatusMedico.APROVADO:
+        return "O cliente não possui aprovação médica para viagens espaciais"
+    if certificacao_status != models.CertificacaoStatus.CONCLUIDA:
+        return "O cliente não completou todas as certificações necessárias"
+    return None
+
 @router.post("/", response_model=schemas.ViagemResponse, status_code=status.HTTP_201_CREATED)
-def create_trip(viagem: schemas.ViagemCreate, db: Session = Depends(get_db)):
+async def create_trip(viagem: schemas.ViagemCreate, db: AsyncSession = Depends(get_async_db)):
     # Verificar se o pacote existe
-    pacote = db.query(models.Pacote).filter(models.Pacote.id == viagem.pacote_id).first()
+    pacote = await db.scalar(select(models.Pacote).filter(models.Pacote.id == viagem.pacote_id))
     if not pacote:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -45,18 +97,78 @@ def create_trip(viagem: schemas.ViagemCreate, db: Session = Depends(get_db)):
     )
     
     db.add(db_viagem)
-    db.commit()
-    db.refresh(db_viagem)
+    await db.commit()
+    db_viagem = await _buscar_viagem(db, db_viagem.id)
+    agendador.notificar(db_viagem)
     return db_viagem
 
 @router.get("/", response_model=List[schemas.ViagemResponse])
-def read_trips(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    viagens = db.query(models.Viagem).offset(skip).limit(limit).all()
+async def read_trips(skip: int = 0, limit: int = 100, db: AsyncSession = Depends(get_async_db)):
+    # Uma única query, independente do tamanho da página
+    viagens = (await db.scalars(select(models.Viagem).offset(skip).limit(limit))).all()
     return viagens
 
+# Declarada antes de /{trip_id} para que "search" não seja lido como id
+@router.get("/search", response_model=schemas.ViagemPage)
+async def search_trips(
+    tipo: Optional[schemas.TipoPacoteEnum] = None,
+    status_viagem: Optional[schemas.StatusViagemEnum] = Query(None, alias="status"),
+    partida_de: Optional[datetime] = None,
+    partida_ate: Optional[datetime] = None,
+    vagas_minimas: int = Query(0, ge=0),
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    db: AsyncSession = Depends(get_async_db)
+):
+    # Ordem (data_partida, id) servida por ix_trips_data_partida_id ou, com
+    # filtro de status, por ix_trips_status_data_partida_id: a página é lida
+    # direto do índice, sem ordenar o resultado nem pular linhas com OFFSET
+    query = select(models.Viagem).order_by(models.Viagem.data_partida, models.Viagem.id)
+
+    if status_viagem is not None:
+        query = query.filter(models.Viagem.status == models.StatusViagem(status_viagem.value))
+    if partida_de is not None:
+        query = query.filter(models.Viagem.data_partida >= partida_de)
+    if partida_ate is not None:
+        query = query.filter(models.Viagem.data_partida <= partida_ate)
+    if vagas_minimas:
+        query = query.filter(
+            models.Viagem.capacidade - models.Viagem.assentos_ocupados - models.Viagem.assentos_retidos
+            >= vagas_minimas
+        )
+    if tipo is not None:
+        # EXISTS correlacionado (consulta pela chave primária de packages) em vez
+        # de JOIN ou IN: mantém o percurso das viagens na ordem do índice
+        query = query.filter(exists().where(
+            models.Pacote.id == models.Viagem.pacote_id,
+            models.Pacote.tipo == models.TipoPacote(tipo.value)
+        ))
+    if cursor is not None:
+        try:
+            data_partida, viagem_id = decodificar_cursor(cursor, 2)
+            data_partida = datetime.fromisoformat(data_partida)
+        except (CursorInvalido, TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cursor inválido"
+            )
+        query = query.filter(
+            tuple_(models.Viagem.data_partida, models.Viagem.id) > (data_partida, viagem_id)
+        )
+
+    # Uma linha a mais indica se existe próxima página
+    viagens = (await db.scalars(query.limit(limit + 1))).all()
+    items, next_cursor = montar_pagina(viagens, limit, lambda v: (v.data_partida, v.id))
+    return {"items": items, "next_cursor": next_cursor}
+
 @router.get("/{trip_id}", response_model=schemas.ViagemDetailResponse)
-def read_trip(trip_id: str, db: Session = Depends(get_db)):
-    db_viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+async def read_trip(trip_id: str, db: AsyncSession = Depends(get_async_db)):
+    # Relacionamentos exibidos em ViagemDetailResponse, como declarados no schema
+    db_viagem = await db.scalar(
+        select(models.Viagem)
+        .options(*opcoes_carregamento(schemas.ViagemDetailResponse, models.Viagem))
+        .filter(models.Viagem.id == trip_id)
+    )
     if db_viagem is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -65,8 +177,8 @@ def read_trip(trip_id: str, db: Session = Depends(get_db)):
     return db_viagem
 
 @router.put("/{trip_id}", response_model=schemas.ViagemResponse)
-def update_trip(trip_id: str, viagem: schemas.ViagemUpdate, db: Session = Depends(get_db)):
-    db_viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+async def update_trip(trip_id: str, viagem: schemas.ViagemUpdate, db: AsyncSession = Depends(get_async_db)):
+    db_viagem = await _buscar_viagem(db, trip_id)
     if db_viagem is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -97,23 +209,28 @@ def update_trip(trip_id: str, viagem: schemas.ViagemUpdate, db: Session = Depend
             detail="A duração da viagem deve ser maior que zero"
         )
     
-    # Validar a capacidade - não pode ser menor que o número atual de passageiros
-    if "capacidade" in viagem_data and viagem_data["capacidade"] < len(db_viagem.reservas):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="A nova capacidade não pode ser menor que o número atual de passageiros"
-        )
+    # Validar a capacidade - não pode ser menor que o número atual de passageiros.
+    # A verificação é feita no próprio UPDATE para não competir com novas associações
+    if "capacidade" in viagem_data:
+        if not await seats.alterar_capacidade(db, trip_id, viagem_data.pop("capacidade")):
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="A nova capacidade não pode ser menor que o número atual de passageiros e vagas retidas"
+            )
     
     for key, value in viagem_data.items():
         setattr(db_viagem, key, value)
     
-    db.commit()
-    db.refresh(db_viagem)
+    await db.commit()
+    db_viagem = await _buscar_viagem(db, db_viagem.id)
+    # Partida, duração ou status podem ter mudado o prazo da próxima transição
+    agendador.notificar(db_viagem)
     return db_viagem
 
 @router.delete("/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
-def cancel_trip(trip_id: str, db: Session = Depends(get_db)):
-    db_viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+async def cancel_trip(trip_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_viagem = await _buscar_viagem(db, trip_id)
     if db_viagem is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -134,21 +251,17 @@ def cancel_trip(trip_id: str, db: Session = Depends(get_db)):
             detail="Não é possível cancelar uma viagem em andamento"
         )
     
-    # Cancelar a viagem em vez de excluí-la
-    db_viagem.status = models.StatusViagem.CANCELADA
-    db.commit()
+    # Cancelar a viagem em vez de excluí-la, junto com todas as reservas
+    # associadas (UPDATE em conjunto, na mesma transação)
+    if not await trip_status.cancelar_viagem(db, trip_id):
+        await _status_alterado(db)
     
-    # Atualizar o status de todas as reservas associadas a esta viagem
-    for reserva in db_viagem.reservas:
-        reserva.status = models.StatusReserva.CANCELADO
-        db.add(reserva)
-    
-    db.commit()
+    await db.commit()
     return None
 
 @router.put("/{trip_id}/start", response_model=schemas.ViagemResponse)
-def start_trip(trip_id: str, db: Session = Depends(get_db)):
-    db_viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+async def start_trip(trip_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_viagem = await _buscar_viagem(db, trip_id)
     if db_viagem is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -163,27 +276,25 @@ def start_trip(trip_id: str, db: Session = Depends(get_db)):
         )
     
     # Verificar se há pelo menos um passageiro na viagem
-    if len(db_viagem.reservas) == 0:
+    if db_viagem.numero_passageiros == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Não é possível iniciar uma viagem sem passageiros"
         )
     
-    # Atualizar status para EM_ANDAMENTO
-    db_viagem.status = models.StatusViagem.EM_ANDAMENTO
-    
-    # Atualizar status das reservas para EMBARCADO
-    for reserva in db_viagem.reservas:
-        reserva.status = models.StatusReserva.EMBARCADO
-        db.add(reserva)
+    # Atualizar status para EM_ANDAMENTO e o das reservas para EMBARCADO
+    if not await trip_status.iniciar_viagem(db, trip_id):
+        await _status_alterado(db)
     
-    db.commit()
-    db.refresh(db_viagem)
+    await db.commit()
+    db_viagem = await _buscar_viagem(db, db_viagem.id)
+    # A conclusão passa a ser agendada para a data de retorno
+    agendador.notificar(db_viagem)
     return db_viagem
 
 @router.put("/{trip_id}/complete", response_model=schemas.ViagemResponse)
-def complete_trip(trip_id: str, db: Session = Depends(get_db)):
-    db_viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+async def complete_trip(trip_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_viagem = await _buscar_viagem(db, trip_id)
     if db_viagem is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -197,24 +308,19 @@ def complete_trip(trip_id: str, db: Session = Depends(get_db)):
             detail=f"Não é possível concluir uma viagem com status {db_viagem.status}"
         )
     
-    # Atualizar status para CONCLUIDA
-    db_viagem.status = models.StatusViagem.CONCLUIDA
+    # Atualizar status para CONCLUIDA e o das reservas para CONCLUIDO
+    if not await trip_status.concluir_viagem(db, trip_id):
+        await _status_alterado(db)
     
-    # Atualizar status das reservas para CONCLUIDO
-    for reserva in db_viagem.reservas:
-        reserva.status = models.StatusReserva.CONCLUIDO
-        db.add(reserva)
-        
-    db.commit()
-    db.refresh(db_viagem)
-    return db_viagem
+    await db.commit()
+    return await _buscar_viagem(db, db_viagem.id)
 
 @router.post("/{trip_id}/bookings", response_model=schemas.ViagemReservaResponse)
-def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate, db: Session = Depends(get_db)):
+async def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate, db: AsyncSession = Depends(get_async_db)):
     """Adiciona uma reserva existente a uma viagem"""
     
     # Verificar se a viagem existe
-    viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+    viagem = await db.scalar(select(models.Viagem).filter(models.Viagem.id == trip_id))
     if not viagem:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -222,7 +328,11 @@ def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate,
         )
     
     # Verificar se a reserva existe
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_data.reserva_id).first()
+    reserva = await db.scalar(
+        select(models.Reserva)
+        .options(selectinload(models.Reserva.cliente))
+        .filter(models.Reserva.id == booking_data.reserva_id)
+    )
     if not reserva:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -236,28 +346,22 @@ def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate,
             detail=f"Só é possível adicionar reservas a viagens com status AGENDADA, atual: {viagem.status}"
         )
     
-    # Verificar se a reserva está paga
-    if reserva.status != models.StatusReserva.PAGO:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Só é possível adicionar reservas com status PAGO à viagem"
-        )
-    
-    # Verificar se o pacote da reserva é o mesmo da viagem
-    if reserva.package_id != viagem.pacote_id:
+    # Verificar se a reserva está paga e se o pacote é o mesmo da viagem
+    motivo = _motivo_reserva_invalida(viagem, reserva)
+    if motivo:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O pacote da reserva deve ser o mesmo da viagem"
+            detail=motivo
         )
     
     # Verificar se a reserva já está associada a esta viagem
-    if reserva in viagem.reservas:
+    if await _reserva_associada(db, trip_id, reserva.id):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Esta reserva já está associada a esta viagem"
         )
     
-    # Verificar se há vagas disponíveis
+    # Verificar se há vagas disponíveis (a garantia vem do UPDATE condicional abaixo)
     if viagem.vagas_disponiveis <= 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -266,16 +370,19 @@ def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate,
     
     # Verificar se o cliente tem aprovação médica e certificações
     cliente = reserva.cliente
-    if cliente.status_medico != models.StatusMedico.APROVADO:
+    motivo = _motivo_cliente_inapto(cliente.status_medico, cliente.certificacao_status)
+    if motivo:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O cliente não possui aprovação médica para viagens espaciais"
+            detail=motivo
         )
     
-    if cliente.certificacao_status != models.CertificacaoStatus.CONCLUIDA:
+    # Ocupar a vaga atomicamente: falha se outra requisição ocupou a última vaga
+    if not await seats.ocupar_assentos(db, trip_id):
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="O cliente não completou todas as certificações necessárias"
+            detail="Não há vagas disponíveis nesta viagem"
         )
     
     # Adicionar a reserva à viagem na tabela de associação
@@ -286,14 +393,22 @@ def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate,
         data_associacao=datetime.utcnow()
     )
     
-    db.execute(statement)
-    db.commit()
+    try:
+        await db.execute(statement)
+    except IntegrityError:
+        # Associação concorrente da mesma reserva: desfaz também a vaga ocupada
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Esta reserva já está associada a esta viagem"
+        )
     
     # Atualizar o assento na reserva também
     if booking_data.assento:
         reserva.assento = booking_data.assento
         db.add(reserva)
-        db.commit()
+    
+    await db.commit()
     
     # Retornar os dados da associação
     return {
@@ -303,12 +418,124 @@ def add_booking_to_trip(trip_id: str, booking_data: schemas.ViagemReservaCreate,
         "data_associacao": datetime.utcnow()
     }
 
+@router.post("/{trip_id}/bookings:bulk", response_model=schemas.ViagemReservaLoteResponse)
+async def add_bookings_to_trip(trip_id: str, itens: List[schemas.ViagemReservaCreate], db: AsyncSession = Depends(get_async_db)):
+    """
+    Adiciona várias reservas a uma viagem (manifesto de embarque) numa única
+    transação. Os itens válidos são associados; os demais são devolvidos em
+    `erros` com o índice do item no corpo e o motivo da recusa
+    """
+    if len(itens) > MAX_ITENS_LOTE:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"O lote deve ter no máximo {MAX_ITENS_LOTE} itens"
+        )
+    
+    # Verificar se a viagem existe e permite adicionar reservas
+    viagem = await db.scalar(select(models.Viagem).filter(models.Viagem.id == trip_id))
+    if not viagem:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Viagem não encontrada"
+        )
+    if viagem.status != models.StatusViagem.AGENDADA:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Só é possível adicionar reservas a viagens com status AGENDADA, atual: {viagem.status}"
+        )
+    
+    reserva_ids = {item.reserva_id for item in itens}
+    assentos = {item.assento for item in itens if item.assento}
+    
+    # Uma query para as reservas com a situação médica e de certificação dos clientes
+    linhas = (await db.execute(
+        select(models.Reserva, models.Cliente.status_medico, models.Cliente.certificacao_status)
+        .join(models.Cliente, models.Reserva.cliente_id == models.Cliente.id)
+        .filter(models.Reserva.id.in_(reserva_ids))
+    )).all()
+    reservas = {reserva.id: (reserva, medico, certificacao) for reserva, medico, certificacao in linhas}
+    
+    # Uma query para as reservas já associadas e outra para os assentos já ocupados
+    associadas = set((await db.scalars(
+        select(models.viagem_reserva.c.reserva_id).filter(
+            models.viagem_reserva.c.viagem_id == trip_id,
+            models.viagem_reserva.c.reserva_id.in_(reserva_ids)
+        )
+    )).all())
+    assentos_ocupados = set()
+    if assentos:
+        assentos_ocupados = set((await db.scalars(
+            select(models.viagem_reserva.c.assento).filter(
+                models.viagem_reserva.c.viagem_id == trip_id,
+                models.viagem_reserva.c.assento.in_(assentos)
+            )
+        )).all())
+    
+    aceitos, erros = [], []
+    vagas = viagem.vagas_disponiveis
+    for indice, item in enumerate(itens):
+        if item.reserva_id not in reservas:
+            motivo = "Reserva não encontrada"
+        elif item.reserva_id in associadas:
+            motivo = "Esta reserva já está associada a esta viagem"
+        elif item.assento and item.assento in assentos_ocupados:
+            motivo = f"O assento {item.assento} já está ocupado nesta viagem"
+        else:
+            reserva, medico, certificacao = reservas[item.reserva_id]
+            motivo = (
+                _motivo_reserva_invalida(viagem, reserva)
+                or _motivo_cliente_inapto(medico, certificacao)
+            )
+        if motivo is None and len(aceitos) >= vagas:
+            motivo = "Não há vagas disponíveis nesta viagem"
+        
+        if motivo:
+            erros.append({"indice": indice, "reserva_id": item.reserva_id, "detail": motivo})
+            continue
+        
+        # Itens seguintes do mesmo lote não podem repetir a reserva nem o assento
+        aceitos.append(item)
+        associadas.add(item.reserva_id)
+        if item.assento:
+            assentos_ocupados.add(item.assento)
+    
+    agora = datetime.utcnow()
+    associacoes = [
+        {"viagem_id": trip_id, "reserva_id": item.reserva_id, "assento": item.assento, "data_associacao": agora}
+        for item in aceitos
+    ]
+    if associacoes:
+        # Ocupar todas as vagas do lote atomicamente (ver add_booking_to_trip)
+        if not await seats.ocupar_assentos(db, trip_id, len(associacoes)):
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="A ocupação da viagem mudou durante a importação; tente novamente"
+            )
+        try:
+            await db.execute(models.viagem_reserva.insert(), associacoes)
+        except IntegrityError:
+            await db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Uma das reservas foi associada à viagem durante a importação; tente novamente"
+            )
+        
+        # Assentos gravados também nas reservas (UPDATE em lote pela chave primária)
+        com_assento = [{"id": item.reserva_id, "assento": item.assento} for item in aceitos if item.assento]
+        if com_assento:
+            await db.execute(update(models.Reserva), com_assento)
+        
+        await db.commit()
+    
+    return {"associadas": associacoes, "erros": erros}
+
 @router.delete("/{trip_id}/bookings/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
-def remove_booking_from_trip(trip_id: str, booking_id: str, db: Session = Depends(get_db)):
+async def remove_booking_from_trip(trip_id: str, booking_id: str, db: AsyncSession = Depends(get_async_db)):
     """Remove uma reserva de uma viagem"""
     
     # Verificar se a viagem existe
-    viagem = db.query(models.Viagem).filter(models.Viagem.id == trip_id).first()
+    viagem = await db.scalar(select(models.Viagem).filter(models.Viagem.id == trip_id))
     if not viagem:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -316,7 +543,7 @@ def remove_booking_from_trip(trip_id: str, booking_id: str, db: Session = Depend
         )
     
     # Verificar se a reserva existe
-    reserva = db.query(models.Reserva).filter(models.Reserva.id == booking_id).first()
+    reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == booking_id))
     if not reserva:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -330,20 +557,105 @@ def remove_booking_from_trip(trip_id: str, booking_id: str, db: Session = Depend
             detail=f"Só é possível remover reservas de viagens com status AGENDADA, atual: {viagem.status}"
         )
     
-    # Verificar se a reserva está associada a esta viagem
-    if reserva not in viagem.reservas:
+    # Remover a reserva da viagem na tabela de associação
+    statement = models.viagem_reserva.delete().where(
+        (models.viagem_reserva.c.viagem_id == trip_id) & 
+        (models.viagem_reserva.c.reserva_id == booking_id)
+    )
+    
+    # Verificar se a reserva estava associada a esta viagem
+    if (await db.execute(statement)).rowcount == 0:
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Esta reserva não está associada a esta viagem"
         )
     
-    # Remover a reserva da viagem na tabela de associação
-    statement = models.viagem_reserva.delete().where(
-        (models.viagem_reserva.c.viagem_id == trip_id) & 
-        (models.viagem_reserva.c.reserva_id == booking_id)
+    # Liberar a vaga na mesma transação da remoção
+    await seats.liberar_assentos(db, trip_id)
+    await db.commit()
+    
+    return None
+
+@router.post("/{trip_id}/holds", response_model=schemas.RetencaoAssentoResponse, status_code=status.HTTP_201_CREATED)
+async def hold_seat(trip_id: str, retencao: schemas.RetencaoAssentoCreate, db: AsyncSession = Depends(get_async_db)):
+    """Retém uma vaga da viagem para uma reserva até o pagamento (ou a expiração)"""
+    viagem = await db.scalar(select(models.Viagem).filter(models.Viagem.id == trip_id))
+    if not viagem:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Viagem não encontrada"
+        )
+    
+    reserva = await db.scalar(select(models.Reserva).filter(models.Reserva.id == retencao.reserva_id))
+    if not reserva:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Reserva não encontrada"
+        )
+    
+    motivo = seat_holds.motivo_retencao_invalida(viagem, reserva)
+    if motivo:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=motivo
+        )
+    
+    if await _reserva_associada(db, trip_id, reserva.id):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Esta reserva já está associada a esta viagem"
+        )
+    
+    retida = await db.scalar(
+        select(models.RetencaoAssento.id).filter(models.RetencaoAssento.reserva_id == reserva.id)
     )
+    if retida is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Esta reserva já possui uma vaga retida"
+        )
     
-    db.execute(statement)
-    db.commit()
+    try:
+        db_retencao = await seat_holds.reter_assento(db, trip_id, reserva.id)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Esta reserva já possui uma vaga retida"
+        )
+    if db_retencao is None:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Não há vagas disponíveis nesta viagem"
+        )
     
-    return None
\ No newline at end of file
+    await db.commit()
+    return db_retencao
+
+@router.get("/{trip_id}/holds/{booking_id}", response_model=schemas.RetencaoAssentoResponse)
+async def read_seat_hold(trip_id: str, booking_id: str, db: AsyncSession = Depends(get_async_db)):
+    db_retencao = await db.scalar(select(models.RetencaoAssento).filter(
+        models.RetencaoAssento.viagem_id == trip_id,
+        models.RetencaoAssento.reserva_id == booking_id,
+        models.RetencaoAssento.expira_em > datetime.utcnow()
+    ))
+    if db_retencao is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Retenção não encontrada ou expirada"
+        )
+    return db_retencao
+
+@router.delete("/{trip_id}/holds/{booking_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def release_seat_hold(trip_id: str, booking_id: str, db: AsyncSession = Depends(get_async_db)):
+    """Libera a vaga retida para a reserva"""
+    if await seat_holds.liberar_retencao(db, booking_id) != trip_id:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Retenção não encontrada"
+        )
+    await db.commit()
+    return None
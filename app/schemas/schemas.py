@@ -1,8 +1,9 @@
 from pydantic import BaseModel, EmailStr, Field, validator
 from datetime import date, datetime
-from typing import Optional, List
+from typing import ClassVar, Dict, Optional, List
 from enum import Enum
 from decimal import Decimal
+from app.loading import JOINED, SELECTIN
 
 # Enums
 class StatusMedicoEnum(str, Enum):
@@ -103,6 +104,22 @@ class PacoteResponse(PacoteBase):
     class Config:
         orm_mode = True
 
+class PrecoPacote(BaseModel):
+    package_id: str
+    nome: str
+    tipo: TipoPacoteEnum
+    disponibilidade: bool
+    preco: float
+    valor_imposto: float
+    valor_total: float
+
+class TabelaPrecosResponse(BaseModel):
+    pais: str
+    moeda: str
+    percentual_imposto: float
+    taxa_cambio: float
+    itens: List[PrecoPacote]
+
 # Schemas de Reserva
 class ReservaBase(BaseModel):
     cliente_id: str
@@ -110,6 +127,10 @@ class ReservaBase(BaseModel):
     assento: Optional[str] = None
 
 class ReservaCreate(ReservaBase):
+    # Viagem em que uma vaga fica retida até o pagamento (opcional)
+    viagem_id: Optional[str] = None
+
+class ReservaLoteItem(ReservaBase):
     pass
 
 class ReservaUpdate(BaseModel):
@@ -136,12 +157,24 @@ class ReservaResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class ReservaPage(BaseModel):
+    items: List[ReservaResponse]
+    next_cursor: Optional[str] = None
+
 class ReservaDetailResponse(ReservaResponse):
     cliente: "ClienteResponse"
     pacote: "PacoteResponse"
     pagamentos: List["PagamentoResponse"] = []
     viagens: List["ViagemResponse"] = []
 
+    # Relacionamentos serializados e como carregá-los (ver app/loading.py)
+    relacionamentos: ClassVar[Dict[str, str]] = {
+        "cliente": JOINED,
+        "pacote": JOINED,
+        "pagamentos": SELECTIN,
+        "viagens": SELECTIN,
+    }
+
     class Config:
         orm_mode = True
 
@@ -189,7 +222,8 @@ class CertificacaoResponse(CertificacaoBase):
 class MoedaBase(BaseModel):
     nome: str
     codigo: str
-    taxa_cambio: Decimal
+    # Valor de uma unidade em USD: os preços são divididos por ela
+    taxa_cambio: Decimal = Field(..., gt=0)
 
 class MoedaCreate(MoedaBase):
     pass
@@ -197,7 +231,7 @@ class MoedaCreate(MoedaBase):
 class MoedaUpdate(BaseModel):
     nome: Optional[str] = None
     codigo: Optional[str] = None
-    taxa_cambio: Optional[Decimal] = None
+    taxa_cambio: Optional[Decimal] = Field(None, gt=0)
 
 class MoedaResponse(MoedaBase):
     id: str
@@ -221,10 +255,70 @@ class PagamentoResponse(PagamentoBase):
     id: str
     status: StatusPagamentoEnum
     data_pagamento: datetime
+    metodo: Optional[str] = None
+    referencia_externa: Optional[str] = None
 
     class Config:
         orm_mode = True
 
+class PagamentoPage(BaseModel):
+    items: List[PagamentoResponse]
+    next_cursor: Optional[str] = None
+
+class ReconciliacaoResponse(BaseModel):
+    dry_run: bool
+    verificados: int
+    sem_alteracao: int
+    erros: int
+    # Transições aplicadas, ex.: {"Pendente -> Confirmado": 3}
+    alterados: Dict[str, int]
+    reservas_pagas: int
+    duracao_segundos: float
+    pagamentos_por_segundo: float
+
+class TotalMoeda(BaseModel):
+    pagamentos: int
+    valor: Decimal
+    valor_usd: Decimal
+
+class TotaisPagamentosResponse(BaseModel):
+    moeda: str
+    pagamentos: int
+    total_usd: Decimal
+    # Convertidos pela taxa vigente na data de cada pagamento
+    por_status: Dict[str, Decimal]
+    por_moeda: Dict[str, TotalMoeda]
+
+# Schemas de Relatórios
+class ReceitaPacoteDiaResponse(BaseModel):
+    package_id: str
+    dia: date
+    reservas: int
+    valor_reservado: Decimal
+    pagamentos_confirmados: int
+    receita_usd: Decimal
+
+    class Config:
+        orm_mode = True
+
+class PagamentosMoedaResponse(BaseModel):
+    moeda: str
+    status: StatusPagamentoEnum
+    pagamentos: int
+    valor: Decimal
+    valor_usd: Decimal
+
+class OcupacaoViagemResponse(BaseModel):
+    id: str
+    pacote_id: str
+    data_partida: datetime
+    status: StatusViagemEnum
+    capacidade: int
+    assentos_ocupados: int
+    assentos_retidos: int
+    # assentos_ocupados / capacidade
+    load_factor: float
+
 # Schemas de Imposto
 class ImpostoBase(BaseModel):
     pais_origem: str
@@ -241,6 +335,26 @@ class ImpostoResponse(ImpostoBase):
     class Config:
         orm_mode = True
 
+class ImpostoCalculoItem(BaseModel):
+    pais_origem: str
+    pais_destino: str
+    valor: float
+
+class ImpostoCalculoLote(BaseModel):
+    itens: List[ImpostoCalculoItem]
+
+class ImpostoCalculoResultado(BaseModel):
+    origem: str
+    destino: str
+    percentual: float
+    valor_base: float
+    valor_imposto: float
+    valor_total: float
+
+class ImpostoCalculoLoteResponse(BaseModel):
+    success: bool = True
+    resultados: List[ImpostoCalculoResultado]
+
 # Schemas de Viagem
 class ViagemBase(BaseModel):
     pacote_id: str
@@ -270,6 +384,7 @@ class ViagemResponse(BaseModel):
     data_criacao: datetime
     data_atualizacao: datetime
     numero_passageiros: int
+    assentos_retidos: int = 0
     vagas_disponiveis: int
     data_retorno: datetime
 
@@ -280,9 +395,19 @@ class ViagemDetailResponse(ViagemResponse):
     pacote: "PacoteResponse"
     reservas: List[ReservaResponse] = []
 
+    # Relacionamentos serializados e como carregá-los (ver app/loading.py)
+    relacionamentos: ClassVar[Dict[str, str]] = {
+        "pacote": JOINED,
+        "reservas": SELECTIN,
+    }
+
     class Config:
         orm_mode = True
 
+class ViagemPage(BaseModel):
+    items: List[ViagemResponse]
+    next_cursor: Optional[str] = None
+
 # Schema da relação Viagem-Reserva
 class ViagemReservaCreate(BaseModel):
     reserva_id: str
@@ -297,6 +422,29 @@ class ViagemReservaResponse(BaseModel):
     class Config:
         orm_mode = True
 
+class ViagemReservaErro(BaseModel):
+    indice: int
+    reserva_id: str
+    detail: str
+
+class ViagemReservaLoteResponse(BaseModel):
+    associadas: List[ViagemReservaResponse]
+    erros: List[ViagemReservaErro]
+
+# Schemas de Retenção de Assento
+class RetencaoAssentoCreate(BaseModel):
+    reserva_id: str
+
+class RetencaoAssentoResponse(BaseModel):
+    id: str
+    viagem_id: str
+    reserva_id: str
+    expira_em: datetime
+    data_criacao: datetime
+
+    class Config:
+        orm_mode = True
+
 # Schemas de Passageiro
 class PassageiroBase(BaseModel):
     viagem_id: str
@@ -0,0 +1,105 @@
+"""
+Snapshot em memória das moedas e taxas de câmbio.
+
+As moedas são poucas e mudam raramente, mas eram consultadas a cada
+pagamento. O snapshot é carregado de uma vez e é imutável: os mapas por id e
+por código são somente leitura e cada moeda é um registro congelado. Uma
+escrita em /currencies não altera o snapshot em uso: invalida o CacheLocal, e
+a próxima leitura carrega um snapshot novo, que substitui o anterior numa
+única atribuição. Quem já tinha uma referência ao snapshot antigo continua
+vendo um conjunto de taxas consistente; ninguém vê um conjunto pela metade.
+
+Cada moeda traz também a sua linha do tempo de taxas (currency_rate_history,
+somente inserções), em ordem de vigência, para a conversão na data de um
+pagamento: a taxa vigente num instante é encontrada por busca binária
+(bisect), em O(log n) e sem consultar o banco.
+"""
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from decimal import Decimal
+from types import MappingProxyType
+from typing import Mapping, Optional, Tuple
+
+from sqlalchemy import select
+
+from app.cache import CacheLocal
+from app.models import models
+
+@dataclass(frozen=True)
+class Cotacao:
+    id: str
+    nome: str
+    codigo: str
+    taxa_cambio: Decimal
+    # Linha do tempo: taxas[i] vale a partir de vigencias[i]
+    vigencias: Tuple[datetime, ...] = ()
+    taxas: Tuple[Decimal, ...] = ()
+
+    def intervalo(self, instante: Optional[datetime]) -> int:
+        """
+        Posição do instante na linha do tempo (índice em taxas), ou -1 quando
+        vale a taxa atual (instante ou histórico ausentes). Antes do primeiro
+        registro vale a taxa mais antiga conhecida
+        """
+        if instante is None or not self.taxas:
+            return -1
+        return max(bisect_right(self.vigencias, instante) - 1, 0)
+
+    def taxa_no_intervalo(self, intervalo: int) -> Decimal:
+        return self.taxa_cambio if intervalo < 0 else self.taxas[intervalo]
+
+    def taxa_em(self, instante: Optional[datetime]) -> Decimal:
+        """Taxa vigente no instante"""
+        return self.taxa_no_intervalo(self.intervalo(instante))
+
+@dataclass(frozen=True)
+class SnapshotMoedas:
+    por_id: Mapping[str, Cotacao]
+    por_codigo: Mapping[str, Cotacao]
+
+    def buscar_codigo(self, codigo, padrao=None) -> Optional[Cotacao]:
+        """Moeda pelo código ou, se não existir, pelo código `padrao`"""
+        cotacao = self.por_codigo.get(codigo)
+        if cotacao is None and padrao is not None:
+            cotacao = self.por_codigo.get(padrao)
+        return cotacao
+
+def stmt_moedas():
+    return select(models.Moeda.id, models.Moeda.nome, models.Moeda.codigo, models.Moeda.taxa_cambio)
+
+def stmt_historico():
+    return select(
+        models.HistoricoCambio.moeda_id,
+        models.HistoricoCambio.vigente_desde,
+        models.HistoricoCambio.taxa_cambio
+    ).order_by(models.HistoricoCambio.moeda_id, models.HistoricoCambio.vigente_desde)
+
+def montar_snapshot(moedas, historico):
+    """
+    Snapshot a partir das linhas de stmt_moedas() e stmt_historico(); usado
+    também fora do cache, com conexões síncronas (ver rollups.reconstruir)
+    """
+    linhas_do_tempo = {}
+    for moeda_id, vigente_desde, taxa in historico:
+        linhas_do_tempo.setdefault(moeda_id, []).append((vigente_desde, taxa))
+
+    cotacoes = []
+    for moeda_id, nome, codigo, taxa_cambio in moedas:
+        linha_do_tempo = linhas_do_tempo.get(moeda_id, [])
+        cotacoes.append(Cotacao(
+            id=moeda_id, nome=nome, codigo=codigo, taxa_cambio=taxa_cambio,
+            vigencias=tuple(vigente_desde for vigente_desde, _ in linha_do_tempo),
+            taxas=tuple(taxa for _, taxa in linha_do_tempo)
+        ))
+    return SnapshotMoedas(
+        por_id=MappingProxyType({cotacao.id: cotacao for cotacao in cotacoes}),
+        por_codigo=MappingProxyType({cotacao.codigo: cotacao for cotacao in cotacoes})
+    )
+
+async def _carregar_moedas(db):
+    historico = (await db.execute(stmt_historico())).all()
+    return montar_snapshot((await db.execute(stmt_moedas())).all(), historico)
+
+# Invalidado por create_currency e update_currency após o commit
+moedas = CacheLocal("currencies", _carregar_moedas)
@@ -0,0 +1,104 @@
+"""
+Hash e verificação de senhas (bcrypt) num pool de processos dedicado.
+
+O bcrypt é CPU-bound de propósito. Feito no threadpool da API, cada cadastro
+prendia uma thread por centenas de milissegundos e disputava CPU com as
+demais rotas dentro do mesmo processo: uma rajada de cadastros esgotava o
+threadpool e degradava o resto da API. Aqui o hash roda em no máximo
+PASSWORD_HASH_WORKERS processos separados, e a fila de espera é limitada:
+com PASSWORD_HASH_WORKERS + PASSWORD_HASH_MAX_QUEUE hashes em andamento, o
+pedido seguinte é recusado na hora (HashSaturado, 503 nas rotas) em vez de
+acumular latência.
+
+O custo do bcrypt vem de BCRYPT_ROUNDS; hashes gerados com outro custo
+continuam sendo verificados normalmente.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from passlib.context import CryptContext
+
+logger = logging.getLogger(__name__)
+
+ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Metade das CPUs: a outra metade fica para a API
+WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+# Hashes aguardando um processo livre, além dos que estão em execução
+FILA_MAXIMA = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", str(4 * WORKERS)))
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=ROUNDS)
+
+class HashSaturado(Exception):
+    """Pool de hash com a fila cheia (ou reiniciando): o pedido deve ser repetido depois"""
+
+def gerar_hash(senha):
+    """Hash bcrypt no processo atual (usado pelos processos do pool e pelo seed)"""
+    return pwd_context.hash(senha)
+
+def verificar_hash(senha, senha_hash):
+    return pwd_context.verify(senha, senha_hash)
+
+def _aquecer():
+    """Tarefa vazia: só faz o pool iniciar o processo antes do primeiro cadastro"""
+
+class HasherSenhas:
+    def __init__(self, workers=WORKERS, fila_maxima=FILA_MAXIMA):
+        self._workers = workers
+        self._limite = workers + fila_maxima
+        self._pendentes = 0
+        self._pool = None
+
+    @property
+    def pendentes(self):
+        return self._pendentes
+
+    def _obter_pool(self):
+        if self._pool is None:
+            # spawn: o processo da API tem threads (aiosqlite, threadpool), e fork com threads não é seguro
+            self._pool = ProcessPoolExecutor(
+                max_workers=self._workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def iniciar(self):
+        """Cria os processos na inicialização da API, fora do caminho das requisições"""
+        pool = self._obter_pool()
+        for _ in range(self._workers):
+            pool.submit(_aquecer)
+
+    async def parar(self):
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.get_running_loop().run_in_executor(None, pool.shutdown)
+
+    async def _executar(self, funcao, *args):
+        # Sem await antes do incremento: a contagem é exata dentro do event loop
+        if self._pendentes >= self._limite:
+            raise HashSaturado(f"{self._pendentes} hashes de senha em andamento")
+        self._pendentes += 1
+        pool = self._obter_pool()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(pool, funcao, *args)
+        except BrokenProcessPool:
+            # Um processo do pool morreu: encerra o pool quebrado (thread de
+            # gerenciamento e processos restantes) e o próximo pedido cria outro.
+            # Só o primeiro pedido que falhou descarta: os demais não derrubam o substituto
+            if self._pool is pool:
+                logger.exception("Pool de hash de senhas interrompido; recriando")
+                self._pool = None
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise HashSaturado("pool de hash de senhas reiniciando")
+        finally:
+            self._pendentes -= 1
+
+    async def gerar_hash(self, senha):
+        return await self._executar(gerar_hash, senha)
+
+    async def verificar(self, senha, senha_hash):
+        return await self._executar(verificar_hash, senha, senha_hash)
+
+hasher = HasherSenhas()
@@ -0,0 +1,187 @@
+"""
+Cliente assíncrono da API do MercadoPago.
+
+Substitui as chamadas síncronas do SDK, que ocupavam um worker do threadpool
+por chamada e sem timeout: com o gateway lento, o threadpool esgotava e a API
+inteira parava. Aqui as chamadas usam um httpx.AsyncClient com pool de
+conexões e, para não contaminar o resto da API quando o gateway degrada:
+
+- prazo por chamada (MERCADO_PAGO_TIMEOUT_SECONDS), que inclui a espera por
+  vaga e as novas tentativas;
+- no máximo MERCADO_PAGO_MAX_CONCURRENCY chamadas simultâneas;
+- nova tentativa com backoff exponencial e jitter para falhas transitórias
+  (conexão, timeout, 429 e 5xx), com a mesma X-Idempotency-Key, então
+  repetir a criação de uma preferência não a duplica;
+- um disjuntor (circuit breaker) que, depois de FALHAS_PARA_ABRIR falhas
+  seguidas, recusa as chamadas na hora por TEMPO_ABERTO segundos e então
+  deixa passar uma chamada de teste.
+
+As respostas têm o mesmo formato do SDK ({"status": ..., "response": ...}).
+Para testar cenários de gateway degradado sem rede, aponte
+MERCADO_PAGO_API_URL para scripts/stub_payment_gateway.py.
+"""
+import asyncio
+import logging
+import os
+import random
+import re
+import time
+import uuid
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Em produção, estas chaves devem ser armazenadas em variáveis de ambiente
+MERCADO_PAGO_ACCESS_TOKEN = os.getenv("MERCADO_PAGO_ACCESS_TOKEN", "TEST-2915071579656535-051412-4a9844add009320a3f088ee8af1a03bc-574627484")
+MERCADO_PAGO_API_URL = os.getenv("MERCADO_PAGO_API_URL", "https://api.mercadopago.com")
+# Prazo total de cada chamada, incluindo espera por vaga e novas tentativas
+TIMEOUT = float(os.getenv("MERCADO_PAGO_TIMEOUT_SECONDS", "10"))
+MAX_CONCORRENCIA = int(os.getenv("MERCADO_PAGO_MAX_CONCURRENCY", "20"))
+TENTATIVAS = 3
+BACKOFF_BASE = 0.2
+FALHAS_PARA_ABRIR = 5
+TEMPO_ABERTO = 30.0
+
+STATUS_TRANSITORIOS = {429, 500, 502, 503, 504}
+# IDs de pagamento do MercadoPago são numéricos; aceita também o formato alfanumérico de testes
+ID_PAGAMENTO = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+class GatewayIndisponivel(Exception):
+    """Gateway fora do ar, lento demais ou com o disjuntor aberto"""
+
+class IdPagamentoInvalido(ValueError):
+    """ID de pagamento que não pode ser usado no caminho da URL"""
+
+def id_pagamento_valido(payment_id):
+    return ID_PAGAMENTO.fullmatch(str(payment_id)) is not None
+
+class Disjuntor:
+    """Circuit breaker por contagem de falhas consecutivas"""
+    def __init__(self, falhas_para_abrir=FALHAS_PARA_ABRIR, tempo_aberto=TEMPO_ABERTO):
+        self._falhas_para_abrir = falhas_para_abrir
+        self._tempo_aberto = tempo_aberto
+        self._falhas = 0
+        self._aberto_ate = None
+        self._em_teste = False
+
+    @property
+    def aberto(self):
+        return self._aberto_ate is not None and time.monotonic() < self._aberto_ate
+
+    def permitir(self):
+        """Indica se uma chamada pode seguir; com o prazo vencido, libera uma chamada de teste"""
+        if self._aberto_ate is None:
+            return True
+        if time.monotonic() < self._aberto_ate or self._em_teste:
+            return False
+        self._em_teste = True
+        return True
+
+    def liberar(self):
+        """Devolve a vaga de teste de uma chamada que terminou sem dizer nada sobre o gateway (ex.: cancelada)"""
+        self._em_teste = False
+
+    def sucesso(self):
+        self._falhas = 0
+        self._aberto_ate = None
+        self._em_teste = False
+
+    def falha(self):
+        self._falhas += 1
+        if self._em_teste or self._falhas >= self._falhas_para_abrir:
+            if self._aberto_ate is None or self._em_teste:
+                logger.warning("Gateway de pagamento: disjuntor aberto por %ss", self._tempo_aberto)
+            self._aberto_ate = time.monotonic() + self._tempo_aberto
+            self._em_teste = False
+
+class GatewayMercadoPago:
+    def __init__(
+        self,
+        url=MERCADO_PAGO_API_URL,
+        access_token=MERCADO_PAGO_ACCESS_TOKEN,
+        timeout=TIMEOUT,
+        max_concorrencia=MAX_CONCORRENCIA,
+        disjuntor=None
+    ):
+        self._url = url.rstrip("/")
+        self._access_token = access_token
+        self._timeout = timeout
+        self._max_concorrencia = max_concorrencia
+        self.disjuntor = disjuntor or Disjuntor()
+        self._cliente = None
+        self._vagas = None
+        self._loop = None
+
+    def _cliente_http(self):
+        # O pool de conexões pertence ao event loop em que foi criado
+        loop = asyncio.get_running_loop()
+        if self._cliente is None or self._loop is not loop:
+            self._cliente = httpx.AsyncClient(
+                base_url=self._url,
+                headers={"Authorization": f"Bearer {self._access_token}"},
+                limits=httpx.Limits(
+                    max_connections=self._max_concorrencia,
+                    max_keepalive_connections=self._max_concorrencia
+                ),
+                timeout=self._timeout
+            )
+            self._vagas = asyncio.Semaphore(self._max_concorrencia)
+            self._loop = loop
+        return self._cliente
+
+    async def fechar(self):
+        if self._cliente is not None:
+            await self._cliente.aclose()
+            self._cliente = None
+
+    async def criar_preferencia(self, dados):
+        return await self._chamar("POST", "/checkout/preferences", json=dados)
+
+    async def consultar_pagamento(self, payment_id):
+        # Validado antes de montar a URL: um id como "\x00" ou "../x" nem chega ao gateway
+        if not id_pagamento_valido(payment_id):
+            raise IdPagamentoInvalido(f"ID de pagamento inválido: {str(payment_id)[:80]!r}")
+        return await self._chamar("GET", f"/v1/payments/{payment_id}")
+
+    async def _chamar(self, metodo, caminho, json=None):
+        if not self.disjuntor.permitir():
+            raise GatewayIndisponivel("Gateway de pagamento indisponível (disjuntor aberto)")
+        try:
+            resposta = await asyncio.wait_for(
+                self._chamar_com_tentativas(metodo, caminho, json),
+                timeout=self._timeout
+            )
+        except asyncio.TimeoutError:
+            self.disjuntor.falha()
+            raise GatewayIndisponivel(f"Gateway de pagamento não respondeu em {self._timeout}s")
+        except GatewayIndisponivel:
+            self.disjuntor.falha()
+            raise
+        except BaseException:
+            # Cancelamento ou erro que não vem do gateway: sem liberar a vaga de
+            # teste, o disjuntor meio aberto recusaria as chamadas para sempre
+            self.disjuntor.liberar()
+            raise
+        self.disjuntor.sucesso()
+        return resposta
+
+    async def _chamar_com_tentativas(self, metodo, caminho, json):
+        cliente = self._cliente_http()
+        # A mesma chave em todas as tentativas: o gateway não duplica a operação
+        headers = {"X-Idempotency-Key": str(uuid.uuid4())}
+        async with self._vagas:
+            for tentativa in range(TENTATIVAS):
+                try:
+                    resposta = await cliente.request(metodo, caminho, json=json, headers=headers)
+                    if resposta.status_code not in STATUS_TRANSITORIOS:
+                        return {"status": resposta.status_code, "response": resposta.json()}
+                    erro = f"status {resposta.status_code}"
+                except (httpx.TransportError, ValueError) as e:
+                    erro = repr(e)
+                if tentativa + 1 < TENTATIVAS:
+                    # Backoff exponencial com jitter completo
+                    await asyncio.sleep(random.uniform(0, BACKOFF_BASE * 2 ** tentativa))
+        raise GatewayIndisponivel(f"Falha na comunicação com o gateway de pagamento: {erro}")
+
+gateway = GatewayMercadoPago()
@@ -0,0 +1,357 @@
+"""
+Caixa de entrada (inbox) das notificações de pagamento do MercadoPago.
+
+O webhook só valida a notificação e a grava em payment_notifications (um
+INSERT), respondendo em milissegundos; nada de chamadas ao gateway dentro da
+requisição. O ProcessadorNotificacoes esvazia a caixa em segundo plano:
+
+- cada worker reserva um lote de notificações vencidas com um UPDATE
+  condicional (... RETURNING), que adia proxima_tentativa por
+  PRAZO_PROCESSAMENTO: outro worker ou processo não pega as mesmas linhas, e
+  um lote abandonado (processo interrompido) volta sozinho à fila;
+- os detalhes dos pagamentos do lote são consultados no gateway em paralelo
+  (a concorrência é limitada pelo próprio cliente do gateway);
+- os pagamentos são gravados numa única transação por lote, com reservas,
+  pagamentos existentes carregados com uma consulta IN cada e as moedas
+  lidas do snapshot em memória (currency_rates).
+
+Deduplicação: há uma linha por id de pagamento do gateway (novas notificações
+do mesmo pagamento reabrem a linha em vez de criar outra) e um pagamento por
+referencia_externa, então reprocessar uma notificação atualiza o pagamento
+existente em vez de duplicá-lo. Falhas transitórias (gateway indisponível)
+são repetidas com backoff exponencial e jitter até MAX_TENTATIVAS; depois
+disso, ou em falhas definitivas (reserva inexistente), a notificação fica
+com status FALHOU e o motivo em ultimo_erro.
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, select, update
+from sqlalchemy.exc import IntegrityError
+
+from app.database.database import AsyncSessionLocal
+from app.models import models
+from app.services import currency_rates, rollups, seat_holds
+from app.services.payment_gateway import GatewayIndisponivel, IdPagamentoInvalido, gateway
+
+logger = logging.getLogger(__name__)
+
+# Workers que esvaziam a caixa de entrada em paralelo
+WORKERS = int(os.getenv("PAYMENT_INBOX_WORKERS", "2"))
+# Notificações por lote (uma transação por lote)
+TAMANHO_LOTE = 50
+# Por quanto tempo um lote reservado fica com o worker antes de voltar à fila
+PRAZO_PROCESSAMENTO = timedelta(minutes=2)
+MAX_TENTATIVAS = 10
+BACKOFF_BASE = timedelta(seconds=5)
+BACKOFF_MAXIMO = timedelta(hours=1)
+# Espera máxima entre verificações da fila (novas tentativas, outros processos)
+INTERVALO_VERIFICACAO = 5
+
+# Status do pagamento no MercadoPago -> status interno
+STATUS_GATEWAY = {
+    "approved": models.StatusPagamento.CONFIRMADO,
+    "pending": models.StatusPagamento.PENDENTE,
+    "in_process": models.StatusPagamento.PENDENTE,
+    "authorized": models.StatusPagamento.PENDENTE,
+    "rejected": models.StatusPagamento.FALHOU,
+    "cancelled": models.StatusPagamento.FALHOU,
+}
+CAMPOS_OBRIGATORIOS = ("external_reference", "status", "transaction_amount", "payment_method_id", "currency_id")
+MOEDA_PADRAO = "BRL"
+
+class FalhaDefinitiva(Exception):
+    """Notificação que não adianta tentar de novo"""
+
+async def registrar_notificacao(db, tipo, payment_id, payload):
+    """
+    Grava a notificação na caixa de entrada. Uma nova notificação de um
+    pagamento já registrado reabre a linha existente (o status no gateway pode
+    ter mudado) em vez de criar outra
+    """
+    agora = datetime.utcnow()
+    try:
+        db.add(models.NotificacaoPagamento(
+            payment_id=payment_id,
+            tipo=tipo,
+            payload=json.dumps(payload),
+            proxima_tentativa=agora,
+            data_recebimento=agora
+        ))
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        # A versão maior impede que um processamento em andamento, com dados
+        # anteriores a esta notificação, marque a linha como processada
+        await db.execute(
+            update(models.NotificacaoPagamento)
+            .where(models.NotificacaoPagamento.payment_id == payment_id)
+            .values(
+                tipo=tipo,
+                payload=json.dumps(payload),
+                status=models.StatusNotificacao.PENDENTE,
+                versao=models.NotificacaoPagamento.versao + 1,
+                tentativas=0,
+                proxima_tentativa=agora,
+                ultimo_erro=None,
+                data_recebimento=agora
+            )
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+def _backoff(tentativas):
+    espera = min(BACKOFF_BASE * 2 ** tentativas, BACKOFF_MAXIMO)
+    return espera * random.uniform(0.5, 1.0)
+
+async def _consultar(payment_id):
+    """Detalhes do pagamento no gateway; GatewayIndisponivel indica falha transitória"""
+    try:
+        resposta = await gateway.consultar_pagamento(payment_id)
+    except IdPagamentoInvalido as e:
+        raise FalhaDefinitiva(str(e))
+    if resposta["status"] == 404:
+        # O pagamento pode ainda não estar visível na API logo após a notificação
+        raise GatewayIndisponivel("Pagamento ainda não encontrado no MercadoPago")
+    if resposta["status"] != 200:
+        raise FalhaDefinitiva(f"Status da resposta do MercadoPago inválido: {resposta['status']}")
+    dados = resposta["response"]
+    ausentes = [campo for campo in CAMPOS_OBRIGATORIOS if campo not in dados]
+    if ausentes:
+        raise FalhaDefinitiva(f"Campos ausentes na resposta do MercadoPago: {', '.join(ausentes)}")
+    return dados
+
+async def aplicar_pagamentos(db, itens):
+    """
+    Grava os pagamentos consultados no gateway, na transação do chamador.
+    `itens` é uma lista de (payment_id, dados); retorna {payment_id: erro}
+    com as falhas definitivas
+    """
+    referencias = [payment_id for payment_id, _ in itens]
+    reserva_ids = {dados["external_reference"] for _, dados in itens}
+
+    reservas = {
+        reserva.id: reserva
+        for reserva in (await db.scalars(
+            select(models.Reserva).filter(models.Reserva.id.in_(reserva_ids))
+        )).all()
+    }
+    moedas = await currency_rates.moedas.obter(db)
+    existentes = {
+        pagamento.referencia_externa: pagamento
+        for pagamento in (await db.scalars(
+            select(models.Pagamento).filter(models.Pagamento.referencia_externa.in_(referencias))
+        )).all()
+    }
+
+    falhas = {}
+    # (pagamento, package_id, estado antes da escrita) para os rollups
+    gravados = []
+    for payment_id, dados in itens:
+        reserva = reservas.get(dados["external_reference"])
+        if reserva is None:
+            falhas[payment_id] = f"Reserva não encontrada: {dados['external_reference']}"
+            continue
+        # Moeda desconhecida: usa a moeda padrão
+        moeda = moedas.buscar_codigo(dados["currency_id"], padrao=MOEDA_PADRAO)
+        if moeda is None:
+            falhas[payment_id] = f"Moeda não encontrada: {dados['currency_id']}"
+            continue
+
+        status_pagamento = STATUS_GATEWAY.get(dados["status"], models.StatusPagamento.PENDENTE)
+        pagamento = existentes.get(payment_id)
+        antes = rollups.estado_pagamento(pagamento, reserva.package_id) if pagamento is not None else None
+        if pagamento is None:
+            pagamento = models.Pagamento(
+                booking_id=reserva.id,
+                moeda_id=moeda.id,
+                valor=dados["transaction_amount"],
+                metodo=f"MercadoPago - {dados['payment_method_id']}",
+                status=status_pagamento,
+                referencia_externa=payment_id
+            )
+            db.add(pagamento)
+            existentes[payment_id] = pagamento
+        else:
+            pagamento.status = status_pagamento
+        gravados.append((pagamento, reserva.package_id, antes))
+
+        # Atualizar status da reserva se o pagamento for confirmado
+        if status_pagamento == models.StatusPagamento.CONFIRMADO and reserva.status != models.StatusReserva.PAGO:
+            reserva.status = models.StatusReserva.PAGO
+            await seat_holds.converter_retencao(db, reserva.id)
+
+    # Pagamentos novos só têm data_pagamento depois do flush
+    await db.flush()
+    await rollups.registrar_pagamentos(db, [
+        (antes, rollups.estado_pagamento(pagamento, package_id)) for pagamento, package_id, antes in gravados
+    ])
+    return falhas
+
+class ProcessadorNotificacoes:
+    def __init__(self, session_factory=AsyncSessionLocal, workers=WORKERS):
+        self._session_factory = session_factory
+        self._workers = workers
+        self._tarefas = []
+        self._despertar = None
+
+    def iniciar(self):
+        if not self._tarefas:
+            self._despertar = asyncio.Event()
+            self._tarefas = [asyncio.create_task(self._executar()) for _ in range(self._workers)]
+
+    async def parar(self):
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        for tarefa in self._tarefas:
+            try:
+                await tarefa
+            except asyncio.CancelledError:
+                pass
+        self._tarefas = []
+
+    def notificar(self):
+        """Avisa que há notificação nova (chamado pelo webhook após o commit)"""
+        if self._despertar is not None:
+            self._despertar.set()
+
+    async def _executar(self):
+        while True:
+            try:
+                processadas = await self.processar_lote()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha ao processar notificações de pagamento")
+                processadas = 0
+            if processadas < TAMANHO_LOTE:
+                # Fila vazia (ou quase): dormir até uma notificação nova ou o intervalo
+                self._despertar.clear()
+                try:
+                    await asyncio.wait_for(self._despertar.wait(), timeout=INTERVALO_VERIFICACAO)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _reservar_lote(self, agora):
+        notificacoes = models.NotificacaoPagamento
+        vencidas = (
+            select(notificacoes.id)
+            .where(
+                notificacoes.status == models.StatusNotificacao.PENDENTE,
+                notificacoes.proxima_tentativa <= agora
+            )
+            .order_by(notificacoes.proxima_tentativa)
+            .limit(TAMANHO_LOTE)
+        )
+        async with self._session_factory() as db:
+            # A condição é repetida no UPDATE: linhas reservadas por outro worker
+            # entre a subconsulta e a escrita ficam de fora
+            linhas = (await db.execute(
+                update(notificacoes)
+                .where(
+                    notificacoes.id.in_(vencidas),
+                    notificacoes.status == models.StatusNotificacao.PENDENTE,
+                    notificacoes.proxima_tentativa <= agora
+                )
+                .values(proxima_tentativa=agora + PRAZO_PROCESSAMENTO)
+                .returning(notificacoes.id, notificacoes.payment_id, notificacoes.versao, notificacoes.tentativas)
+                .execution_options(synchronize_session=False)
+            )).all()
+            await db.commit()
+        return linhas
+
+    async def processar_lote(self):
+        """Processa um lote de notificações vencidas; retorna quantas foram reservadas"""
+        agora = datetime.utcnow()
+        lote = await self._reservar_lote(agora)
+        if not lote:
+            return 0
+
+        # Consultas ao gateway em paralelo, fora de qualquer transação
+        consultas = await asyncio.gather(
+            *[_consultar(linha.payment_id) for linha in lote], return_exceptions=True
+        )
+        consultados, erros = [], {}
+        for linha, resultado in zip(lote, consultas):
+            if isinstance(resultado, BaseException):
+                erros[linha.id] = resultado
+            else:
+                consultados.append((linha, resultado))
+
+        try:
+            async with self._session_factory() as db:
+                falhas = await aplicar_pagamentos(db, [(linha.payment_id, dados) for linha, dados in consultados])
+                for linha, _ in consultados:
+                    if linha.payment_id in falhas:
+                        erros[linha.id] = FalhaDefinitiva(falhas[linha.payment_id])
+                await self._finalizar(db, lote, erros)
+                await db.commit()
+        except Exception:
+            # Um item problemático não pode travar o lote: um por vez, cada um na sua transação
+            logger.exception("Falha ao gravar lote de notificações; aplicando individualmente")
+            for linha, dados in consultados:
+                await self._processar_individual(linha, dados, erros)
+            async with self._session_factory() as db:
+                await self._finalizar(db, [linha for linha in lote if linha.id in erros], erros)
+                await db.commit()
+        return len(lote)
+
+    async def _processar_individual(self, linha, dados, erros):
+        try:
+            async with self._session_factory() as db:
+                falhas = await aplicar_pagamentos(db, [(linha.payment_id, dados)])
+                if falhas:
+                    erros[linha.id] = FalhaDefinitiva(falhas[linha.payment_id])
+                else:
+                    await self._finalizar(db, [linha], {})
+                await db.commit()
+        except Exception as e:
+            logger.exception("Falha ao aplicar o pagamento %s", linha.payment_id)
+            erros[linha.id] = e
+
+    async def _finalizar(self, db, lote, erros):
+        """Marca as notificações como processadas, reagendadas ou falhas (na transação do chamador)"""
+        agora = datetime.utcnow()
+        notificacoes = models.NotificacaoPagamento.__table__
+        valores = []
+        for linha in lote:
+            erro = erros.get(linha.id)
+            tentativas = linha.tentativas + (erro is not None)
+            if erro is None:
+                status_notificacao, proxima, mensagem = models.StatusNotificacao.PROCESSADA, agora, None
+            elif isinstance(erro, FalhaDefinitiva) or tentativas >= MAX_TENTATIVAS:
+                status_notificacao, proxima, mensagem = models.StatusNotificacao.FALHOU, agora, str(erro)
+            else:
+                status_notificacao, proxima, mensagem = (
+                    models.StatusNotificacao.PENDENTE, agora + _backoff(tentativas), str(erro)
+                )
+            valores.append({
+                "alvo": linha.id, "versao_reservada": linha.versao,
+                "novo_status": status_notificacao, "tentativas_feitas": tentativas,
+                "proxima": proxima, "erro": mensagem,
+                "processada_em": agora if erro is None else None,
+            })
+        if not valores:
+            return
+        # Executemany; linhas reabertas por nova notificação (outra versão) ficam pendentes
+        await db.execute(
+            update(notificacoes)
+            .where(
+                notificacoes.c.id == bindparam("alvo"),
+                notificacoes.c.versao == bindparam("versao_reservada")
+            )
+            .values(
+                status=bindparam("novo_status"),
+                tentativas=bindparam("tentativas_feitas"),
+                proxima_tentativa=bindparam("proxima"),
+                ultimo_erro=bindparam("erro"),
+                data_processamento=bindparam("processada_em")
+            ),
+            valores
+        )
+
+processador_notificacoes = ProcessadorNotificacoes()
@@ -0,0 +1,70 @@
+"""
+Preferências do MercadoPago guardadas por reserva.
+
+Recarregar a página de checkout chamava o gateway de novo a cada vez. A
+preferência criada para uma reserva fica em payment_preferences com o
+valor_total e o nome do pacote usados na criação, e é devolvida sem chamar o
+gateway enquanto esses dados forem os mesmos e ela não estiver perto de
+expirar. A preferência é criada com data de expiração no próprio MercadoPago
+(expires / expiration_date_to), então o link guardado nunca dura mais que a
+preferência.
+"""
+import os
+from datetime import datetime, timedelta
+
+from app.database.upsert import dialeto, stmt_upsert
+from app.models import models
+
+# Validade das preferências criadas (e guardadas)
+TTL = int(os.getenv("MERCADO_PAGO_PREFERENCE_TTL_SECONDS", "86400"))
+# Não devolve um link que expira antes de dar tempo de pagar
+MARGEM_EXPIRACAO = timedelta(minutes=10)
+
+def reaproveitavel(preferencia, valor_total, pacote_nome, agora=None):
+    """Indica se a preferência guardada ainda serve para a reserva"""
+    agora = agora or datetime.utcnow()
+    return (
+        preferencia is not None
+        and preferencia.valor_total == valor_total
+        and preferencia.pacote_nome == pacote_nome
+        and preferencia.expira_em > agora + MARGEM_EXPIRACAO
+    )
+
+def dados_preferencia(booking_id, pacote_nome, valor_total, expira_em):
+    """Corpo da criação da preferência no MercadoPago"""
+    return {
+        "items": [
+            {
+                "title": f"Pacote Espacial: {pacote_nome}",
+                "quantity": 1,
+                "currency_id": "BRL",  # Pode ser alterado para outras moedas suportadas
+                "unit_price": float(valor_total)
+            }
+        ],
+        "back_urls": {
+            "success": "http://localhost:8000/payments/success",
+            "failure": "http://localhost:8000/payments/failure",
+            "pending": "http://localhost:8000/payments/pending"
+        },
+        "external_reference": booking_id,
+        "notification_url": "http://localhost:8000/webhook/mercadopago",
+        "expires": True,
+        "expiration_date_to": expira_em.strftime("%Y-%m-%dT%H:%M:%S.000+00:00")
+    }
+
+async def guardar(db, booking_id, preference, valor_total, pacote_nome, expira_em):
+    """Grava (ou substitui) a preferência da reserva, na transação do chamador"""
+    valores = {
+        "preference_id": preference["id"],
+        "init_point": preference["init_point"],
+        "sandbox_init_point": preference["sandbox_init_point"],
+        "valor_total": valor_total,
+        "pacote_nome": pacote_nome,
+        "expira_em": expira_em,
+        "data_criacao": datetime.utcnow()
+    }
+    stmt = stmt_upsert(
+        dialeto(db), models.PreferenciaPagamento.__table__, ["booking_id"],
+        lambda novos: {coluna: novos[coluna] for coluna in valores}
+    )
+    await db.execute(stmt, {"booking_id": booking_id, **valores})
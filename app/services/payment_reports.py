@@ -0,0 +1,73 @@
+"""
+Relatórios de pagamentos normalizados para a moeda de referência (USD).
+
+Cada pagamento é convertido pela taxa vigente na sua data_pagamento, tirada
+da linha do tempo do snapshot de moedas (currency_rates), e não pela taxa
+atual. Os pagamentos são lidos numa única consulta em streaming, em partições
+de TAMANHO_PARTICAO linhas, sem consulta por linha e com a memória limitada a
+uma partição, qualquer que seja o volume.
+
+Por linha só se localiza, por busca binária, o intervalo da linha do tempo em
+que o pagamento cai e se soma o valor ao grupo (moeda, status, intervalo); a
+multiplicação pela taxa é feita uma vez por grupo no final, com o mesmo
+resultado exato em Decimal da conversão linha a linha.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from sqlalchemy import select
+
+from app.models import models
+from app.services import currency_rates
+
+TAMANHO_PARTICAO = 10000
+CENTAVOS = Decimal("0.01")
+
+async def totais_em_usd(db, de=None, ate=None):
+    """Totais dos pagamentos no período, em USD, por status e por moeda"""
+    snapshot = await currency_rates.moedas.obter(db)
+    query = select(
+        models.Pagamento.moeda_id,
+        models.Pagamento.valor,
+        models.Pagamento.data_pagamento,
+        models.Pagamento.status
+    )
+    if de is not None:
+        query = query.filter(models.Pagamento.data_pagamento >= de)
+    if ate is not None:
+        query = query.filter(models.Pagamento.data_pagamento <= ate)
+
+    # (moeda_id, status, intervalo da linha do tempo) -> [quantidade, soma dos valores]
+    grupos = defaultdict(lambda: [0, Decimal(0)])
+    por_id = snapshot.por_id
+    # Linhas do Core, sem o processamento de entidades do ORM
+    conexao = await db.connection()
+    resultado = await conexao.stream(query.execution_options(yield_per=TAMANHO_PARTICAO))
+    async for particao in resultado.partitions():
+        for moeda_id, valor, data_pagamento, status_pagamento in particao:
+            grupo = grupos[moeda_id, status_pagamento, por_id[moeda_id].intervalo(data_pagamento)]
+            grupo[0] += 1
+            grupo[1] += valor
+
+    por_status = defaultdict(Decimal)
+    por_moeda = {}
+    for (moeda_id, status_pagamento, intervalo), (quantidade, valor) in grupos.items():
+        cotacao = por_id[moeda_id]
+        valor_usd = valor * cotacao.taxa_no_intervalo(intervalo)
+        por_status[status_pagamento.value] += valor_usd
+        total_moeda = por_moeda.setdefault(
+            cotacao.codigo, {"pagamentos": 0, "valor": Decimal(0), "valor_usd": Decimal(0)}
+        )
+        total_moeda["pagamentos"] += quantidade
+        total_moeda["valor"] += valor
+        total_moeda["valor_usd"] += valor_usd
+
+    for total_moeda in por_moeda.values():
+        total_moeda["valor_usd"] = total_moeda["valor_usd"].quantize(CENTAVOS)
+    return {
+        "moeda": "USD",
+        "pagamentos": sum(total["pagamentos"] for total in por_moeda.values()),
+        "total_usd": sum(por_status.values(), Decimal(0)).quantize(CENTAVOS),
+        "por_status": {status_pagamento: total.quantize(CENTAVOS) for status_pagamento, total in por_status.items()},
+        "por_moeda": por_moeda,
+    }
@@ -0,0 +1,91 @@
+"""
+Tabela de preços dos pacotes por país e moeda.
+
+A tabela de cada (país, moeda) é derivada de três conjuntos pequenos mantidos
+em memória: os pacotes, as regras fiscais (tax_rules) e as taxas de câmbio
+(currency_rates), cada um com seu CacheLocal e sua invalidação entre workers
+(app/cache.py).
+As tabelas já montadas ficam memorizadas por (percentual, moeda), e não pelo
+país informado na consulta: países sem regra própria compartilham a tabela do
+percentual padrão, então o número de tabelas é limitado pelas regras e moedas
+cadastradas, e não pelo que os clientes enviam. Elas são refeitas de forma
+incremental: uma taxa de câmbio nova só refaz as tabelas daquela moeda, e um
+pacote alterado só recalcula a sua linha.
+
+Os preços são cadastrados na moeda de referência (USD) e `taxa_cambio` é o
+valor de uma unidade da moeda nessa referência, então o preço convertido é
+preço / taxa_cambio. Moedas sem taxa positiva (o cadastro não as aceita,
+mas podem vir de dados antigos) ficam fora da tabela de preços.
+"""
+from sqlalchemy import select
+from app.cache import CacheLocal
+from app.models import models
+from app.services import currency_rates, tax_rules
+
+async def _carregar_pacotes(db):
+    pacotes = (await db.scalars(select(models.Pacote).order_by(models.Pacote.nome))).all()
+    return {
+        pacote.id: (pacote.nome, pacote.tipo, float(pacote.preco), pacote.disponibilidade)
+        for pacote in pacotes
+    }
+
+pacotes_catalogo = CacheLocal("packages", _carregar_pacotes)
+
+# (percentual, moeda) -> (taxa, pacotes de origem, {package_id: (dados do pacote, linha)}, linhas)
+_tabelas = {}
+
+def _linha(package_id, pacote, percentual, taxa):
+    nome, tipo, preco, disponibilidade = pacote
+    (imposto,), (total,) = tax_rules.calcular_valores([preco], [percentual])
+    return {
+        "package_id": package_id,
+        "nome": nome,
+        "tipo": tipo,
+        "disponibilidade": disponibilidade,
+        "preco": preco / taxa,
+        "valor_imposto": imposto / taxa,
+        "valor_total": total / taxa,
+    }
+
+def _descartar_obsoletas(moedas, regras):
+    """Remove as tabelas de percentuais e moedas que deixaram de existir"""
+    percentuais = set(regras.values()) | {tax_rules.PERCENTUAL_PADRAO}
+    for percentual, moeda in list(_tabelas):
+        if percentual not in percentuais or moeda not in moedas.por_codigo:
+            del _tabelas[percentual, moeda]
+
+async def tabela_precos(db, pais, moeda):
+    """
+    Linhas de preço de todos os pacotes para o país e a moeda, ou None se a
+    moeda não existir (ou não tiver taxa de câmbio válida). Retorna também o
+    percentual e a taxa aplicados
+    """
+    moedas = await currency_rates.moedas.obter(db)
+    cotacao = moedas.por_codigo.get(moeda)
+    if cotacao is None or cotacao.taxa_cambio <= 0:
+        return None
+    taxa = float(cotacao.taxa_cambio)
+    percentual = await tax_rules.percentual_imposto(db, pais)
+    pacotes = await pacotes_catalogo.obter(db)
+
+    anterior = _tabelas.get((percentual, moeda))
+    if anterior is not None and anterior[0] == taxa and anterior[1] is pacotes:
+        # Nada mudou desde a última montagem
+        return percentual, taxa, anterior[3]
+
+    por_pacote = {}
+    reaproveitaveis = anterior[2] if anterior is not None and anterior[0] == taxa else {}
+    for package_id, pacote in pacotes.items():
+        existente = reaproveitaveis.get(package_id)
+        if existente is not None and existente[0] == pacote:
+            # Mesma regra, mesma taxa e mesmo pacote: a linha é reaproveitada
+            por_pacote[package_id] = existente
+        else:
+            por_pacote[package_id] = (pacote, _linha(package_id, pacote, percentual, taxa))
+    linhas = [linha for _, linha in por_pacote.values()]
+    if anterior is None:
+        # Tabela nova: aproveita para descartar as de regras e moedas removidas
+        _descartar_obsoletas(moedas, await tax_rules.regras_fiscais.obter(db))
+    _tabelas[(percentual, moeda)] = (taxa, pacotes, por_pacote, linhas)
+
+    return percentual, taxa, linhas
@@ -0,0 +1,190 @@
+"""
+Reconciliação dos pagamentos pendentes com o gateway (MercadoPago).
+
+Notificações perdidas deixam pagamentos em PENDENTE e reservas em RESERVADO.
+A reconciliação percorre os pagamentos PENDENTE com id do gateway em lotes
+paginados por cursor (índice de status e data de pagamento), consulta cada um
+no gateway com concorrência limitada e aplica as mudanças de status com
+UPDATEs em conjunto: um por novo status em payments e um em bookings para as
+reservas dos pagamentos confirmados. Os UPDATEs só alteram linhas que ainda
+estão PENDENTE (ou RESERVADO), então uma notificação processada no meio do
+caminho não é sobrescrita. Nenhuma conexão do banco fica presa durante as
+consultas ao gateway.
+
+Retorna um relatório com o total verificado, as transições por status, os
+erros e a vazão. Com aplicar=False (dry run) só relata o que mudaria.
+
+Uso:
+    python -m app.services.reconciliation [--dry-run] [--limite N]
+    MERCADO_PAGO_API_URL=http://127.0.0.1:8081 python -m app.services.reconciliation
+"""
+import asyncio
+import time
+from collections import Counter, defaultdict
+
+from sqlalchemy import select, tuple_, update
+
+from app.database.database import AsyncSessionLocal
+from app.models import models
+from app.services import rollups, seat_holds
+from app.services.payment_gateway import gateway
+from app.services.payment_inbox import STATUS_GATEWAY
+
+# Pagamentos lidos por lote
+TAMANHO_LOTE = 200
+# Consultas simultâneas ao gateway (abaixo do limite do cliente, para não
+# tomar todas as vagas das rotas de pagamento)
+CONCORRENCIA = 8
+
+class FalhaConsulta(Exception):
+    pass
+
+async def _consultar(vagas, referencia):
+    async with vagas:
+        resposta = await gateway.consultar_pagamento(referencia)
+    if resposta["status"] != 200 or "status" not in resposta["response"]:
+        raise FalhaConsulta(f"Resposta inválida do MercadoPago para o pagamento {referencia}: {resposta['status']}")
+    return resposta["response"]
+
+async def _aplicar(db, mudancas, relatorio):
+    """Aplica as mudanças {novo status: [pagamentos]} com UPDATEs em conjunto"""
+    for novo_status, pagamentos in mudancas.items():
+        linhas = (await db.execute(
+            update(models.Pagamento)
+            .where(
+                models.Pagamento.id.in_([p.id for p in pagamentos]),
+                models.Pagamento.status == models.StatusPagamento.PENDENTE
+            )
+            .values(status=novo_status)
+            .returning(
+                models.Pagamento.booking_id, models.Pagamento.moeda_id,
+                models.Pagamento.valor, models.Pagamento.data_pagamento
+            )
+            .execution_options(synchronize_session=False)
+        )).all()
+        relatorio["alterados"][f"{models.StatusPagamento.PENDENTE.value} -> {novo_status.value}"] += len(linhas)
+        if not linhas:
+            continue
+        alterados = [linha.booking_id for linha in linhas]
+
+        # Rollups: cada pagamento sai de PENDENTE e entra no novo status
+        pacotes = dict((await db.execute(
+            select(models.Reserva.id, models.Reserva.package_id).filter(models.Reserva.id.in_(set(alterados)))
+        )).all())
+        await rollups.registrar_pagamentos(db, [
+            (
+                (pacotes[linha.booking_id], linha.moeda_id, models.StatusPagamento.PENDENTE, linha.valor, linha.data_pagamento),
+                (pacotes[linha.booking_id], linha.moeda_id, novo_status, linha.valor, linha.data_pagamento)
+            )
+            for linha in linhas
+        ])
+        if novo_status != models.StatusPagamento.CONFIRMADO:
+            continue
+
+        pagas = (await db.execute(
+            update(models.Reserva)
+            .where(
+                models.Reserva.id.in_(set(alterados)),
+                models.Reserva.status == models.StatusReserva.RESERVADO
+            )
+            .values(status=models.StatusReserva.PAGO)
+            .returning(models.Reserva.id)
+            .execution_options(synchronize_session=False)
+        )).scalars().all()
+        relatorio["reservas_pagas"] += len(pagas)
+        # Só as reservas com vaga retida precisam da conversão em associação à viagem
+        retidas = (await db.scalars(
+            select(models.RetencaoAssento.reserva_id).filter(models.RetencaoAssento.reserva_id.in_(pagas))
+        )).all() if pagas else []
+        for reserva_id in retidas:
+            await seat_holds.converter_retencao(db, reserva_id)
+
+async def reconciliar(
+    session_factory=AsyncSessionLocal,
+    aplicar=True,
+    limite=None,
+    tamanho_lote=TAMANHO_LOTE,
+    concorrencia=CONCORRENCIA
+):
+    """Reconcilia até `limite` pagamentos pendentes (todos, se None) e retorna o relatório"""
+    inicio = time.perf_counter()
+    relatorio = {"verificados": 0, "sem_alteracao": 0, "erros": 0, "reservas_pagas": 0, "alterados": Counter()}
+    vagas = asyncio.Semaphore(concorrencia)
+    ordem = (models.Pagamento.data_pagamento, models.Pagamento.id)
+    cursor = None
+
+    while limite is None or relatorio["verificados"] < limite:
+        quantidade = tamanho_lote if limite is None else min(tamanho_lote, limite - relatorio["verificados"])
+        query = (
+            select(models.Pagamento.id, models.Pagamento.referencia_externa, *ordem)
+            .filter(
+                models.Pagamento.status == models.StatusPagamento.PENDENTE,
+                models.Pagamento.referencia_externa.isnot(None)
+            )
+            .order_by(*ordem)
+            .limit(quantidade)
+        )
+        if cursor is not None:
+            query = query.filter(tuple_(*ordem) > cursor)
+        async with session_factory() as db:
+            pagamentos = (await db.execute(query)).all()
+        if not pagamentos:
+            break
+        cursor = (pagamentos[-1].data_pagamento, pagamentos[-1].id)
+
+        respostas = await asyncio.gather(
+            *[_consultar(vagas, p.referencia_externa) for p in pagamentos], return_exceptions=True
+        )
+        mudancas = defaultdict(list)
+        for pagamento, resposta in zip(pagamentos, respostas):
+            if isinstance(resposta, BaseException):
+                # Gateway indisponível ou resposta inválida: fica para a próxima execução
+                relatorio["erros"] += 1
+                continue
+            novo_status = STATUS_GATEWAY.get(resposta["status"], models.StatusPagamento.PENDENTE)
+            if novo_status == models.StatusPagamento.PENDENTE:
+                relatorio["sem_alteracao"] += 1
+            else:
+                mudancas[novo_status].append(pagamento)
+        relatorio["verificados"] += len(pagamentos)
+
+        if not mudancas:
+            continue
+        if aplicar:
+            async with session_factory() as db:
+                await _aplicar(db, mudancas, relatorio)
+                await db.commit()
+        else:
+            for novo_status, lista in mudancas.items():
+                relatorio["alterados"][f"{models.StatusPagamento.PENDENTE.value} -> {novo_status.value}"] += len(lista)
+
+    duracao = time.perf_counter() - inicio
+    relatorio.update(
+        alterados=dict(relatorio["alterados"]),
+        dry_run=not aplicar,
+        duracao_segundos=round(duracao, 3),
+        pagamentos_por_segundo=round(relatorio["verificados"] / duracao, 1) if duracao else 0.0
+    )
+    return relatorio
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Reconcilia os pagamentos pendentes com o MercadoPago")
+    parser.add_argument("--dry-run", action="store_true", help="apenas relata o que mudaria")
+    parser.add_argument("--limite", type=int, default=None, help="máximo de pagamentos verificados")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE)
+    parser.add_argument("--concorrencia", type=int, default=CONCORRENCIA)
+    args = parser.parse_args()
+
+    async def executar():
+        try:
+            return await reconciliar(
+                aplicar=not args.dry_run, limite=args.limite,
+                tamanho_lote=args.lote, concorrencia=args.concorrencia
+            )
+        finally:
+            await gateway.fechar()
+
+    print(json.dumps(asyncio.run(executar()), indent=2, ensure_ascii=False))
@@ -0,0 +1,210 @@
+"""
+Rollups de receita e de pagamentos para os relatórios (/reports).
+
+Duas tabelas pequenas, mantidas de forma incremental pelas próprias escritas,
+na mesma transação:
+
+- package_daily_rollup: por pacote e dia, as reservas criadas (e o valor
+  reservado) e os pagamentos confirmados, com a receita em USD;
+- currency_daily_rollup: por dia, moeda e status, a quantidade e o valor dos
+  pagamentos, na moeda original e em USD.
+
+As rotas não recalculam nada: registram só a diferença que a escrita provoca
+(reservas novas, um pagamento novo ou a mudança de status de um pagamento)
+com um INSERT ... ON CONFLICT DO UPDATE que soma os deltas às linhas
+existentes, um comando por tabela qualquer que seja o número de linhas. O
+valor em USD usa a taxa vigente na data do pagamento (currency_rates), que
+não muda depois, então tirar um pagamento de um status subtrai exatamente o
+que foi somado quando ele entrou.
+
+A ocupação das viagens já é mantida da mesma forma em trips.assentos_ocupados
+(seats.py) e é lida direto de trips.
+
+reconstruir() recalcula as duas tabelas do zero a partir de bookings e
+payments (migração, seed e correção de divergências):
+    python -m app.services.rollups
+"""
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, func, select
+
+from app.database.upsert import dialeto, stmt_upsert
+from app.models import models
+from app.services import currency_rates
+
+CENTAVOS = Decimal("0.01")
+TAMANHO_PARTICAO = 10000
+
+def _stmt_somar(nome_dialeto, tabela, chaves):
+    """INSERT que, se a linha já existir, soma os valores às colunas dela"""
+    return stmt_upsert(nome_dialeto, tabela, chaves, lambda novos: {
+        coluna.name: coluna + novos[coluna.name]
+        for coluna in tabela.c if coluna.name not in chaves
+    })
+
+# Dialeto -> (statement de package_daily_rollup, statement de currency_daily_rollup)
+_somar = {}
+
+def _stmts_somar(nome_dialeto):
+    if nome_dialeto not in _somar:
+        _somar[nome_dialeto] = (
+            _stmt_somar(nome_dialeto, models.RollupPacoteDia.__table__, ["package_id", "dia"]),
+            _stmt_somar(nome_dialeto, models.RollupMoedaDia.__table__, ["dia", "moeda_id", "status"]),
+        )
+    return _somar[nome_dialeto]
+
+def _dia(valor):
+    """date de func.date(): o SQLite devolve texto, os demais bancos um date"""
+    if isinstance(valor, str):
+        return date.fromisoformat(valor[:10])
+    if isinstance(valor, datetime):
+        return valor.date()
+    return valor
+
+class Deltas:
+    """Diferenças acumuladas para os rollups, gravadas com um comando por tabela"""
+    def __init__(self):
+        # (package_id, dia) -> [reservas, valor_reservado, pagamentos_confirmados, receita_usd]
+        self.pacotes = defaultdict(lambda: [0, Decimal(0), 0, Decimal(0)])
+        # (dia, moeda_id, status) -> [pagamentos, valor, valor_usd]
+        self.moedas = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+
+    def reservas(self, package_id, dia, quantidade, valor):
+        linha = self.pacotes[package_id, dia]
+        linha[0] += quantidade
+        linha[1] += valor
+
+    def pagamentos(self, package_id, moeda_id, status_pagamento, dia, quantidade, valor, valor_usd):
+        linha = self.moedas[dia, moeda_id, status_pagamento]
+        linha[0] += quantidade
+        linha[1] += valor
+        linha[2] += valor_usd
+        if status_pagamento == models.StatusPagamento.CONFIRMADO:
+            linha = self.pacotes[package_id, dia]
+            linha[2] += quantidade
+            linha[3] += valor_usd
+
+    def comandos(self, nome_dialeto):
+        """(statement, parâmetros) de cada tabela com alguma diferença"""
+        pacotes = [
+            {
+                "package_id": package_id, "dia": dia, "reservas": reservas,
+                "valor_reservado": valor_reservado, "pagamentos_confirmados": confirmados,
+                "receita_usd": receita_usd
+            }
+            for (package_id, dia), (reservas, valor_reservado, confirmados, receita_usd) in self.pacotes.items()
+            if reservas or valor_reservado or confirmados or receita_usd
+        ]
+        moedas = [
+            {
+                "dia": dia, "moeda_id": moeda_id, "status": status_pagamento,
+                "pagamentos": pagamentos, "valor": valor, "valor_usd": valor_usd
+            }
+            for (dia, moeda_id, status_pagamento), (pagamentos, valor, valor_usd) in self.moedas.items()
+            if pagamentos or valor or valor_usd
+        ]
+        somar_pacotes, somar_moedas = _stmts_somar(nome_dialeto)
+        return [(stmt, parametros) for stmt, parametros in ((somar_pacotes, pacotes), (somar_moedas, moedas)) if parametros]
+
+def _centavos(valor):
+    return Decimal(str(valor)).quantize(CENTAVOS)
+
+def estado_pagamento(pagamento, package_id):
+    """Contribuição de um pagamento (já com data_pagamento) aos rollups"""
+    return (
+        package_id, pagamento.moeda_id, models.StatusPagamento(pagamento.status),
+        _centavos(pagamento.valor), pagamento.data_pagamento
+    )
+
+async def _gravar(db, deltas):
+    for stmt, parametros in deltas.comandos(dialeto(db)):
+        await db.execute(stmt, parametros)
+
+async def registrar_reservas(db, reservas):
+    """Soma aos rollups as reservas criadas (já gravadas com flush)"""
+    deltas = Deltas()
+    for reserva in reservas:
+        deltas.reservas(reserva.package_id, reserva.data_reserva.date(), 1, _centavos(reserva.valor_total))
+    await _gravar(db, deltas)
+
+async def registrar_pagamentos(db, mudancas):
+    """
+    Aplica aos rollups cada par (estado anterior, estado atual) de
+    estado_pagamento(); o estado anterior é None para pagamentos novos
+    """
+    mudancas = [(antes, depois) for antes, depois in mudancas if antes != depois]
+    if not mudancas:
+        return
+    snapshot = await currency_rates.moedas.obter(db)
+    deltas = Deltas()
+    for antes, depois in mudancas:
+        for estado, sinal in ((antes, -1), (depois, 1)):
+            if estado is None:
+                continue
+            package_id, moeda_id, status_pagamento, valor, data_pagamento = estado
+            valor_usd = valor * snapshot.por_id[moeda_id].taxa_em(data_pagamento)
+            deltas.pagamentos(
+                package_id, moeda_id, status_pagamento, data_pagamento.date(),
+                sinal, sinal * valor, sinal * valor_usd
+            )
+    await _gravar(db, deltas)
+
+def reconstruir(conn):
+    """
+    Recalcula os rollups a partir de bookings e payments, numa conexão ou
+    sessão síncrona (na transação do chamador); retorna as linhas gravadas
+    """
+    conn.execute(delete(models.RollupPacoteDia))
+    conn.execute(delete(models.RollupMoedaDia))
+    snapshot = currency_rates.montar_snapshot(
+        conn.execute(currency_rates.stmt_moedas()).all(),
+        conn.execute(currency_rates.stmt_historico()).all()
+    )
+    deltas = Deltas()
+
+    dia_reserva = func.date(models.Reserva.data_reserva)
+    for package_id, dia, quantidade, valor in conn.execute(
+        select(models.Reserva.package_id, dia_reserva, func.count(), func.sum(models.Reserva.valor_total))
+        .filter(models.Reserva.data_reserva.isnot(None))
+        .group_by(models.Reserva.package_id, dia_reserva)
+    ):
+        deltas.reservas(package_id, _dia(dia), quantidade, _centavos(valor))
+
+    # Como em payment_reports: soma por intervalo da linha do tempo e converte uma vez por grupo
+    por_id = snapshot.por_id
+    grupos = defaultdict(lambda: [0, Decimal(0)])
+    for moeda_id, valor, data_pagamento, status_pagamento, package_id in conn.execute(
+        select(
+            models.Pagamento.moeda_id, models.Pagamento.valor, models.Pagamento.data_pagamento,
+            models.Pagamento.status, models.Reserva.package_id
+        )
+        .join(models.Reserva, models.Reserva.id == models.Pagamento.booking_id)
+        .filter(models.Pagamento.data_pagamento.isnot(None))
+        .execution_options(yield_per=TAMANHO_PARTICAO)
+    ):
+        grupo = grupos[
+            package_id, moeda_id, status_pagamento, data_pagamento.date(),
+            por_id[moeda_id].intervalo(data_pagamento)
+        ]
+        grupo[0] += 1
+        grupo[1] += valor
+    for (package_id, moeda_id, status_pagamento, dia, intervalo), (quantidade, valor) in grupos.items():
+        valor_usd = valor * por_id[moeda_id].taxa_no_intervalo(intervalo)
+        deltas.pagamentos(package_id, moeda_id, status_pagamento, dia, quantidade, valor, valor_usd)
+
+    comandos = deltas.comandos(dialeto(conn))
+    for stmt, parametros in comandos:
+        conn.execute(stmt, parametros)
+    return sum(len(parametros) for _, parametros in comandos)
+
+if __name__ == "__main__":
+    import time
+
+    from app.database.database import engine
+
+    inicio = time.perf_counter()
+    with engine.begin() as conn:
+        linhas = reconstruir(conn)
+    print(f"Rollups reconstruídos: {linhas} linhas em {time.perf_counter() - inicio:.2f}s")
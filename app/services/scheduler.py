@@ -0,0 +1,210 @@
+"""
+Agendador do ciclo de vida das viagens.
+
+Mantém um min-heap com os próximos prazos: a partida das viagens agendadas
+(AGENDADA -> EM_ANDAMENTO) e o retorno das viagens em andamento
+(EM_ANDAMENTO -> CONCLUIDA). A tarefa dorme até o prazo mais próximo, ou até
+ser avisada de uma viagem nova ou alterada, e aplica as transições vencidas
+em lote com os UPDATEs em conjunto de app/services/trip_status.py. Como em
+/trips/{id}/start, uma viagem sem passageiros não é iniciada: ela continua
+AGENDADA (cancelar é decisão do operador). Depois da partida ela não aceita
+mais retenções de vaga (ver seat_holds.py), então sai do agendador; só volta
+se um operador associar reservas a ela dentro da TOLERANCIA.
+
+O heap não é a fonte da verdade: ele é reconstruído a partir do banco na
+inicialização (consulta indexada por status e data de partida) e a cada
+JANELA, e só guarda as partidas dentro dessa janela. Partidas vencidas há mais
+de TOLERANCIA (agendador parado por mais tempo que isso) não são carregadas e
+ficam para o início manual. Antes de cada transição
+os prazos são conferidos de novo no banco, então entradas antigas (viagem
+remarcada, cancelada ou iniciada manualmente) são simplesmente descartadas.
+Como as transições são UPDATEs condicionais, mais de um processo executando o
+agendador não aplica a mesma transição duas vezes.
+"""
+import asyncio
+import heapq
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import or_, select
+
+from app.database.database import AsyncSessionLocal
+from app.models import models
+from app.services import trip_status
+
+logger = logging.getLogger(__name__)
+
+# Partidas carregadas no heap a cada reconstrução
+JANELA = timedelta(minutes=int(os.getenv("TRIP_SCHEDULER_WINDOW_MINUTES", "60")))
+# Atraso máximo com que uma partida vencida ainda é iniciada pelo agendador
+TOLERANCIA = timedelta(minutes=int(os.getenv("TRIP_SCHEDULER_GRACE_MINUTES", "60")))
+# Viagens por transação ao aplicar as transições vencidas
+TAMANHO_LOTE = 500
+# Espera antes de tentar de novo após um erro de banco
+ESPERA_APOS_ERRO = 30
+
+INICIAR = "iniciar"
+CONCLUIR = "concluir"
+RECARREGAR = "recarregar"
+
+def _prazo(viagem):
+    """Próximo prazo da viagem (e a ação correspondente), ou None"""
+    if viagem.status == models.StatusViagem.AGENDADA:
+        return viagem.data_partida, INICIAR
+    if viagem.status == models.StatusViagem.EM_ANDAMENTO:
+        return viagem.data_retorno, CONCLUIR
+    return None
+
+class AgendadorViagens:
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._heap = []
+        # Prazo vigente de cada viagem no heap; entradas com outro prazo são obsoletas
+        self._prazos = {}
+        self._horizonte = None
+        self._despertar = None
+        self._tarefa = None
+
+    def iniciar(self):
+        if self._tarefa is None:
+            # O evento pertence ao event loop em que o agendador executa
+            self._despertar = asyncio.Event()
+            self._tarefa = asyncio.create_task(self._executar())
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    def notificar(self, viagem):
+        """Avisa sobre uma viagem criada ou alterada (chamado pelas rotas após o commit)"""
+        if self._tarefa is None:
+            return
+        prazo = _prazo(viagem)
+        if prazo is None:
+            self._prazos.pop(viagem.id, None)
+            return
+        # Partidas além do horizonte entram na próxima reconstrução
+        if self._horizonte is not None and prazo[0] > self._horizonte:
+            self._prazos.pop(viagem.id, None)
+            return
+        self._agendar(viagem.id, *prazo)
+        self._despertar.set()
+
+    def _agendar(self, viagem_id, prazo, acao):
+        if self._prazos.get(viagem_id) == (prazo, acao):
+            return
+        self._prazos[viagem_id] = (prazo, acao)
+        heapq.heappush(self._heap, (prazo, viagem_id, acao))
+
+    async def _executar(self):
+        while True:
+            try:
+                if self._horizonte is None:
+                    await self._recarregar()
+                await self._dormir_ate_proximo_prazo()
+                await self._processar_vencidos()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha no agendador de viagens; nova tentativa em %ss", ESPERA_APOS_ERRO)
+                # Reconstrói o heap a partir do banco na próxima volta
+                self._horizonte = None
+                await asyncio.sleep(ESPERA_APOS_ERRO)
+
+    async def _recarregar(self):
+        """Reconstrói o heap a partir do banco (índice de status e data de partida)"""
+        agora = datetime.utcnow()
+        horizonte = agora + JANELA
+        async with self._session_factory() as db:
+            agendadas = (await db.scalars(
+                select(models.Viagem)
+                .filter(
+                    models.Viagem.status == models.StatusViagem.AGENDADA,
+                    models.Viagem.data_partida >= agora - TOLERANCIA,
+                    models.Viagem.data_partida <= horizonte,
+                    # Já partiu sem passageiros: a tentativa anterior não a iniciou
+                    or_(models.Viagem.data_partida > agora, models.Viagem.assentos_ocupados > 0)
+                )
+                .order_by(models.Viagem.data_partida)
+            )).all()
+            em_andamento = (await db.scalars(
+                select(models.Viagem).filter(models.Viagem.status == models.StatusViagem.EM_ANDAMENTO)
+            )).all()
+
+        # Entradas já existentes são mantidas: uma viagem notificada durante a
+        # consulta não se perde, e as repetidas são ignoradas por _agendar
+        for viagem in [*agendadas, *em_andamento]:
+            self._agendar(viagem.id, *_prazo(viagem))
+        self._horizonte = horizonte
+        heapq.heappush(self._heap, (horizonte, "", RECARREGAR))
+
+    async def _dormir_ate_proximo_prazo(self):
+        self._despertar.clear()
+        espera = (self._heap[0][0] - datetime.utcnow()).total_seconds() if self._heap else None
+        if espera is not None and espera <= 0:
+            return
+        try:
+            await asyncio.wait_for(self._despertar.wait(), timeout=espera)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _processar_vencidos(self):
+        agora = datetime.utcnow()
+        vencidas = set()
+        while self._heap and self._heap[0][0] <= agora:
+            prazo, viagem_id, acao = heapq.heappop(self._heap)
+            if acao == RECARREGAR:
+                # Fim da janela: a reconstrução traz as próximas partidas
+                self._horizonte = None
+            elif self._prazos.get(viagem_id) == (prazo, acao):
+                del self._prazos[viagem_id]
+                vencidas.add(viagem_id)
+
+        ids = list(vencidas)
+        for inicio in range(0, len(ids), TAMANHO_LOTE):
+            await self._aplicar_transicoes(ids[inicio:inicio + TAMANHO_LOTE], agora)
+
+    async def _aplicar_transicoes(self, viagem_ids, agora):
+        async with self._session_factory() as db:
+            # Os prazos são conferidos no banco: a viagem pode ter sido remarcada
+            viagens = (await db.scalars(
+                select(models.Viagem).filter(models.Viagem.id.in_(viagem_ids))
+            )).all()
+            iniciar, concluir = [], []
+            for viagem in viagens:
+                prazo = _prazo(viagem)
+                if prazo is None:
+                    continue
+                if prazo[0] > agora:
+                    self._agendar(viagem.id, *prazo)
+                elif prazo[1] == INICIAR:
+                    iniciar.append(viagem.id)
+                else:
+                    concluir.append(viagem.id)
+
+            iniciadas = await trip_status.iniciar_viagens(db, iniciar) if iniciar else []
+            concluidas = await trip_status.concluir_viagens(db, concluir) if concluir else []
+            await db.commit()
+
+            # As viagens iniciadas passam a aguardar o retorno
+            retornos = {viagem.id: viagem.data_retorno for viagem in viagens}
+            for viagem_id in iniciadas:
+                self._agendar(viagem_id, retornos[viagem_id], CONCLUIR)
+
+        # Viagens sem passageiros na partida ficam agendadas, como no início manual,
+        # e não voltam ao heap: o aviso sai uma vez por viagem
+        vazias = len(iniciar) - len(iniciadas)
+        if vazias:
+            logger.warning("Agendador de viagens: %d viagem(ns) sem passageiros na partida, mantida(s) agendada(s)", vazias)
+        if iniciadas or concluidas:
+            logger.info(
+                "Agendador de viagens: %d iniciada(s), %d concluída(s)", len(iniciadas), len(concluidas)
+            )
+
+agendador = AgendadorViagens()
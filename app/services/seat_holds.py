@@ -0,0 +1,234 @@
+"""
+Retenção de assentos durante o checkout.
+
+Uma reserva pode reter uma vaga de uma viagem entre a criação e a confirmação
+do pagamento. As retenções ficam na tabela seat_holds e o total por viagem em
+trips.assentos_retidos, alterado pelos mesmos UPDATEs condicionais de
+seats.py (ocupados + retidos nunca passam da capacidade). Assim a
+disponibilidade exibida é lida da própria linha da viagem, sem contar
+retenções.
+
+Quando a reserva passa a PAGO a retenção é convertida numa associação em
+trip_bookings (a vaga passa de retida para ocupada). Retenções vencidas são
+removidas pelo ExpiradorRetencoes em ordem de prazo (índice em expira_em) e,
+quando uma viagem parece cheia, também na hora para aquela viagem.
+"""
+import asyncio
+import logging
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, func, select, update
+
+from app.database.database import AsyncSessionLocal
+from app.models import models
+
+logger = logging.getLogger(__name__)
+
+# Validade de cada retenção
+TTL = timedelta(seconds=int(os.getenv("SEAT_HOLD_TTL_SECONDS", "900")))
+# Retenções removidas por transação
+TAMANHO_LOTE = 500
+# Espera antes de tentar de novo após um erro de banco
+ESPERA_APOS_ERRO = 30
+
+def stmt_reter_assento(viagem_id, agora):
+    """
+    UPDATE que retém uma vaga somente se ela couber na capacidade e a viagem
+    seguir agendada, com a partida ainda por vir
+    """
+    return (
+        update(models.Viagem)
+        .where(
+            models.Viagem.id == viagem_id,
+            models.Viagem.status == models.StatusViagem.AGENDADA,
+            models.Viagem.data_partida > agora,
+            models.Viagem.assentos_ocupados + models.Viagem.assentos_retidos + 1
+            <= models.Viagem.capacidade
+        )
+        .values(assentos_retidos=models.Viagem.assentos_retidos + 1)
+        .execution_options(synchronize_session=False)
+    )
+
+def stmt_liberar_retidos():
+    """UPDATE em lote (executemany) que devolve `quantidade` vagas retidas da viagem `viagem`"""
+    trips = models.Viagem.__table__
+    return (
+        update(trips)
+        .where(trips.c.id == bindparam("viagem"))
+        .values(assentos_retidos=trips.c.assentos_retidos - bindparam("quantidade"))
+    )
+
+async def _liberar_retidos(db, viagem_ids):
+    contagem = Counter(viagem_ids)
+    if contagem:
+        await db.execute(stmt_liberar_retidos(), [
+            {"viagem": viagem_id, "quantidade": quantidade}
+            for viagem_id, quantidade in contagem.items()
+        ])
+
+async def expirar_retencoes(db, agora=None, viagem_id=None):
+    """Remove até TAMANHO_LOTE retenções vencidas e devolve suas vagas; retorna quantas removeu"""
+    vencidas = (
+        select(models.RetencaoAssento.id)
+        .where(models.RetencaoAssento.expira_em <= (agora or datetime.utcnow()))
+        .order_by(models.RetencaoAssento.expira_em)
+        .limit(TAMANHO_LOTE)
+    )
+    if viagem_id is not None:
+        vencidas = vencidas.where(models.RetencaoAssento.viagem_id == viagem_id)
+    # RETURNING: só as vagas das linhas removidas por esta transação são devolvidas
+    viagem_ids = (await db.execute(
+        delete(models.RetencaoAssento)
+        .where(models.RetencaoAssento.id.in_(vencidas))
+        .returning(models.RetencaoAssento.viagem_id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+    await _liberar_retidos(db, viagem_ids)
+    return len(viagem_ids)
+
+def motivo_viagem_sem_retencao(viagem):
+    """Motivo pelo qual a viagem não aceita retenções de vaga, ou None"""
+    if viagem.status != models.StatusViagem.AGENDADA:
+        return f"Só é possível reter vagas em viagens com status AGENDADA, atual: {viagem.status}"
+    if viagem.data_partida <= datetime.utcnow():
+        return "Só é possível reter vagas antes da data de partida da viagem"
+    return None
+
+def motivo_retencao_invalida(viagem, reserva):
+    """Motivo pelo qual a reserva não pode reter vaga na viagem, ou None"""
+    motivo = motivo_viagem_sem_retencao(viagem)
+    if motivo:
+        return motivo
+    if reserva.status != models.StatusReserva.RESERVADO:
+        return "Só é possível reter vagas para reservas com status RESERVADO"
+    if reserva.package_id != viagem.pacote_id:
+        return "O pacote da reserva deve ser o mesmo da viagem"
+    return None
+
+async def reter_assento(db, viagem_id, reserva_id):
+    """
+    Retém uma vaga da viagem para a reserva; retorna a retenção ou None se não
+    houver vagas. O commit fica a cargo do chamador
+    """
+    agora = datetime.utcnow()
+    resultado = await db.execute(stmt_reter_assento(viagem_id, agora))
+    if resultado.rowcount != 1:
+        # A viagem pode estar "cheia" só de retenções vencidas ainda não removidas
+        if not await expirar_retencoes(db, agora, viagem_id=viagem_id):
+            return None
+        resultado = await db.execute(stmt_reter_assento(viagem_id, agora))
+        if resultado.rowcount != 1:
+            return None
+
+    retencao = models.RetencaoAssento(
+        viagem_id=viagem_id,
+        reserva_id=reserva_id,
+        expira_em=agora + TTL
+    )
+    db.add(retencao)
+    await db.flush()
+    return retencao
+
+async def _remover_retencao(db, reserva_id):
+    return (await db.execute(
+        delete(models.RetencaoAssento)
+        .where(models.RetencaoAssento.reserva_id == reserva_id)
+        .returning(models.RetencaoAssento.viagem_id)
+        .execution_options(synchronize_session=False)
+    )).scalar()
+
+async def liberar_retencao(db, reserva_id):
+    """Remove a retenção da reserva (se houver) e devolve a vaga à viagem"""
+    viagem_id = await _remover_retencao(db, reserva_id)
+    if viagem_id is not None:
+        await _liberar_retidos(db, [viagem_id])
+    return viagem_id
+
+async def converter_retencao(db, reserva_id):
+    """
+    Converte a retenção da reserva (se houver) em associação à viagem, na
+    transação do chamador. Chamado quando a reserva passa a PAGO; retorna o id
+    da viagem associada, ou None
+    """
+    viagem_id = await _remover_retencao(db, reserva_id)
+    if viagem_id is None:
+        return None
+
+    # A vaga já estava contada como retida: passa a ocupada, sem nova verificação
+    # de capacidade. Viagens que já partiram (mesmo se ainda agendadas, sem
+    # passageiros) ou foram canceladas só liberam a vaga
+    resultado = await db.execute(
+        update(models.Viagem)
+        .where(
+            models.Viagem.id == viagem_id,
+            models.Viagem.status == models.StatusViagem.AGENDADA,
+            models.Viagem.data_partida > datetime.utcnow()
+        )
+        .values(
+            assentos_retidos=models.Viagem.assentos_retidos - 1,
+            assentos_ocupados=models.Viagem.assentos_ocupados + 1
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != 1:
+        await _liberar_retidos(db, [viagem_id])
+        return None
+
+    await db.execute(models.viagem_reserva.insert().values(
+        viagem_id=viagem_id,
+        reserva_id=reserva_id,
+        data_associacao=datetime.utcnow()
+    ))
+    return viagem_id
+
+class ExpiradorRetencoes:
+    """
+    Tarefa que remove as retenções vencidas. Todas as retenções têm o mesmo
+    TTL, então uma retenção nova nunca vence antes das existentes: basta dormir
+    até o menor expira_em (lido pelo índice), limitado a um TTL
+    """
+    def __init__(self, session_factory=AsyncSessionLocal):
+        self._session_factory = session_factory
+        self._tarefa = None
+
+    def iniciar(self):
+        if self._tarefa is None:
+            self._tarefa = asyncio.create_task(self._executar())
+
+    async def parar(self):
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+            try:
+                await self._tarefa
+            except asyncio.CancelledError:
+                pass
+            self._tarefa = None
+
+    async def _executar(self):
+        while True:
+            try:
+                espera = await self._expirar_vencidas()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Falha ao expirar retenções de assento; nova tentativa em %ss", ESPERA_APOS_ERRO)
+                espera = ESPERA_APOS_ERRO
+            await asyncio.sleep(espera)
+
+    async def _expirar_vencidas(self):
+        """Remove as retenções vencidas e retorna os segundos até o próximo vencimento"""
+        async with self._session_factory() as db:
+            while True:
+                removidas = await expirar_retencoes(db)
+                await db.commit()
+                if removidas < TAMANHO_LOTE:
+                    break
+            proximo = await db.scalar(select(func.min(models.RetencaoAssento.expira_em)))
+
+        if proximo is None:
+            return TTL.total_seconds()
+        return min(max(0, (proximo - datetime.utcnow()).total_seconds()), TTL.total_seconds())
+
+expirador = ExpiradorRetencoes()
@@ -0,0 +1,67 @@
+"""
+Controle de ocupação das viagens.
+
+A ocupação fica desnormalizada em trips.assentos_ocupados e só é alterada por
+UPDATEs condicionais: o banco avalia a condição e o incremento no mesmo
+comando, então duas requisições concorrentes nunca ocupam a mesma vaga. As
+vagas retidas em checkout (trips.assentos_retidos, ver seat_holds.py) contam
+como indisponíveis.
+"""
+from sqlalchemy import func, select, update
+from app.models import models
+
+def stmt_ocupar_assentos(viagem_id, quantidade=1):
+    """UPDATE que ocupa `quantidade` vagas somente se todas couberem na capacidade"""
+    return (
+        update(models.Viagem)
+        .where(
+            models.Viagem.id == viagem_id,
+            models.Viagem.assentos_ocupados + models.Viagem.assentos_retidos + quantidade
+            <= models.Viagem.capacidade
+        )
+        .values(assentos_ocupados=models.Viagem.assentos_ocupados + quantidade)
+        .execution_options(synchronize_session=False)
+    )
+
+def stmt_liberar_assentos(viagem_id, quantidade=1):
+    return (
+        update(models.Viagem)
+        .where(
+            models.Viagem.id == viagem_id,
+            models.Viagem.assentos_ocupados >= quantidade
+        )
+        .values(assentos_ocupados=models.Viagem.assentos_ocupados - quantidade)
+        .execution_options(synchronize_session=False)
+    )
+
+def stmt_recontar_assentos():
+    """Recalcula o contador de todas as viagens a partir de trip_bookings"""
+    total = (
+        select(func.count())
+        .select_from(models.viagem_reserva)
+        .where(models.viagem_reserva.c.viagem_id == models.Viagem.id)
+        .scalar_subquery()
+    )
+    return update(models.Viagem).values(assentos_ocupados=total).execution_options(synchronize_session=False)
+
+async def ocupar_assentos(db, viagem_id, quantidade=1):
+    """Ocupa vagas na viagem; retorna False se não houver vagas suficientes"""
+    resultado = await db.execute(stmt_ocupar_assentos(viagem_id, quantidade))
+    return resultado.rowcount == 1
+
+async def liberar_assentos(db, viagem_id, quantidade=1):
+    resultado = await db.execute(stmt_liberar_assentos(viagem_id, quantidade))
+    return resultado.rowcount == 1
+
+async def alterar_capacidade(db, viagem_id, capacidade):
+    """Altera a capacidade somente se ela comportar os passageiros e as vagas retidas"""
+    resultado = await db.execute(
+        update(models.Viagem)
+        .where(
+            models.Viagem.id == viagem_id,
+            models.Viagem.assentos_ocupados + models.Viagem.assentos_retidos <= capacidade
+        )
+        .values(capacidade=capacidade)
+        .execution_options(synchronize_session=False)
+    )
+    return resultado.rowcount == 1
@@ -0,0 +1,43 @@
+"""
+Regras fiscais em memória.
+
+A tabela taxes tem poucas linhas e quase nunca muda: em vez de uma consulta
+por reserva ou cálculo, as regras ficam num dicionário por
+(pais_origem, pais_destino), invalidado por create_tax (ver app/cache.py).
+"""
+from sqlalchemy import select
+from app.cache import CacheLocal
+from app.models import models
+
+# Percentual aplicado quando não há regra para a combinação de países
+PERCENTUAL_PADRAO = 5.0
+# Destino das reservas de pacotes espaciais
+DESTINO_ESPACO = "Espaço"
+
+async def _carregar_regras(db):
+    linhas = (await db.execute(
+        select(models.Imposto.pais_origem, models.Imposto.pais_destino, models.Imposto.percentual)
+    )).all()
+    return {(origem, destino): float(percentual) for origem, destino, percentual in linhas}
+
+regras_fiscais = CacheLocal("taxes", _carregar_regras)
+
+async def percentual_imposto(db, pais_origem, pais_destino=DESTINO_ESPACO):
+    """Percentual da regra fiscal para a combinação de países (ou o padrão de 5%)"""
+    regras = await regras_fiscais.obter(db)
+    return regras.get((pais_origem, pais_destino), PERCENTUAL_PADRAO)
+
+def calcular_valores(valores, percentuais):
+    """
+    Imposto e total de cada valor com o percentual correspondente, em lote.
+    Mesma aritmética (float) usada nas reservas e no cálculo individual, para
+    que os resultados sejam idênticos
+    """
+    impostos = [valor * (percentual / 100) for valor, percentual in zip(valores, percentuais)]
+    totais = [valor + imposto for valor, imposto in zip(valores, impostos)]
+    return impostos, totais
+
+async def percentuais_imposto(db, pares):
+    """Percentuais de uma sequência de pares (pais_origem, pais_destino), com uma única leitura das regras"""
+    regras = await regras_fiscais.obter(db)
+    return [regras.get(par, PERCENTUAL_PADRAO) for par in pares]
@@ -0,0 +1,119 @@
+"""
+Transições de status das viagens com cascata para as reservas associadas.
+
+Cada transição executa dois UPDATEs na transação do chamador: um condicional
+nas viagens, que só muda as que ainda estiverem num dos status de origem (duas
+transições concorrentes não se sobrepõem), e um em conjunto nas reservas
+dessas viagens, sem carregá-las na sessão. O custo não depende do número de
+reservas em Python, só do índice de trip_bookings. O commit fica a cargo do
+chamador.
+
+O cancelamento também remove as retenções de assento (seat_holds) das viagens
+canceladas, zera trips.assentos_retidos e cancela as reservas retidas que
+ainda estavam em checkout (RESERVADO): a vaga que elas aguardavam deixou de
+existir, como a das reservas já associadas.
+
+As funções no plural atendem o agendador (app/services/scheduler.py), que
+aplica as transições em lote; as no singular atendem as rotas.
+"""
+from sqlalchemy import delete, select, update
+from app.models import models
+
+def stmt_atualizar_reservas(viagem_ids, status_reserva):
+    """UPDATE bookings ... WHERE id IN (SELECT reserva_id FROM trip_bookings WHERE viagem_id IN (...))"""
+    reservas_das_viagens = select(models.viagem_reserva.c.reserva_id).where(
+        models.viagem_reserva.c.viagem_id.in_(viagem_ids)
+    )
+    return (
+        update(models.Reserva)
+        .where(models.Reserva.id.in_(reservas_das_viagens))
+        .values(status=status_reserva)
+        .execution_options(synchronize_session=False)
+    )
+
+async def _transicionar(db, viagem_ids, origens, destino, status_reserva, *condicoes):
+    """Aplica a transição e retorna os ids das viagens que de fato mudaram de status"""
+    resultado = await db.execute(
+        update(models.Viagem)
+        .where(
+            models.Viagem.id.in_(viagem_ids),
+            models.Viagem.status.in_(origens),
+            *condicoes
+        )
+        .values(status=destino)
+        .returning(models.Viagem.id)
+        .execution_options(synchronize_session=False)
+    )
+    alteradas = list(resultado.scalars())
+    if alteradas:
+        await db.execute(stmt_atualizar_reservas(alteradas, status_reserva))
+    return alteradas
+
+async def _cancelar_retencoes(db, viagem_ids):
+    """Remove as retenções das viagens e cancela as reservas retidas ainda em checkout"""
+    reservas_retidas = (await db.execute(
+        delete(models.RetencaoAssento)
+        .where(models.RetencaoAssento.viagem_id.in_(viagem_ids))
+        .returning(models.RetencaoAssento.reserva_id)
+        .execution_options(synchronize_session=False)
+    )).scalars().all()
+    if not reservas_retidas:
+        return
+    # Todas as retenções dessas viagens foram removidas, e as linhas das viagens
+    # já estão travadas pelo UPDATE de status: o contador volta a zero
+    await db.execute(
+        update(models.Viagem)
+        .where(models.Viagem.id.in_(viagem_ids))
+        .values(assentos_retidos=0)
+        .execution_options(synchronize_session=False)
+    )
+    await db.execute(
+        update(models.Reserva)
+        .where(
+            models.Reserva.id.in_(reservas_retidas),
+            models.Reserva.status == models.StatusReserva.RESERVADO
+        )
+        .values(status=models.StatusReserva.CANCELADO)
+        .execution_options(synchronize_session=False)
+    )
+
+async def cancelar_viagens(db, viagem_ids):
+    """Cancela as viagens agendadas, suas reservas e as retenções de assento"""
+    alteradas = await _transicionar(
+        db, viagem_ids,
+        [models.StatusViagem.AGENDADA, models.StatusViagem.CANCELADA],
+        models.StatusViagem.CANCELADA,
+        models.StatusReserva.CANCELADO
+    )
+    if alteradas:
+        await _cancelar_retencoes(db, alteradas)
+    return alteradas
+
+async def iniciar_viagens(db, viagem_ids):
+    """Inicia as viagens agendadas com passageiros e embarca suas reservas"""
+    return await _transicionar(
+        db, viagem_ids,
+        [models.StatusViagem.AGENDADA],
+        models.StatusViagem.EM_ANDAMENTO,
+        models.StatusReserva.EMBARCADO,
+        models.Viagem.assentos_ocupados > 0
+    )
+
+async def concluir_viagens(db, viagem_ids):
+    """Conclui as viagens em andamento e suas reservas"""
+    return await _transicionar(
+        db, viagem_ids,
+        [models.StatusViagem.EM_ANDAMENTO],
+        models.StatusViagem.CONCLUIDA,
+        models.StatusReserva.CONCLUIDO
+    )
+
+# Uma viagem por vez; retornam False se o status atual não permitir a transição
+async def cancelar_viagem(db, viagem_id):
+    return bool(await cancelar_viagens(db, [viagem_id]))
+
+async def iniciar_viagem(db, viagem_id):
+    return bool(await iniciar_viagens(db, [viagem_id]))
+
+async def concluir_viagem(db, viagem_id):
+    return bool(await concluir_viagens(db, [viagem_id]))
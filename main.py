@@ -1,19 +1,54 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from app.database.database import engine, Base
-from app.routers import clientes, packages, bookings, medical_clearance, certifications, payments, currencies, taxes, trips
+from app.database.database import engine
+from app.database.migrations import aplicar_migracoes
+from app.idempotency import IdempotenciaMiddleware, expirador_chaves
+from app.services.payment_gateway import gateway
+from app.services.password_hashing import hasher
+from app.services.payment_inbox import processador_notificacoes
+from app.services.scheduler import agendador
+from app.services.seat_holds import expirador
+from app.routers import clientes, packages, bookings, medical_clearance, certifications, payments, currencies, taxes, trips, reports
 
-# Criar todas as tabelas no banco de dados
-Base.metadata.create_all(bind=engine)
+# Criar/atualizar as tabelas do banco de dados (migrações versionadas)
+aplicar_migracoes(engine)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Agendador das partidas e retornos das viagens (TRIP_SCHEDULER=0 desativa)
+    if os.getenv("TRIP_SCHEDULER", "1") != "0":
+        agendador.iniciar()
+    # Remoção das retenções de assento vencidas
+    expirador.iniciar()
+    # Remoção das Idempotency-Keys vencidas
+    expirador_chaves.iniciar()
+    # Processamento das notificações do MercadoPago gravadas pelo webhook
+    processador_notificacoes.iniciar()
+    # Processos do pool de hash de senhas (bcrypt)
+    hasher.iniciar()
+    yield
+    await hasher.parar()
+    await processador_notificacoes.parar()
+    await gateway.fechar()
+    await expirador_chaves.parar()
+    await expirador.parar()
+    await agendador.parar()
 
 # Inicializar a aplicação FastAPI
 app = FastAPI(
     title="Ad Astra API",
     description="API para sistema de turismo espacial",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Idempotency-Key nos POSTs de reservas e pagamentos. Adicionado antes do CORS
+# para ficar por dentro dele: as respostas repetidas também recebem os cabeçalhos CORS
+app.add_middleware(IdempotenciaMiddleware)
+
 # Configurar CORS
 app.add_middleware(
     CORSMiddleware,
@@ -33,6 +68,7 @@ app.include_router(payments.router)
 app.include_router(currencies.router)
 app.include_router(taxes.router)
 app.include_router(trips.router)
+app.include_router(reports.router)
 
 # Rota raiz
 @app.get("/")
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Compara a pilha síncrona (Session + threadpool) com a pilha assíncrona
+(AsyncSession + aiosqlite) nas rotas de catálogo, usando o mesmo banco populado.
+
+Uso:
+    python seed_database.py
+    python scripts/bench_async_vs_sync.py --requisicoes 2000 --concorrencia 200
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import List
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.orm import sessionmaker
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database.database import create_db_engine
+from app.models import models
+from app.schemas import schemas
+import main
+
+ROTAS = ["/packages/", "/trips/"]
+
+def criar_app_sincrona():
+    """Reproduz as rotas de catálogo como eram antes: def + Session no threadpool"""
+    # Mesmas configurações (PRAGMAs, pool) da aplicação, com uma conexão por thread
+    engine = create_db_engine(pool_size=40, max_overflow=0)
+    SessionSync = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    # A sessão é aberta dentro da rota, e não via dependência com yield: sob
+    # rajadas maiores que o threadpool (40 threads) o teardown das dependências
+    # síncronas deixa sessões sem fechar e o pool de conexões se esgota
+    app = FastAPI()
+
+    @app.get("/packages/", response_model=List[schemas.PacoteResponse])
+    def read_packages(skip: int = 0, limit: int = 100):
+        with SessionSync() as db:
+            return db.query(models.Pacote).offset(skip).limit(limit).all()
+
+    @app.get("/trips/", response_model=List[schemas.ViagemResponse])
+    def read_trips(skip: int = 0, limit: int = 100):
+        with SessionSync() as db:
+            viagens = db.query(models.Viagem).offset(skip).limit(limit).all()
+            # numero_passageiros depende das reservas: carregar antes de fechar a sessão
+            for viagem in viagens:
+                viagem.reservas
+            return viagens
+
+    return app
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+async def medir(app, rota, requisicoes, concorrencia):
+    latencias = []
+    falhas = 0
+    semaforo = asyncio.Semaphore(concorrencia)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def uma_requisicao():
+            nonlocal falhas
+            async with semaforo:
+                inicio = time.perf_counter()
+                resposta = await client.get(rota)
+                latencias.append(time.perf_counter() - inicio)
+                if resposta.status_code != 200:
+                    falhas += 1
+
+        # Aquecimento (conexões do pool, compilação das queries)
+        await asyncio.gather(*(uma_requisicao() for _ in range(min(50, requisicoes))))
+        latencias.clear()
+
+        inicio = time.perf_counter()
+        await asyncio.gather(*(uma_requisicao() for _ in range(requisicoes)))
+        duracao = time.perf_counter() - inicio
+
+    return {
+        "rps": requisicoes / duracao,
+        "p50_ms": percentil(latencias, 50) * 1000,
+        "p99_ms": percentil(latencias, 99) * 1000,
+        "falhas": falhas,
+    }
+
+async def executar(requisicoes, concorrencia):
+    pilhas = [("sync", criar_app_sincrona()), ("async", main.app)]
+    print(f"{'rota':<12} {'pilha':<6} {'req/s':>10} {'p50 (ms)':>10} {'p99 (ms)':>10} {'falhas':>7}")
+    for rota in ROTAS:
+        for nome, app in pilhas:
+            r = await medir(app, rota, requisicoes, concorrencia)
+            print(f"{rota:<12} {nome:<6} {r['rps']:>10.1f} {r['p50_ms']:>10.2f} {r['p99_ms']:>10.2f} {r['falhas']:>7}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requisicoes", type=int, default=2000)
+    parser.add_argument("--concorrencia", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(executar(args.requisicoes, args.concorrencia))
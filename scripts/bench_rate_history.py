@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Mede a normalização em USD de um volume grande de pagamentos, cada um pela
+taxa vigente na sua data (app/services/payment_reports.py), e confere o total
+com a mesma conversão calculada no próprio banco por uma subconsulta por
+linha (a taxa mais recente em currency_rate_history até a data do pagamento).
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/bench_rate_history.py --pagamentos 1000000 --mudancas 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MOEDAS = {"USD": 1.0, "EUR": 1.07, "BRL": 0.18, "JPY": 0.0067}
+LOTE_INSERT = 50000
+
+def popular(SessionLocal, models, pagamentos, mudancas):
+    """Moedas com `mudancas` taxas cada ao longo de um ano e pagamentos espalhados no período"""
+    inicio = datetime(2025, 1, 1)
+    periodo = timedelta(days=365).total_seconds()
+    with SessionLocal() as db:
+        cliente = models.Cliente(
+            nome="Cliente", email="cliente@bench.example.com", senha_hash="-",
+            data_nascimento=date(1990, 1, 1), documento_identidade="0",
+            telefone="0", pais="Brasil", endereco="-"
+        )
+        pacote = models.Pacote(
+            nome="Orbital", descricao="-", tipo=models.TipoPacote.ORBITAL,
+            preco=1000, disponibilidade=True
+        )
+        db.add_all([cliente, pacote])
+        db.flush()
+        reserva = models.Reserva(
+            cliente_id=cliente.id, package_id=pacote.id, valor_original=1000,
+            valor_imposto=0, valor_total=1000
+        )
+        db.add(reserva)
+        moeda_ids = []
+        for codigo, taxa in MOEDAS.items():
+            moeda = models.Moeda(nome=codigo, codigo=codigo, taxa_cambio=taxa)
+            db.add(moeda)
+            db.flush()
+            moeda_ids.append(moeda.id)
+            db.execute(models.HistoricoCambio.__table__.insert(), [
+                {
+                    "id": str(uuid.uuid4()), "moeda_id": moeda.id,
+                    "taxa_cambio": round(taxa * random.uniform(0.8, 1.2), 6),
+                    "vigente_desde": inicio + timedelta(seconds=periodo * i / mudancas)
+                }
+                for i in range(mudancas)
+            ])
+        db.flush()
+        restantes = pagamentos
+        while restantes:
+            quantidade = min(LOTE_INSERT, restantes)
+            db.execute(models.Pagamento.__table__.insert(), [
+                {
+                    "id": str(uuid.uuid4()), "booking_id": reserva.id,
+                    "valor": round(random.uniform(10, 5000), 2),
+                    "moeda_id": random.choice(moeda_ids),
+                    "status": random.choice(list(models.StatusPagamento)),
+                    "data_pagamento": inicio + timedelta(seconds=random.uniform(-86400, periodo))
+                }
+                for _ in range(quantidade)
+            ])
+            restantes -= quantidade
+        db.commit()
+
+def total_por_subconsulta(SessionLocal):
+    """Referência: a taxa de cada pagamento buscada no banco, uma subconsulta por linha"""
+    from sqlalchemy import text
+
+    with SessionLocal() as db:
+        return db.execute(text("""
+            SELECT SUM(p.valor * COALESCE(
+                (SELECT h.taxa_cambio FROM currency_rate_history h
+                 WHERE h.moeda_id = p.moeda_id AND h.vigente_desde <= p.data_pagamento
+                 ORDER BY h.vigente_desde DESC LIMIT 1),
+                (SELECT h.taxa_cambio FROM currency_rate_history h
+                 WHERE h.moeda_id = p.moeda_id ORDER BY h.vigente_desde LIMIT 1)
+            )) FROM payments p
+        """)).scalar()
+
+def main(pagamentos, mudancas):
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'bench.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from app.database.database import AsyncSessionLocal, SessionLocal, engine
+    from app.database.migrations import aplicar_migracoes
+    from app.models import models
+    from app.services import payment_reports
+
+    aplicar_migracoes(engine)
+    inicio = time.perf_counter()
+    popular(SessionLocal, models, pagamentos, mudancas)
+    print(f"{pagamentos} pagamentos e {mudancas} taxas por moeda criados em {time.perf_counter() - inicio:.1f}s")
+
+    async def normalizar():
+        async with AsyncSessionLocal() as db:
+            return await payment_reports.totais_em_usd(db)
+
+    inicio = time.perf_counter()
+    totais = asyncio.run(normalizar())
+    duracao = time.perf_counter() - inicio
+    print(f"{'linha do tempo em memória':<28} {duracao:>8.2f}s {pagamentos / duracao:>12,.0f} pagamentos/s  total {totais['total_usd']} USD")
+
+    referencia = total_por_subconsulta(SessionLocal)
+    print(f"{'conferência no banco':<28} {'':>9} {'':>25}  total {referencia:.2f} USD")
+
+    # O banco soma em ponto flutuante; a diferença aceitável é de arredondamento
+    if abs(Decimal(str(referencia)) - totais["total_usd"]) > Decimal("0.0001") * max(abs(totais["total_usd"]), 1):
+        print("ERRO: totais divergentes")
+        sys.exit(1)
+    print("OK: totais conferem")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pagamentos", type=int, default=200000)
+    parser.add_argument("--mudancas", type=int, default=365, help="taxas registradas por moeda")
+    args = parser.parse_args()
+    main(args.pagamentos, args.mudancas)
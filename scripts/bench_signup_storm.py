@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Mede uma rajada de cadastros (POST /clientes/, bcrypt) e o efeito dela na
+latência do catálogo (GET /packages/), comparando o hash no pool de processos
+dedicado (app/services/password_hashing.py) com o hash inline no threadpool
+da API, como era antes.
+
+Para cada modo: a latência do catálogo sem cadastros, e depois durante
+--duracao segundos de cadastros com --concorrencia-cadastros clientes
+simultâneos, com a vazão de cadastros aceitos, os recusados com 503 e os p50/p99.
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/bench_signup_storm.py --duracao 10 --concorrencia-cadastros 50
+    BCRYPT_ROUNDS=10 PASSWORD_HASH_WORKERS=2 python scripts/bench_signup_storm.py
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import httpx
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def percentil(valores, p):
+    if not valores:
+        return float("nan")
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[indice]
+
+def popular(SessionLocal, models):
+    with SessionLocal() as db:
+        db.add_all([
+            models.Pacote(
+                nome=f"Pacote {i}", descricao="-", tipo=models.TipoPacote.ORBITAL,
+                preco=1000 + i, disponibilidade=True
+            )
+            for i in range(20)
+        ])
+        db.commit()
+
+def dados_cliente():
+    return {
+        "nome": "Cliente", "email": f"{uuid.uuid4().hex}@bench.example.com", "senha": "senha-do-bench",
+        "data_nascimento": "1990-01-01", "documento_identidade": "0", "telefone": "0",
+        "pais": "Brasil", "endereco": "-"
+    }
+
+async def carga(client, metodo, rota, corpo, concorrencia, fim):
+    """Requisições em laço até `fim`; retorna as latências por status"""
+    por_status = {}
+
+    async def cliente_virtual():
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            resposta = await client.request(metodo, rota, json=corpo() if corpo else None)
+            por_status.setdefault(resposta.status_code, []).append(time.perf_counter() - inicio)
+
+    await asyncio.gather(*(cliente_virtual() for _ in range(concorrencia)))
+    return por_status
+
+def linha(nome, por_status, duracao, status_ok):
+    latencias = por_status.get(status_ok, [])
+    recusas = {codigo: len(valores) for codigo, valores in por_status.items() if codigo != status_ok}
+    print(
+        f"  {nome:<22} {len(latencias) / duracao:>8.1f} req/s"
+        f"  p50 {percentil(latencias, 50) * 1000:>8.1f}ms  p99 {percentil(latencias, 99) * 1000:>8.1f}ms"
+        f"  outros status: {recusas or '-'}"
+    )
+
+async def medir(app, modo, duracao, concorrencia_catalogo, concorrencia_cadastros):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        # Aquecimento (conexões do pool, compilação das queries, processos do hash)
+        await carga(client, "GET", "/packages/", None, concorrencia_catalogo, time.perf_counter() + 1)
+        await client.post("/clientes/", json=dados_cliente())
+
+        print(f"{modo}:")
+        catalogo = await carga(client, "GET", "/packages/", None, concorrencia_catalogo, time.perf_counter() + duracao)
+        linha("catálogo sem cadastros", catalogo, duracao, 200)
+
+        fim = time.perf_counter() + duracao
+        catalogo, cadastros = await asyncio.gather(
+            carga(client, "GET", "/packages/", None, concorrencia_catalogo, fim),
+            carga(client, "POST", "/clientes/", dados_cliente, concorrencia_cadastros, fim)
+        )
+        linha("catálogo na rajada", catalogo, duracao, 200)
+        linha("cadastros", cadastros, duracao, 201)
+
+def main(duracao, concorrencia_catalogo, concorrencia_cadastros):
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'bench.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.concurrency import run_in_threadpool
+
+    from app.database.database import SessionLocal
+    from app.models import models
+    from app.services import password_hashing
+    import main as api
+
+    popular(SessionLocal, models)
+
+    class HasherThreadpool(password_hashing.HasherSenhas):
+        """Como era antes: bcrypt no threadpool da API, sem limite de fila"""
+        async def _executar(self, funcao, *args):
+            return await run_in_threadpool(funcao, *args)
+
+    print(
+        f"BCRYPT_ROUNDS={password_hashing.ROUNDS} PASSWORD_HASH_WORKERS={password_hashing.WORKERS} "
+        f"PASSWORD_HASH_MAX_QUEUE={password_hashing.FILA_MAXIMA} CPUs={os.cpu_count()}"
+    )
+    # Um único event loop: o pool de conexões assíncrono fica preso ao loop que o criou
+    async def comparar():
+        pool = password_hashing.hasher
+        for modo, hasher in (("threadpool (antes)", HasherThreadpool()), ("pool de processos", pool)):
+            password_hashing.hasher = hasher
+            if hasher is pool:
+                hasher.iniciar()
+            await medir(api.app, modo, duracao, concorrencia_catalogo, concorrencia_cadastros)
+        await pool.parar()
+
+    asyncio.run(comparar())
+
+# O pool usa processos spawn, que importam este módulo: nada deve rodar fora do main
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duracao", type=float, default=10, help="segundos de cada medição")
+    parser.add_argument("--concorrencia-catalogo", type=int, default=10)
+    parser.add_argument("--concorrencia-cadastros", type=int, default=50)
+    args = parser.parse_args()
+    main(args.duracao, args.concorrencia_catalogo, args.concorrencia_cadastros)
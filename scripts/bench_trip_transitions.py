@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Mede a latência das transições de status das viagens (iniciar, concluir e
+cancelar) conforme cresce o número de reservas associadas. Com o UPDATE em
+conjunto das reservas nenhuma reserva é carregada na sessão: o custo que
+sobra é só o da escrita das linhas no banco.
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/bench_trip_transitions.py --tamanhos 10 100 1000 10000
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def criar_viagem(SessionLocal, models, pacote_id, cliente_id, tamanho):
+    """Cria uma viagem agendada com `tamanho` reservas pagas associadas"""
+    with SessionLocal() as db:
+        viagem_id = str(uuid.uuid4())
+        db.add(models.Viagem(
+            id=viagem_id, pacote_id=pacote_id, duracao_horas=2, capacidade=tamanho,
+            assentos_ocupados=tamanho, data_partida=datetime.utcnow() + timedelta(days=1)
+        ))
+        reservas = [
+            {
+                "id": str(uuid.uuid4()), "cliente_id": cliente_id, "package_id": pacote_id,
+                "status": models.StatusReserva.PAGO, "valor_original": 1000,
+                "valor_imposto": 0, "valor_total": 1000
+            }
+            for _ in range(tamanho)
+        ]
+        db.execute(models.Reserva.__table__.insert(), reservas)
+        db.execute(models.viagem_reserva.insert(), [
+            {"viagem_id": viagem_id, "reserva_id": r["id"], "data_associacao": datetime.utcnow()}
+            for r in reservas
+        ])
+        db.commit()
+    return viagem_id
+
+def cronometrar(client, metodo, rota):
+    inicio = time.perf_counter()
+    resposta = client.request(metodo, rota)
+    duracao = (time.perf_counter() - inicio) * 1000
+    if resposta.status_code >= 300:
+        raise RuntimeError(f"{metodo} {rota}: {resposta.status_code} {resposta.text}")
+    return duracao
+
+def main(tamanhos, repeticoes):
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'bench.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from app.database.database import SessionLocal
+    from app.database.migrations import aplicar_migracoes
+    from app.database.database import engine
+    from app.models import models
+    import main as app_main
+
+    aplicar_migracoes(engine)
+    with SessionLocal() as db:
+        pacote = models.Pacote(
+            nome="Orbital", descricao="-", tipo=models.TipoPacote.ORBITAL,
+            preco=1000, disponibilidade=True
+        )
+        cliente = models.Cliente(
+            nome="Cliente", email="cliente@bench.test", senha_hash="-",
+            data_nascimento=date(1990, 1, 1), documento_identidade="0",
+            telefone="0", pais="Brasil", endereco="-"
+        )
+        db.add_all([pacote, cliente])
+        db.commit()
+        pacote_id, cliente_id = pacote.id, cliente.id
+
+    client = TestClient(app_main.app)
+    print(f"{'reservas':>9} {'iniciar (ms)':>13} {'concluir (ms)':>14} {'cancelar (ms)':>14}")
+    for tamanho in tamanhos:
+        tempos = {"iniciar": [], "concluir": [], "cancelar": []}
+        for _ in range(repeticoes):
+            viagem_id = criar_viagem(SessionLocal, models, pacote_id, cliente_id, tamanho)
+            tempos["iniciar"].append(cronometrar(client, "PUT", f"/trips/{viagem_id}/start"))
+            tempos["concluir"].append(cronometrar(client, "PUT", f"/trips/{viagem_id}/complete"))
+            viagem_id = criar_viagem(SessionLocal, models, pacote_id, cliente_id, tamanho)
+            tempos["cancelar"].append(cronometrar(client, "DELETE", f"/trips/{viagem_id}"))
+        medianas = {nome: statistics.median(valores) for nome, valores in tempos.items()}
+        print(f"{tamanho:>9} {medianas['iniciar']:>13.2f} {medianas['concluir']:>14.2f} {medianas['cancelar']:>14.2f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10, 100, 1000, 10000])
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+    main(args.tamanhos, args.repeticoes)
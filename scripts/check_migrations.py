@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+Verifica a atualização de um banco criado pela versão original da API (antes
+das migrações versionadas) até o esquema atual.
+
+Cria num SQLite temporário as tabelas exatamente como a versão original as
+criava (Base.metadata.create_all, sem índices além das chaves), com alguns
+dados, aplica todas as migrações e compara o resultado com um banco novo
+migrado do zero: mesmas tabelas, colunas e índices. Também confere que os
+dados foram preservados, que os contadores derivados foram preenchidos e que
+uma migração que falha no meio não deixa nada gravado.
+
+Uso:
+    python scripts/check_migrations.py
+"""
+import os
+import sys
+import tempfile
+
+from sqlalchemy import inspect, text
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.database.database import create_db_engine
+from app.database import migrations
+
+# Esquema gerado pela versão original (create_all na inicialização)
+ESQUEMA_ORIGINAL = """
+CREATE TABLE clientes (
+    id VARCHAR NOT NULL, 
+    nome VARCHAR(255) NOT NULL, 
+    email VARCHAR(255) NOT NULL, 
+    senha_hash VARCHAR(255) NOT NULL, 
+    data_nascimento DATE NOT NULL, 
+    documento_identidade VARCHAR(100) NOT NULL, 
+    telefone VARCHAR(20) NOT NULL, 
+    pais VARCHAR(100) NOT NULL, 
+    endereco TEXT NOT NULL, 
+    status_medico VARCHAR(9), 
+    certificacao_status VARCHAR(9), 
+    data_cadastro DATETIME, 
+    ultima_atualizacao DATETIME, 
+    PRIMARY KEY (id), 
+    UNIQUE (email)
+);
+CREATE TABLE packages (
+    id VARCHAR NOT NULL, 
+    nome VARCHAR(255) NOT NULL, 
+    descricao TEXT NOT NULL, 
+    tipo VARCHAR(16) NOT NULL, 
+    preco DECIMAL(10, 2) NOT NULL, 
+    disponibilidade BOOLEAN, 
+    PRIMARY KEY (id)
+);
+CREATE TABLE currencies (
+    id VARCHAR NOT NULL, 
+    nome VARCHAR(100) NOT NULL, 
+    codigo VARCHAR(10) NOT NULL, 
+    taxa_cambio DECIMAL(10, 6) NOT NULL, 
+    PRIMARY KEY (id), 
+    UNIQUE (codigo)
+);
+CREATE TABLE taxes (
+    id VARCHAR NOT NULL, 
+    pais_origem VARCHAR(100) NOT NULL, 
+    pais_destino VARCHAR(100) NOT NULL, 
+    percentual DECIMAL(5, 2) NOT NULL, 
+    descricao TEXT, 
+    PRIMARY KEY (id)
+);
+CREATE TABLE bookings (
+    id VARCHAR NOT NULL, 
+    cliente_id VARCHAR NOT NULL, 
+    package_id VARCHAR NOT NULL, 
+    data_reserva DATETIME, 
+    status VARCHAR(9), 
+    valor_original DECIMAL(10, 2) NOT NULL, 
+    valor_imposto DECIMAL(10, 2) NOT NULL, 
+    valor_total DECIMAL(10, 2) NOT NULL, 
+    assento VARCHAR(20), 
+    PRIMARY KEY (id), 
+    FOREIGN KEY(cliente_id) REFERENCES clientes (id), 
+    FOREIGN KEY(package_id) REFERENCES packages (id)
+);
+CREATE TABLE medical_clearance (
+    id VARCHAR NOT NULL, 
+    cliente_id VARCHAR NOT NULL, 
+    aprovado BOOLEAN, 
+    detalhes TEXT, 
+    data_verificacao DATETIME, 
+    PRIMARY KEY (id), 
+    FOREIGN KEY(cliente_id) REFERENCES clientes (id)
+);
+CREATE TABLE certifications (
+    id VARCHAR NOT NULL, 
+    cliente_id VARCHAR NOT NULL, 
+    descricao TEXT NOT NULL, 
+    concluida BOOLEAN, 
+    data_certificacao DATETIME, 
+    PRIMARY KEY (id), 
+    FOREIGN KEY(cliente_id) REFERENCES clientes (id)
+);
+CREATE TABLE trips (
+    id VARCHAR NOT NULL, 
+    pacote_id VARCHAR NOT NULL, 
+    data_partida DATETIME NOT NULL, 
+    duracao_horas INTEGER NOT NULL, 
+    descricao TEXT, 
+    status VARCHAR(12), 
+    capacidade INTEGER, 
+    data_criacao DATETIME, 
+    data_atualizacao DATETIME, 
+    PRIMARY KEY (id), 
+    FOREIGN KEY(pacote_id) REFERENCES packages (id)
+);
+CREATE TABLE trip_bookings (
+    viagem_id VARCHAR NOT NULL, 
+    reserva_id VARCHAR NOT NULL, 
+    assento VARCHAR(20), 
+    data_associacao DATETIME, 
+    PRIMARY KEY (viagem_id, reserva_id), 
+    FOREIGN KEY(viagem_id) REFERENCES trips (id), 
+    FOREIGN KEY(reserva_id) REFERENCES bookings (id)
+);
+CREATE TABLE payments (
+    id VARCHAR NOT NULL, 
+    booking_id VARCHAR NOT NULL, 
+    valor DECIMAL(10, 2) NOT NULL, 
+    moeda_id VARCHAR NOT NULL, 
+    status VARCHAR(10), 
+    data_pagamento DATETIME, 
+    PRIMARY KEY (id), 
+    FOREIGN KEY(booking_id) REFERENCES bookings (id), 
+    FOREIGN KEY(moeda_id) REFERENCES currencies (id)
+);
+"""
+
+DADOS_ORIGINAIS = """
+INSERT INTO clientes (id, nome, email, senha_hash, data_nascimento, documento_identidade, telefone, pais, endereco, status_medico, certificacao_status)
+    VALUES ('c1', 'Cliente', 'cliente@example.com', '-', '1990-01-01', '1', '1', 'Brasil', '-', 'APROVADO', 'CONCLUIDA');
+INSERT INTO packages (id, nome, descricao, tipo, preco, disponibilidade) VALUES ('p1', 'Orbital', '-', 'ORBITAL', 1000, 1);
+INSERT INTO currencies (id, nome, codigo, taxa_cambio) VALUES ('m1', 'Real', 'BRL', 0.18);
+INSERT INTO bookings (id, cliente_id, package_id, data_reserva, status, valor_original, valor_imposto, valor_total)
+    VALUES ('r1', 'c1', 'p1', '2025-01-10 10:00:00', 'PAGO', 1000, 100, 1100);
+INSERT INTO trips (id, pacote_id, data_partida, duracao_horas, status, capacidade)
+    VALUES ('v1', 'p1', '2030-01-01 00:00:00', 4, 'AGENDADA', 10);
+INSERT INTO trip_bookings (viagem_id, reserva_id) VALUES ('v1', 'r1');
+INSERT INTO payments (id, booking_id, valor, moeda_id, status, data_pagamento)
+    VALUES ('g1', 'r1', 6111.11, 'm1', 'CONFIRMADO', '2025-01-10 11:00:00');
+"""
+
+def esquema(db_engine):
+    """Tabelas -> (colunas, índices com suas colunas e unicidade)"""
+    inspetor = inspect(db_engine)
+    return {
+        tabela: (
+            sorted(coluna["name"] for coluna in inspetor.get_columns(tabela)),
+            sorted(
+                (indice["name"], tuple(indice["column_names"]), bool(indice["unique"]))
+                for indice in inspetor.get_indexes(tabela)
+            ),
+        )
+        for tabela in inspetor.get_table_names()
+    }
+
+def diferencas(atualizado, novo):
+    erros = []
+    for tabela in sorted(set(atualizado) | set(novo)):
+        if tabela not in atualizado:
+            erros.append(f"{tabela}: tabela ausente no banco atualizado")
+        elif tabela not in novo:
+            erros.append(f"{tabela}: tabela a mais no banco atualizado")
+        elif atualizado[tabela] != novo[tabela]:
+            (colunas_a, indices_a), (colunas_n, indices_n) = atualizado[tabela], novo[tabela]
+            for nome, a, n in (("colunas", colunas_a, colunas_n), ("índices", indices_a, indices_n)):
+                if a != n:
+                    erros.append(f"{tabela}: {nome} faltando {sorted(set(n) - set(a))}, a mais {sorted(set(a) - set(n))}")
+    return erros
+
+def conferir_dados(db_engine):
+    erros = []
+    with db_engine.connect() as conn:
+        consultas = {
+            "reserva preservada": ("SELECT valor_total FROM bookings WHERE id = 'r1'", 1100),
+            "assentos ocupados recontados": ("SELECT assentos_ocupados FROM trips WHERE id = 'v1'", 1),
+            "histórico de câmbio iniciado": ("SELECT COUNT(*) FROM currency_rate_history WHERE moeda_id = 'm1'", 1),
+            "rollup de reservas": ("SELECT reservas FROM package_daily_rollup WHERE package_id = 'p1'", 1),
+            "rollup de pagamentos": ("SELECT pagamentos FROM currency_daily_rollup WHERE moeda_id = 'm1'", 1),
+        }
+        for nome, (sql, esperado) in consultas.items():
+            valor = conn.execute(text(sql)).scalar()
+            if valor != esperado:
+                erros.append(f"{nome}: esperado {esperado}, obtido {valor}")
+    return erros
+
+def conferir_falha_atomica(db_engine):
+    """Uma migração que falha depois de um DDL não pode deixar o DDL gravado"""
+    versao = max(v for v, _, _ in migrations.MIGRACOES) + 1
+
+    def quebrada(conn):
+        conn.exec_driver_sql("CREATE TABLE migracao_quebrada (id INTEGER)")
+        conn.exec_driver_sql("ALTER TABLE trips ADD COLUMN coluna_quebrada INTEGER")
+        raise RuntimeError("falha simulada")
+
+    migrations.MIGRACOES.append((versao, "Migração com falha (verificação)", quebrada))
+    try:
+        migrations.aplicar_migracoes(db_engine)
+        return ["a migração com falha foi registrada como aplicada"]
+    except RuntimeError:
+        pass
+    finally:
+        migrations.MIGRACOES.remove((versao, "Migração com falha (verificação)", quebrada))
+
+    erros = []
+    inspetor = inspect(db_engine)
+    if "migracao_quebrada" in inspetor.get_table_names():
+        erros.append("a tabela criada pela migração com falha ficou no banco")
+    if "coluna_quebrada" in {coluna["name"] for coluna in inspetor.get_columns("trips")}:
+        erros.append("a coluna criada pela migração com falha ficou no banco")
+    with db_engine.connect() as conn:
+        if versao in migrations.versoes_aplicadas(conn):
+            erros.append("a versão da migração com falha foi registrada")
+    return erros
+
+def main():
+    with tempfile.TemporaryDirectory() as diretorio:
+        antigo = create_db_engine(f"sqlite:///{os.path.join(diretorio, 'original.db')}")
+        novo = create_db_engine(f"sqlite:///{os.path.join(diretorio, 'novo.db')}")
+        with antigo.begin() as conn:
+            for comando in (ESQUEMA_ORIGINAL + DADOS_ORIGINAIS).split(";"):
+                if comando.strip():
+                    conn.exec_driver_sql(comando)
+
+        erros = []
+        try:
+            aplicadas = migrations.aplicar_migracoes(antigo)
+            print(f"Banco original atualizado: migrações {', '.join(map(str, aplicadas))}")
+        except Exception as e:
+            erros.append(f"falha ao atualizar o banco original: {e}")
+        migrations.aplicar_migracoes(novo)
+
+        if not erros:
+            erros += diferencas(esquema(antigo), esquema(novo))
+            erros += conferir_dados(antigo)
+            erros += conferir_falha_atomica(antigo)
+        antigo.dispose()
+        novo.dispose()
+
+    if erros:
+        for erro in erros:
+            print(f"FALHA: {erro}")
+        return 1
+    print("OK: banco original atualizado com o mesmo esquema de um banco novo")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
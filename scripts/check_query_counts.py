@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Verifica quantos comandos SQL cada rota executa. O número deve ser constante,
+independente do tamanho da página ou do lote (sem N+1 na serialização nem
+uma query por item).
+Falha (código de saída 1) se alguma rota exceder o orçamento de queries.
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/check_query_counts.py
+"""
+import os
+import sys
+import tempfile
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+VIAGENS = 120
+RESERVAS_POR_VIAGEM = 3
+
+MANIFESTO = 110  # reservas pagas, ainda sem viagem, para a importação em lote
+
+def orcamento(dados):
+    """(método, rota, corpo, máximo de comandos SQL por chamada)"""
+    manifesto = [{"reserva_id": r, "assento": f"{i}A"} for i, r in enumerate(dados["manifesto"])]
+    rota_lote = f"/trips/{dados['viagem_manifesto']}/bookings:bulk"
+    return [
+        ("GET", "/trips/?limit=5", None, 1),
+        ("GET", "/trips/?limit=100", None, 1),
+        ("GET", "/bookings/search?limit=100", None, 1),
+        ("GET", f"/bookings/search?cliente_id={dados['cliente_aprovado']}&status=Pago", None, 1),
+        ("GET", "/payments/search?limit=100", None, 1),
+        # Detalhes: relacionamentos declarados nos schemas (N:1 no JOIN, coleções via IN)
+        ("GET", f"/trips/{dados['viagem_manifesto']}", None, 2),
+        ("GET", f"/bookings/{dados['manifesto'][0]}", None, 3),
+        # viagem, reservas + clientes, associações, assentos, vagas, INSERT, UPDATE
+        ("POST", rota_lote, manifesto[:10], 7),
+        ("POST", rota_lote, manifesto[10:], 7),
+        # Regras fiscais em memória: só a primeira chamada consulta o banco
+        ("POST", "/taxes/api/imposto?pais_origem=Brasil&pais_destino=Espaço&valor=100", None, 1),
+        ("POST", "/taxes/api/imposto?pais_origem=Brasil&pais_destino=Espaço&valor=100", None, 0),
+        ("POST", "/taxes/api/imposto/lote", {"itens": [
+            {"pais_origem": pais, "pais_destino": "Espaço", "valor": 100.0 + i}
+            for i, pais in enumerate(["Brasil", "Japão", "Marte"] * 500)
+        ]}, 0),
+        # Tabela de preços: a primeira chamada carrega pacotes, regras e moedas
+        ("GET", "/packages/prices?pais=Brasil&moeda=BRL", None, 3),
+        ("GET", "/packages/prices?pais=Brasil&moeda=BRL", None, 0),
+        # reserva, INSERT, rollup e releitura do pagamento: a moeda vem do snapshot em memória
+        ("POST", "/payments/", {"booking_id": dados["manifesto"][0], "valor": "100.00", "moeda_id": dados["moeda"]}, 4),
+        # cliente, pacote, INSERT, rollup e releitura da reserva (sem consulta de imposto)
+        ("POST", "/bookings/", {"cliente_id": dados["cliente_aprovado"], "package_id": dados["pacote"]}, 5),
+        # clientes, pacotes, INSERT de várias linhas, rollup e releitura, qualquer que seja o tamanho do grupo
+        ("POST", "/bookings/batch", [
+            {"cliente_id": dados["cliente_aprovado"], "package_id": dados["pacote"], "assento": f"{i}B"}
+            for i in range(40)
+        ], 5),
+        # Relatórios: uma consulta aos rollups ou aos contadores das viagens
+        ("GET", "/reports/revenue", None, 1),
+        ("GET", "/reports/payments-by-currency", None, 1),
+        ("GET", "/reports/trips/load-factor?limit=500", None, 1),
+    ]
+
+def popular(SessionLocal, models):
+    from app.services.seats import stmt_recontar_assentos
+
+    with SessionLocal() as db:
+        pacote = models.Pacote(
+            id=str(uuid.uuid4()), nome="Orbital", descricao="-",
+            tipo=models.TipoPacote.ORBITAL, preco=1000, disponibilidade=True
+        )
+        cliente = models.Cliente(
+            id=str(uuid.uuid4()), nome="Cliente", email="cliente@contagem.example.com",
+            senha_hash="-", data_nascimento=date(1990, 1, 1), documento_identidade="0",
+            telefone="0", pais="Brasil", endereco="-"
+        )
+        moeda = models.Moeda(id=str(uuid.uuid4()), nome="Real", codigo="BRL", taxa_cambio=0.18)
+        db.add_all([pacote, cliente, moeda])
+        for i in range(VIAGENS):
+            viagem = models.Viagem(
+                id=str(uuid.uuid4()), pacote_id=pacote.id, duracao_horas=2,
+                capacidade=RESERVAS_POR_VIAGEM + 1,
+                data_partida=datetime.utcnow() + timedelta(days=i + 1)
+            )
+            db.add(viagem)
+            for _ in range(RESERVAS_POR_VIAGEM):
+                reserva = models.Reserva(
+                    id=str(uuid.uuid4()), cliente_id=cliente.id, package_id=pacote.id,
+                    status=models.StatusReserva.PAGO, valor_original=1000,
+                    valor_imposto=0, valor_total=1000
+                )
+                db.add(reserva)
+                db.flush()
+                db.execute(models.viagem_reserva.insert().values(
+                    viagem_id=viagem.id, reserva_id=reserva.id
+                ))
+        aprovado = models.Cliente(
+            id=str(uuid.uuid4()), nome="Aprovado", email="aprovado@contagem.example.com",
+            senha_hash="-", data_nascimento=date(1990, 1, 1), documento_identidade="0",
+            telefone="0", pais="Brasil", endereco="-",
+            status_medico=models.StatusMedico.APROVADO,
+            certificacao_status=models.CertificacaoStatus.CONCLUIDA
+        )
+        viagem_manifesto = models.Viagem(
+            id=str(uuid.uuid4()), pacote_id=pacote.id, duracao_horas=2,
+            capacidade=MANIFESTO, data_partida=datetime.utcnow() + timedelta(days=1)
+        )
+        manifesto = [
+            models.Reserva(
+                id=str(uuid.uuid4()), cliente_id=aprovado.id, package_id=pacote.id,
+                status=models.StatusReserva.PAGO, valor_original=1000,
+                valor_imposto=0, valor_total=1000
+            )
+            for _ in range(MANIFESTO)
+        ]
+        db.add_all([aprovado, viagem_manifesto, *manifesto])
+        db.execute(stmt_recontar_assentos())
+        db.commit()
+        return {
+            "pacote": pacote.id,
+            "moeda": moeda.id,
+            "cliente_aprovado": aprovado.id,
+            "viagem_manifesto": viagem_manifesto.id,
+            "manifesto": [reserva.id for reserva in manifesto],
+        }
+
+@contextmanager
+def contar_comandos(db_engine, com_parametros=False):
+    """Registra os comandos SQL enviados ao banco (com os parâmetros, se pedido)"""
+    from sqlalchemy import event
+
+    comandos = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        comandos.append((statement, parameters) if com_parametros else statement)
+
+    event.listen(db_engine, "before_cursor_execute", registrar)
+    try:
+        yield comandos
+    finally:
+        event.remove(db_engine, "before_cursor_execute", registrar)
+
+def main():
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'counts.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from fastapi.testclient import TestClient
+    from app.database.database import SessionLocal, async_engine
+    from app.models import models
+    import main as app_main
+
+    dados = popular(SessionLocal, models)
+    client = TestClient(app_main.app)
+
+    falhas = 0
+    for metodo, rota, corpo, maximo in orcamento(dados):
+        with contar_comandos(async_engine.sync_engine) as comandos:
+            resposta = client.request(metodo, rota, json=corpo)
+        ok = resposta.status_code in (200, 201) and len(comandos) <= maximo
+        falhas += not ok
+        print(f"[{'ok' if ok else 'FALHA':>5}] {metodo} {rota}: {len(comandos)} comando(s) SQL (máximo {maximo})")
+        if not ok:
+            for comando in comandos:
+                print(f"          {' '.join(comando.split())[:120]}")
+
+    return 1 if falhas else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Verifica, via EXPLAIN QUERY PLAN, que as consultas quentes usam índices.
+
+As consultas não são reescritas aqui: o script executa as rotas e as tarefas
+de fundo (agendador, expiradores, processador de notificações) sobre os dados
+de scripts/check_query_counts.py, registra o SQL que elas enviam ao banco e
+roda EXPLAIN QUERY PLAN em cada comando, com os parâmetros registrados. Assim
+uma rota que perde um filtro indexado ou muda a ordem do keyset falha aqui.
+
+Falha (código de saída 1) quando algum comando recorre a uma varredura
+completa de tabela ("SCAN <tabela>" sem índice) que a etapa não declara como
+esperada (carga de caches em memória e listagens com OFFSET). As etapas
+paginadas por cursor também falham se precisarem ordenar o resultado
+("USE TEMP B-TREE FOR ORDER BY"): a página deve ser lida na ordem do índice.
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/check_query_plans.py
+"""
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.check_query_counts import contar_comandos, popular
+
+# Varredura completa: "SCAN bookings" (sem "USING INDEX"/"USING COVERING INDEX")
+VARREDURA_COMPLETA = re.compile(r"^SCAN (\w+)$")
+ORDENACAO = re.compile(r"^USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY$")
+EXPLICAVEL = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|WITH)\b", re.IGNORECASE)
+
+# Caches em memória (regras fiscais, moedas, pacotes): a carga lê a tabela inteira
+CACHES = {"taxes", "currencies", "currency_rate_history", "packages"}
+
+def preparar(SessionLocal, models, dados):
+    """Reserva aguardando pagamento e aprovação médica, além dos dados da contagem"""
+    with SessionLocal() as db:
+        reserva = models.Reserva(
+            id=str(uuid.uuid4()), cliente_id=dados["cliente_aprovado"], package_id=dados["pacote"],
+            status=models.StatusReserva.RESERVADO, valor_original=1000, valor_imposto=0, valor_total=1000
+        )
+        aprovacao = models.AprovacaoMedica(cliente_id=dados["cliente_aprovado"], aprovado=True, detalhes="-")
+        db.add_all([reserva, aprovacao])
+        db.commit()
+        dados["reserva_pendente"] = reserva.id
+
+def rotas(dados):
+    """(método, rota, corpo, tabelas com varredura esperada, paginada por cursor)"""
+    from app.pagination import codificar_cursor
+
+    agora = datetime.utcnow()
+    cursor = codificar_cursor(agora, "x")
+    periodo = f"de={(agora - timedelta(days=30)).isoformat()}&{{}}_ate={agora.isoformat()}"
+    cliente = dados["cliente_aprovado"]
+    viagem = dados["viagem_manifesto"]
+    return [
+        ("GET", "/trips/?limit=5", None, {"trips"}, False),
+        ("GET", "/trips/search", None, set(), True),
+        ("GET", f"/trips/search?cursor={cursor}", None, set(), True),
+        ("GET", f"/trips/search?status=Agendada&cursor={cursor}", None, set(), True),
+        ("GET", f"/trips/search?status=Agendada&partida_{periodo.format('partida')}&cursor={cursor}", None, set(), True),
+        ("GET", "/trips/search?tipo=Orbital&vagas_minimas=2", None, set(), True),
+        ("GET", f"/trips/{viagem}", None, set(), False),
+        ("GET", f"/bookings/search?cursor={cursor}", None, set(), True),
+        ("GET", f"/bookings/search?cliente_id={cliente}&cursor={cursor}", None, set(), True),
+        ("GET", f"/bookings/search?package_id={dados['pacote']}&reserva_{periodo.format('reserva')}", None, set(), True),
+        ("GET", f"/bookings/search?status=Pago&cursor={cursor}", None, set(), True),
+        ("GET", f"/bookings/{dados['manifesto'][0]}", None, set(), False),
+        ("GET", f"/payments/search?cursor={cursor}", None, set(), True),
+        ("GET", f"/payments/search?booking_id={dados['manifesto'][0]}&cursor={cursor}", None, set(), True),
+        ("GET", f"/payments/search?status=Confirmado&pagamento_{periodo.format('pagamento')}&cursor={cursor}", None, set(), True),
+        ("GET", f"/payments/totals?pagamento_{periodo.format('pagamento')}", None, CACHES, False),
+        ("GET", f"/medical_clearance/{cliente}", None, set(), False),
+        ("GET", f"/certifications/{cliente}", None, set(), False),
+        ("GET", "/reports/revenue", None, set(), False),
+        ("GET", "/reports/payments-by-currency", None, CACHES, False),
+        ("GET", "/reports/trips/load-factor?status=Agendada", None, set(), False),
+        ("POST", "/taxes/api/imposto?pais_origem=Brasil&pais_destino=Espaço&valor=100", None, CACHES, False),
+        ("GET", "/packages/prices?pais=Brasil&moeda=BRL", None, CACHES, False),
+        ("POST", "/clientes/", {
+            "nome": "Cliente", "email": "novo@planos.example.com", "senha": "senha",
+            "data_nascimento": "1990-01-01", "documento_identidade": "0", "telefone": "0",
+            "pais": "Brasil", "endereco": "-"
+        }, set(), False),
+        ("POST", "/currencies/", {"nome": "Iene", "codigo": "JPY", "taxa_cambio": "0.0067"}, CACHES, False),
+        ("POST", "/bookings/", {"cliente_id": cliente, "package_id": dados["pacote"], "viagem_id": viagem}, CACHES, False),
+        ("POST", f"/trips/{viagem}/holds", {"reserva_id": dados["reserva_pendente"]}, set(), False),
+        ("POST", "/payments/", {"booking_id": dados["reserva_pendente"], "valor": "100.00", "moeda_id": dados["moeda"]}, CACHES, False),
+        ("POST", f"/trips/{viagem}/bookings:bulk", [
+            {"reserva_id": reserva, "assento": f"{i}A"} for i, reserva in enumerate(dados["manifesto"][:10])
+        ], set(), False),
+    ]
+
+def tarefas(dados):
+    """Tarefas de fundo, fora das rotas (nome, função assíncrona, tabelas com varredura esperada)"""
+    from app.database.database import AsyncSessionLocal
+    from app.idempotency import expirar_chaves
+    from app.services import payment_inbox, reconciliation, seat_holds
+    from app.services.scheduler import AgendadorViagens
+
+    async def em_sessao(funcao, *args, **kwargs):
+        async with AsyncSessionLocal() as db:
+            await funcao(db, *args, **kwargs)
+            await db.rollback()
+
+    async def aplicar_pagamentos():
+        await em_sessao(payment_inbox.aplicar_pagamentos, [("123", {
+            "external_reference": dados["manifesto"][0], "currency_id": "BRL", "status": "approved",
+            "transaction_amount": 100.0, "payment_method_id": "pix"
+        })])
+
+    return [
+        ("agendador: reconstrução do heap", AgendadorViagens()._recarregar, set()),
+        ("agendador: transições vencidas",
+         lambda: AgendadorViagens()._aplicar_transicoes([dados["viagem_manifesto"]], datetime.utcnow()), set()),
+        ("seat_holds: retenções vencidas (expirador)", lambda: em_sessao(seat_holds.expirar_retencoes), set()),
+        ("seat_holds: retenções vencidas de uma viagem (viagem cheia)",
+         lambda: em_sessao(seat_holds.expirar_retencoes, viagem_id=dados["viagem_manifesto"]), set()),
+        ("payment_notifications: reserva do lote (processador)",
+         lambda: payment_inbox.ProcessadorNotificacoes()._reservar_lote(datetime.utcnow()), set()),
+        ("payment_notifications: gravação dos pagamentos consultados", aplicar_pagamentos, CACHES),
+        ("payments: pendentes com id do gateway (reconciliação)", lambda: reconciliation.reconciliar(limite=10), set()),
+        ("idempotency_keys: chaves vencidas (expirador)", lambda: em_sessao(expirar_chaves), set()),
+    ]
+
+def plano(conn, statement, parameters):
+    # executemany: o plano é o mesmo para todas as linhas
+    if isinstance(parameters, list):
+        parameters = parameters[0] if parameters else ()
+    linhas = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", tuple(parameters or ())).fetchall()
+    return [linha[-1] for linha in linhas]
+
+def _inesperado(detalhe, esperadas, paginada):
+    varredura = VARREDURA_COMPLETA.match(detalhe)
+    if varredura:
+        return varredura.group(1) not in esperadas
+    return paginada and bool(ORDENACAO.match(detalhe))
+
+def conferir(conn, nome, comandos, esperadas, paginada):
+    """Confere o plano de cada comando registrado; retorna se a etapa passou"""
+    problemas = []
+    for statement, parameters in comandos:
+        if not EXPLICAVEL.match(statement):
+            continue
+        detalhes = plano(conn, statement, parameters)
+        if any(_inesperado(detalhe, esperadas, paginada) for detalhe in detalhes):
+            problemas.append((statement, detalhes))
+
+    print(f"[{'FALHA' if problemas else 'ok':>5}] {nome}: {len(comandos)} comando(s) SQL")
+    for statement, detalhes in problemas:
+        print(f"          {' '.join(statement.split())[:160]}")
+        for detalhe in detalhes:
+            print(f"            {detalhe}")
+    return not problemas
+
+def main():
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'plans.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    # O cadastro de clientes só precisa executar, não proteger a senha
+    os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+    import httpx
+    from app.database.database import SessionLocal, async_engine, engine
+    from app.models import models
+    from app.services.password_hashing import hasher
+    import main as app_main
+
+    dados = popular(SessionLocal, models)
+    preparar(SessionLocal, models, dados)
+
+    # Rotas e tarefas no mesmo event loop (o pool assíncrono fica preso ao loop
+    # que o criou), sem o lifespan: as tarefas de fundo não rodam sozinhas aqui
+    async def executar():
+        etapas = []
+        transport = httpx.ASGITransport(app=app_main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://planos") as client:
+            for metodo, rota, corpo, esperadas, paginada in rotas(dados):
+                with contar_comandos(async_engine.sync_engine, com_parametros=True) as comandos:
+                    resposta = await client.request(metodo, rota, json=corpo)
+                if resposta.status_code not in (200, 201):
+                    comandos = None
+                    print(f"[FALHA] {metodo} {rota}: status {resposta.status_code} {resposta.text[:200]}")
+                etapas.append((f"{metodo} {rota}", comandos, esperadas, paginada))
+        for nome, funcao, esperadas in tarefas(dados):
+            with contar_comandos(async_engine.sync_engine, com_parametros=True) as comandos:
+                await funcao()
+            etapas.append((nome, comandos, esperadas, False))
+        await hasher.parar()
+        await async_engine.dispose()
+        return etapas
+
+    falhas = 0
+    etapas = asyncio.run(executar())
+    with engine.connect() as conn:
+        for nome, comandos, esperadas, paginada in etapas:
+            falhas += comandos is None or not conferir(conn, nome, comandos, esperadas, paginada)
+    engine.dispose()
+
+    if falhas:
+        print(f"\n{falhas} etapa(s) com varredura completa de tabela ou ordenação")
+        return 1
+    print("\nTodas as consultas quentes usam índices")
+    return 0
+
+# O hash de senhas usa processos spawn, que importam este módulo: nada deve rodar fora do main
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+Teste de concorrência da ocupação de viagens: dispara centenas de associações
+de reservas em paralelo contra uma única viagem e verifica que nenhuma vaga é
+vendida além da capacidade (código de saída 1 em caso de overbooking).
+
+Em seguida retém vagas de outra viagem para reservas em checkout, cancela a
+viagem e verifica que as retenções somem, que assentos_retidos volta a zero e
+que as reservas retidas são canceladas.
+
+Usa um banco SQLite temporário, criado pelas migrações.
+
+Uso:
+    python scripts/check_seat_claims.py --reservas 300 --capacidade 50
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+import httpx
+
+# Adicionar o diretório raiz ao path para importar os módulos da aplicação
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def popular(SessionLocal, models, reservas, capacidade):
+    with SessionLocal() as db:
+        pacote = models.Pacote(
+            id=str(uuid.uuid4()), nome="Carga", descricao="Teste de concorrência",
+            tipo=models.TipoPacote.SUBORBITAL, preco=1000, disponibilidade=True
+        )
+        viagem = models.Viagem(
+            id=str(uuid.uuid4()), pacote_id=pacote.id, duracao_horas=1, capacidade=capacidade,
+            data_partida=datetime.utcnow() + timedelta(days=1)
+        )
+        db.add_all([pacote, viagem])
+        ids = []
+        for i in range(reservas):
+            cliente = models.Cliente(
+                id=str(uuid.uuid4()), nome=f"Cliente {i}", email=f"cliente{i}@carga.test",
+                senha_hash="-", data_nascimento=date(1990, 1, 1), documento_identidade=str(i),
+                telefone="0", pais="Brasil", endereco="-",
+                status_medico=models.StatusMedico.APROVADO,
+                certificacao_status=models.CertificacaoStatus.CONCLUIDA
+            )
+            reserva = models.Reserva(
+                id=str(uuid.uuid4()), cliente_id=cliente.id, package_id=pacote.id,
+                status=models.StatusReserva.PAGO, valor_original=1000, valor_imposto=0, valor_total=1000
+            )
+            db.add_all([cliente, reserva])
+            ids.append(reserva.id)
+        db.commit()
+        return viagem.id, ids
+
+def popular_retencoes(SessionLocal, models, retencoes):
+    """Viagem agendada e reservas em checkout (RESERVADO) do mesmo pacote"""
+    with SessionLocal() as db:
+        pacote = models.Pacote(
+            id=str(uuid.uuid4()), nome="Retenções", descricao="Cancelamento com retenções",
+            tipo=models.TipoPacote.SUBORBITAL, preco=1000, disponibilidade=True
+        )
+        viagem = models.Viagem(
+            id=str(uuid.uuid4()), pacote_id=pacote.id, duracao_horas=1, capacidade=retencoes + 1,
+            data_partida=datetime.utcnow() + timedelta(days=1)
+        )
+        cliente = models.Cliente(
+            id=str(uuid.uuid4()), nome="Cliente", email="checkout@carga.test",
+            senha_hash="-", data_nascimento=date(1990, 1, 1), documento_identidade="0",
+            telefone="0", pais="Brasil", endereco="-"
+        )
+        reservas = [
+            models.Reserva(
+                id=str(uuid.uuid4()), cliente_id=cliente.id, package_id=pacote.id,
+                status=models.StatusReserva.RESERVADO, valor_original=1000, valor_imposto=0, valor_total=1000
+            )
+            for _ in range(retencoes)
+        ]
+        db.add_all([pacote, viagem, cliente, *reservas])
+        db.commit()
+        return viagem.id, [reserva.id for reserva in reservas]
+
+async def reter_e_cancelar(app, viagem_id, reservas):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for reserva_id in reservas:
+            resposta = await client.post(f"/trips/{viagem_id}/holds", json={"reserva_id": reserva_id})
+            resposta.raise_for_status()
+        (await client.delete(f"/trips/{viagem_id}")).raise_for_status()
+        # Depois do cancelamento não se retém mais vaga na viagem
+        return (await client.post(f"/trips/{viagem_id}/holds", json={"reserva_id": reservas[0]})).status_code
+
+async def disparar(app, viagem_id, reservas):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def associar(reserva_id):
+            resposta = await client.post(f"/trips/{viagem_id}/bookings", json={"reserva_id": reserva_id})
+            return resposta.status_code
+
+        return await asyncio.gather(*(associar(r) for r in reservas))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reservas", type=int, default=300)
+    parser.add_argument("--capacidade", type=int, default=50)
+    args = parser.parse_args()
+
+    diretorio = tempfile.mkdtemp()
+    # A URL precisa estar definida antes de importar a aplicação
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(diretorio, 'seats.db')}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+
+    from sqlalchemy import func, select
+    from app.database.database import SessionLocal
+    from app.models import models
+    import main as app_main
+
+    viagem_id, reservas = popular(SessionLocal, models, args.reservas, args.capacidade)
+
+    inicio = time.perf_counter()
+    codigos = asyncio.run(disparar(app_main.app, viagem_id, reservas))
+    duracao = time.perf_counter() - inicio
+
+    with SessionLocal() as db:
+        ocupados = db.scalar(select(models.Viagem.assentos_ocupados).filter(models.Viagem.id == viagem_id))
+        associadas = db.scalar(
+            select(func.count()).select_from(models.viagem_reserva)
+            .filter(models.viagem_reserva.c.viagem_id == viagem_id)
+        )
+
+    respostas = Counter(codigos)
+    print(f"{args.reservas} associações concorrentes em {duracao:.2f}s ({args.reservas / duracao:.1f} req/s)")
+    print(f"respostas: {dict(sorted(respostas.items()))}")
+    print(f"capacidade={args.capacidade} assentos_ocupados={ocupados} trip_bookings={associadas}")
+
+    esperado = min(args.capacidade, args.reservas)
+    if not (respostas[200] == ocupados == associadas == esperado):
+        print("FALHA: ocupação inconsistente com a capacidade")
+        return 1
+    print("OK: nenhuma vaga vendida além da capacidade")
+
+    viagem_id, reservas = popular_retencoes(SessionLocal, models, 3)
+    nova_retencao = asyncio.run(reter_e_cancelar(app_main.app, viagem_id, reservas))
+    with SessionLocal() as db:
+        retidos = db.scalar(select(models.Viagem.assentos_retidos).filter(models.Viagem.id == viagem_id))
+        retencoes = db.scalar(
+            select(func.count()).select_from(models.RetencaoAssento)
+            .filter(models.RetencaoAssento.viagem_id == viagem_id)
+        )
+        status_reservas = Counter(db.scalars(select(models.Reserva.status).filter(models.Reserva.id.in_(reservas))))
+    print(
+        f"viagem cancelada com {len(reservas)} retenções: assentos_retidos={retidos} seat_holds={retencoes} "
+        f"reservas={ {s.value: n for s, n in status_reservas.items()} } nova retenção={nova_retencao}"
+    )
+    if retidos != 0 or retencoes != 0 or status_reservas != {models.StatusReserva.CANCELADO: len(reservas)} \
+            or nova_retencao < 400:
+        print("FALHA: retenções mantidas numa viagem cancelada")
+        return 1
+    print("OK: cancelamento libera as retenções e cancela as reservas retidas")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita as rotas da API do MercadoPago usadas pela aplicação
+(criação de preferência e consulta de pagamento), com degradação
+configurável, para testar o cliente de app/services/payment_gateway.py sem
+rede: latência, jitter, fração de respostas 5xx, gateway fora do ar (503) ou
+travado (nunca responde).
+
+Aponte a API para o stub:
+    MERCADO_PAGO_API_URL=http://127.0.0.1:8081 uvicorn main:app
+
+Rotas extras do stub:
+    POST /stub/payments   cria um pagamento consultável por GET /v1/payments/{id}
+                          (corpo: external_reference, status, transaction_amount, currency_id)
+    PUT  /stub/config     altera a degradação sem reiniciar (mesmos campos das opções)
+
+Uso:
+    python scripts/stub_payment_gateway.py --porta 8081 --latencia 2 --taxa-erro 0.3
+    python scripts/stub_payment_gateway.py --modo fora-do-ar
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import uuid
+from typing import Any, Dict
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+MODOS = ("normal", "fora-do-ar", "travado")
+
+def criar_app(latencia=0.0, jitter=0.0, taxa_erro=0.0, modo="normal"):
+    app = FastAPI(title="Stub do gateway de pagamento")
+    config = {"latencia": latencia, "jitter": jitter, "taxa_erro": taxa_erro, "modo": modo}
+    pagamentos = {}
+    sequencia = itertools.count(1000)
+
+    async def degradar():
+        """Aplica a degradação configurada; retorna uma resposta de erro ou None"""
+        if config["modo"] == "travado":
+            await asyncio.Event().wait()
+        if config["modo"] == "fora-do-ar":
+            return JSONResponse({"message": "service unavailable"}, status_code=503)
+        espera = config["latencia"] + random.uniform(0, config["jitter"])
+        if espera:
+            await asyncio.sleep(espera)
+        if random.random() < config["taxa_erro"]:
+            return JSONResponse({"message": "internal error"}, status_code=500)
+        return None
+
+    @app.post("/checkout/preferences", status_code=201)
+    async def criar_preferencia(dados: Dict[str, Any]):
+        erro = await degradar()
+        if erro is not None:
+            return erro
+        preference_id = f"stub-{uuid.uuid4()}"
+        return {
+            "id": preference_id,
+            "init_point": f"http://127.0.0.1/checkout?pref_id={preference_id}",
+            "sandbox_init_point": f"http://127.0.0.1/sandbox/checkout?pref_id={preference_id}",
+            "external_reference": dados.get("external_reference"),
+            "items": dados.get("items", []),
+        }
+
+    @app.get("/v1/payments/{payment_id}")
+    async def consultar_pagamento(payment_id: str):
+        erro = await degradar()
+        if erro is not None:
+            return erro
+        if payment_id not in pagamentos:
+            return JSONResponse({"message": "Payment not found"}, status_code=404)
+        return pagamentos[payment_id]
+
+    @app.post("/stub/payments", status_code=201)
+    async def criar_pagamento(dados: Dict[str, Any]):
+        payment_id = str(next(sequencia))
+        pagamentos[payment_id] = {
+            "id": int(payment_id),
+            "status": dados.get("status", "approved"),
+            "external_reference": dados["external_reference"],
+            "transaction_amount": dados.get("transaction_amount", 0),
+            "currency_id": dados.get("currency_id", "BRL"),
+            "payment_method_id": dados.get("payment_method_id", "pix"),
+        }
+        return pagamentos[payment_id]
+
+    @app.put("/stub/config")
+    async def alterar_config(dados: Dict[str, Any]):
+        config.update({chave: valor for chave, valor in dados.items() if chave in config})
+        return config
+
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8081)
+    parser.add_argument("--latencia", type=float, default=0.0, help="segundos somados a cada resposta")
+    parser.add_argument("--jitter", type=float, default=0.0, help="segundos aleatórios (0..jitter) somados à latência")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração das respostas com erro 500")
+    parser.add_argument("--modo", choices=MODOS, default="normal")
+    args = parser.parse_args()
+    uvicorn.run(
+        criar_app(args.latencia, args.jitter, args.taxa_erro, args.modo),
+        host="127.0.0.1", port=args.porta
+    )
@@ -3,28 +3,28 @@ import os
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 import uuid
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
 
 # Adicionar o diretório raiz ao path para importar os módulos da aplicação
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app.database.database import SessionLocal, engine, Base
+from app.database.database import SessionLocal, engine
+from app.database.migrations import aplicar_migracoes
+from app.services import password_hashing, rollups
+from app.services.seats import stmt_recontar_assentos
 from app.models.models import (
     Cliente, Pacote, Reserva, AprovacaoMedica, Certificacao, 
-    Moeda, Pagamento, Imposto, Viagem, StatusMedico, CertificacaoStatus,
+    Moeda, HistoricoCambio, Pagamento, PreferenciaPagamento, Imposto, Viagem, StatusMedico, CertificacaoStatus,
     TipoPacote, StatusReserva, StatusPagamento, StatusViagem, viagem_reserva
 )
 
-# Configuração para hash de senha
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    # Mesmo custo (BCRYPT_ROUNDS) da API; o seed roda fora dela, sem o pool
+    return password_hashing.gerar_hash(password)
 
 def seed_database():
-    # Criar todas as tabelas
-    Base.metadata.create_all(bind=engine)
+    # Criar/atualizar as tabelas (migrações versionadas)
+    aplicar_migracoes(engine)
     
     # Criar uma sessão
     db = SessionLocal()
@@ -34,11 +34,13 @@ def seed_database():
         db.execute(viagem_reserva.delete())
         db.query(Viagem).delete()
         db.query(Pagamento).delete()
+        db.query(PreferenciaPagamento).delete()
         db.query(Reserva).delete()
         db.query(AprovacaoMedica).delete()
         db.query(Certificacao).delete()
         db.query(Cliente).delete()
         db.query(Pacote).delete()
+        db.query(HistoricoCambio).delete()
         db.query(Moeda).delete()
         db.query(Imposto).delete()
         db.commit()
@@ -73,6 +75,7 @@ def seed_database():
         
         for moeda in moedas:
             db.add(moeda)
+            db.add(HistoricoCambio(moeda_id=moeda.id, taxa_cambio=moeda.taxa_cambio))
         
         db.commit()
         
@@ -513,6 +516,13 @@ def seed_database():
             data_associacao=datetime.now() - timedelta(days=100)
         ))
         
+        # Atualizar o contador de assentos ocupados das viagens
+        db.execute(stmt_recontar_assentos())
+        
+        # Recalcular os rollups dos relatórios a partir das reservas e pagamentos criados
+        db.flush()
+        rollups.reconstruir(db)
+        
         db.commit()
         
         print("Banco de dados populado com sucesso!")